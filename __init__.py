@@ -61,6 +61,7 @@ try:
         from .addon_common.common.maths import convert_numstr_num
         from .addon_common.common.blender import get_active_object
         from .retopoflow import rftool
+        from .retopoflow.rfmesh import rfmesh_snapshot, rfmesh_recovery
     options = configoptions.options
     retopoflow_version = configoptions.retopoflow_version
     import_succeeded = True
@@ -290,6 +291,26 @@ if import_succeeded:
             return {'FINISHED'}
     RF_classes += [VIEW3D_OT_RetopoFlow_Recover]
 
+    class VIEW3D_OT_RetopoFlow_RecoverTarget(Operator):
+        bl_idname = 'cgcookie.retopoflow_recover_target'
+        bl_label = 'Recover Target Edits'
+        bl_description = 'Recover edits to target mesh from RetopoFlow recovery journal'
+        bl_space_type = 'VIEW_3D'
+        bl_region_type = 'TOOLS'
+        bl_options = {'REGISTER', 'UNDO'}
+        rf_icon = 'rf_recover_icon'
+
+        @classmethod
+        def poll(cls, context):
+            return retopoflow.RetopoFlow.has_recovery()
+
+        def invoke(self, context, event):
+            if not retopoflow.RetopoFlow.recovery_recover():
+                self.report({'ERROR'}, 'Could not recover target edits')
+                return {'CANCELLED'}
+            return {'FINISHED'}
+    RF_classes += [VIEW3D_OT_RetopoFlow_RecoverTarget]
+
 
 if import_succeeded:
     '''
@@ -442,6 +463,7 @@ if import_succeeded:
             box = layout.box()
             box.label(text='Auto Save') # , icon='FILE_TICK')
             box.operator('cgcookie.retopoflow_recover', icon='RECOVER_LAST')
+            box.operator('cgcookie.retopoflow_recover_target', icon='RECOVER_LAST')
             # if retopoflow.RetopoFlow.has_backup():
             #     box.label(text=options['last auto save path'])
 
@@ -568,6 +590,10 @@ def unregister():
     VIEW3D_PT_RetopoFlow.menu_remove()
     if import_succeeded: updater.unregister()
     for cls in reversed(RF_classes): bpy.utils.unregister_class(cls)
+    if import_succeeded:
+        # stop worker threads of undo snapshots and target auto saves
+        rfmesh_snapshot.shutdown_snapshot_executor()
+        rfmesh_recovery.shutdown_backup_executor()
 
 if __name__ == "__main__":
     register()
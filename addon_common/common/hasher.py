@@ -22,6 +22,7 @@ Created by Jonathan Denning, Jonathan Williamson
 import time
 from hashlib import md5
 
+import numpy as np
 import bpy
 from bmesh.types import BMesh
 from mathutils import Vector, Matrix
@@ -64,6 +65,13 @@ class Hasher:
             if t in llt:
                 self._hasher.update(bytes(f'{llt[t]} {len(arg)}', 'utf8'))
                 self.add(*arg)
+            elif t is np.ndarray:
+                # hash raw buffer rather than stringifying (large) array
+                self._hasher.update(bytes(f'ndarray {arg.dtype.str} {arg.shape}', 'utf8'))
+                self._hasher.update(np.ascontiguousarray(arg))
+            elif t is bytes or t is bytearray or t is memoryview:
+                self._hasher.update(bytes(f'bytes {len(arg)}', 'utf8'))
+                self._hasher.update(arg)
             else:
                 self._hasher.update(bytes(str(arg), 'utf8'))
 
@@ -88,19 +96,39 @@ def hash_cycle(cycle):
     return ' '.join(str(c) for c in h)
 
 
-def hash_object(obj:bpy.types.Object):
+def _sample_indices(count, sample):
+    ''' returns indices of strided sample of at most sample items, or None if all items should be used '''
+    if not sample or count <= sample: return None
+    return np.arange(0, count, -(-count // sample))
+
+def _hash_coords(hasher, co, sample):
+    '''
+    adds Nx3 coords to hasher.  if sample is set, only a strided sample of at most sample coords is
+    hashed, along with bbox and sum of all coords so that most edits outside of sample are still caught
+    '''
+    hasher.add(len(co))
+    if not len(co): return
+    if sample and len(co) > sample:
+        hasher.add(co.min(axis=0), co.max(axis=0), co.sum(axis=0, dtype=np.float64))
+        co = co[_sample_indices(len(co), sample)]
+    hasher.add(co)
+
+def hash_object(obj:bpy.types.Object, sample=None):
+    '''
+    returns hash (str) of mesh object data, xform, and modifiers.
+    vertex coords are read in bulk and hashed as raw bytes; see _hash_coords for sample
+    '''
     if obj is None: return None
     assert type(obj) is bpy.types.Object, "Only call hash_object on mesh objects!"
     assert type(obj.data) is bpy.types.Mesh, "Only call hash_object on mesh objects!"
     # get object data to act as a hash
     me = obj.data
-    counts = (len(me.vertices), len(me.edges), len(me.polygons), len(obj.modifiers))
-    if me.vertices:
-        bbox = (tuple(min(v.co for v in me.vertices)), tuple(max(v.co for v in me.vertices)))
-    else:
-        bbox = (None, None)
-    vsum   = tuple(sum((v.co for v in me.vertices), Vector((0,0,0))))
-    xform  = tuple(e for l in obj.matrix_world for e in l)
+    hasher = Hasher()
+    hasher.add((len(me.vertices), len(me.edges), len(me.polygons), len(obj.modifiers)))
+    co = np.empty(len(me.vertices) * 3, dtype=np.float32)
+    me.vertices.foreach_get('co', co)
+    _hash_coords(hasher, co.reshape((-1, 3)), sample)
+    hasher.add(np.array(obj.matrix_world, dtype=np.float64))
     mods = []
     for mod in obj.modifiers:
         if mod.type == 'SUBSURF':
@@ -109,10 +137,14 @@ def hash_object(obj:bpy.types.Object):
             mods += [('DECIMATE', mod.ratio)]
         else:
             mods += [(mod.type)]
-    hashed = (counts, bbox, vsum, xform, hash(obj), str(mods))      # ob.name???
-    return hashed
-
-def hash_bmesh(bme:BMesh):
+    hasher.add(hash(obj), str(mods))      # ob.name???
+    return hasher.get_hash()
+
+def hash_bmesh(bme:BMesh, sample=None):
+    '''
+    returns hash (str) of bmesh counts and vertex coords.
+    if sample is set, only a strided sample of at most sample verts is read and hashed
+    '''
     if bme is None: return None
     assert type(bme) is BMesh, 'Only call hash_bmesh on BMesh objects!'
 
@@ -125,8 +157,16 @@ def hash_bmesh(bme:BMesh):
     #     [[v.index for v in f.verts] + [f.select] for f in bme.faces],
     #     )
 
-    counts = (len(bme.verts), len(bme.edges), len(bme.faces))
-    bbox   = BBox(from_bmverts=bme.verts)
-    vsum   = tuple(sum((v.co for v in bme.verts), Vector((0,0,0))))
-    hashed = (counts, tuple(bbox.min) if bbox.min else None, tuple(bbox.max) if bbox.max else None, vsum)
-    return hashed
+    nv = len(bme.verts)
+    hasher = Hasher()
+    hasher.add((nv, len(bme.edges), len(bme.faces)))
+    indices = _sample_indices(nv, sample)
+    if indices is None:
+        bmverts = bme.verts
+    else:
+        bme.verts.ensure_lookup_table()
+        bmverts = [bme.verts[i] for i in indices.tolist()]
+    # BMesh has no foreach_get, but fromiter avoids building Vectors for every vert
+    n = len(bmverts)
+    hasher.add(np.fromiter((c for bmv in bmverts for c in bmv.co), dtype=np.float64, count=n*3))
+    return hasher.get_hash()
@@ -21,8 +21,12 @@ Created by Jonathan Denning, Jonathan Williamson
 
 from math import sqrt, acos, cos, sin, floor, ceil, isinf
 import re
+import warnings
+from itertools import chain
 from typing import List
 
+import numpy as np
+
 import bgl
 from mathutils import Matrix, Vector, Quaternion
 from bmesh.types import BMVert
@@ -1518,8 +1522,31 @@ class Box2D:
 
 
 class Accel2D:
-    bin_cols = 20
-    bin_rows = 20
+    '''
+    uniform grid over the 2D (projected) positions of verts, edges, and faces, used as
+    broad phase for screen-space queries.  every element is binned into each cell that its
+    2D bounding box overlaps.
+
+    each element has an id (index into self.elems), and per-id arrays store its kind
+    (vert, edge, face), 2D position (verts only), and range of cells it is binned in.
+    bins are stored CSR-style: bin_elems[bin_offsets[c]:bin_offsets[c+1]] are the ids in
+    cell c = j * bin_cols + i.  grid resolution adapts to element count, so cells hold about
+    elems_per_bin elements on average.
+
+    insert, relocate, and remove update single elements without rebuilding.  an updated
+    element is dropped from its CSR bins (via in_base) and put into small per-cell lists
+    (extra), which are folded back into the CSR arrays once they grow large.
+
+    v2Ds (optional) are precomputed 2D positions of verts, in same order as verts.  these
+    can be a list of Point2D (None if vert cannot be projected) or an Nx2 array (NaN if
+    vert cannot be projected).  unprojectable verts, and edges / faces that only have
+    unprojectable verts, are not binned.
+    '''
+
+    elems_per_bin = 4
+    max_bins_per_axis = 512
+
+    VERT, EDGE, FACE = 0, 1, 2
 
     class SimpleVert:
         def __init__(self, co):
@@ -1552,189 +1579,303 @@ class Accel2D:
         return Accel2D(verts, edges, [], Point_to_Point2D)
 
     @profiler.function
-    def __init__(self, verts, edges, faces, Point_to_Point2D):
-        self.verts = list(verts) if verts else []
-        self.edges = list(edges) if edges else []
-        self.faces = list(faces) if faces else []
+    def __init__(self, verts, edges, faces, Point_to_Point2D, v2Ds=None):
+        verts = list(verts) if verts else []
+        edges = list(edges) if edges else []
+        faces = list(faces) if faces else []
         self.Point_to_Point2D = Point_to_Point2D
-        self.vert_type = type(self.verts[0]) if self.verts else None
-        self.edge_type = type(self.edges[0]) if self.edges else None
-        self.face_type = type(self.faces[0]) if self.faces else None
-        self.bins = {}
-
-        self.v2Ds = [Point_to_Point2D(v.co) for v in verts]
-        self.v2Ds = [p for p in self.v2Ds if p]
-        self.map_v_v2D = {v: v2d for (v, v2d) in zip(verts, self.v2Ds)}
-        if self.v2Ds:
-            self.min = Point2D((
-                min(x - 0.001 for (x, _) in self.v2Ds),
-                min(y - 0.001 for (_, y) in self.v2Ds)
-            ))
-            self.max = Point2D((
-                max(x + 0.001 for (x, _) in self.v2Ds),
-                max(y + 0.001 for (_, y) in self.v2Ds)
-            ))
+        self.vert_type = type(verts[0]) if verts else None
+        self.edge_type = type(edges[0]) if edges else None
+        self.face_type = type(faces[0]) if faces else None
+        nv, ne, nf = len(verts), len(edges), len(faces)
+        n = nv + ne + nf
+
+        self.elems = verts + edges + faces
+        self.ids = {o: i for (i, o) in enumerate(self.elems)}
+        self.count = n
+        self.kinds = np.repeat(np.array([self.VERT, self.EDGE, self.FACE], dtype=np.int8), (nv, ne, nf))
+        self.alive = np.ones(n, dtype=bool)
+
+        # 2D positions of verts (NaN for unprojectable verts and for edges / faces)
+        if v2Ds is None: v2Ds = [Point_to_Point2D(v.co) for v in verts]
+        self.xy = np.full((n, 2), np.nan)
+        if isinstance(v2Ds, np.ndarray):
+            self.xy[:nv] = np.asarray(v2Ds, dtype=np.float64).reshape((nv, 2))
+        else:
+            self.xy[:nv] = np.array([(p[0], p[1]) if p else (np.nan, np.nan) for p in v2Ds], dtype=np.float64).reshape((nv, 2))
+
+        # 2D bounding boxes of edges and faces (NaN if none of its verts are projectable)
+        ids = self.ids
+        ev = np.fromiter((ids.get(v, n) for e in edges for v in e.verts), dtype=np.int64, count=ne*2).reshape((ne, 2))
+        fcounts = np.fromiter((len(f.verts) for f in faces), dtype=np.int64, count=nf)
+        fv = np.fromiter((ids.get(v, n) for f in faces for v in f.verts), dtype=np.int64, count=int(fcounts.sum()))
+        xyn = np.vstack((self.xy, [(np.nan, np.nan)]))     # index n (unknown vert) maps to NaN
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            edge_lo, edge_hi = np.fmin(xyn[ev[:, 0]], xyn[ev[:, 1]]), np.fmax(xyn[ev[:, 0]], xyn[ev[:, 1]])
+            face_lo, face_hi = np.full((nf, 2), np.nan), np.full((nf, 2), np.nan)
+            has_verts = fcounts > 0
+            if has_verts.any():
+                starts = (np.cumsum(fcounts) - fcounts)[has_verts]
+                face_lo[has_verts] = np.fmin.reduceat(xyn[fv], starts, axis=0)
+                face_hi[has_verts] = np.fmax.reduceat(xyn[fv], starts, axis=0)
+            lo = np.vstack((self.xy[:nv], edge_lo, face_lo))
+            hi = np.vstack((self.xy[:nv], edge_hi, face_hi))
+
+        # grid extents and resolution
+        binned = ~np.isnan(lo).any(axis=1)
+        if binned.any():
+            self.min = Point2D((lo[binned].min(axis=0) - 0.001).tolist())
+            self.max = Point2D((hi[binned].max(axis=0) + 0.001).tolist())
         else:
             self.min = Point2D((0, 0))
             self.max = Point2D((1, 1))
         self.size = self.max - self.min
+        nbins = max(1, int(binned.sum()) // self.elems_per_bin)
+        aspect = self.size.x / self.size.y
+        self.bin_cols = max(1, min(self.max_bins_per_axis, int(round(sqrt(nbins * aspect)))))
+        self.bin_rows = max(1, min(self.max_bins_per_axis, int(round(nbins / self.bin_cols))))
+
+        # range of cells (i0, i1, j0, j1) each element is binned in; -1 if not binned
+        self.ranges = np.full((n, 4), -1, dtype=np.int64)
+        i0, j0 = self._compute_ijs(lo[binned])
+        i1, j1 = self._compute_ijs(hi[binned])
+        self.ranges[binned] = np.stack((i0, i1, j0, j1), axis=1)
+        self._build_bins()
 
-        # inserting verts
-        for (v, v2d) in zip(verts, self.v2Ds):
-            i, j = self.compute_ij(v2d)
-            self._put(i, j, v)
-
-        # inserting edges
-        for e in edges:
-            v0, v1 = self.map_v_v2D[e.verts[0]], self.map_v_v2D[e.verts[1]]
-            ij0, ij1 = self.compute_ij(v0), self.compute_ij(v1)
-            mini, minj = min(ij0[0], ij1[0]), min(ij0[1], ij1[1])
-            maxi, maxj = max(ij0[0], ij1[0]), max(ij0[1], ij1[1])
-            for i in range(mini, maxi + 1):
-                for j in range(minj, maxj + 1):
-                    self._put(i, j, e)
-            # v0,v1 = e.verts
-            # self._put_edge(e, self.map_v_v2D[v0], self.map_v_v2D[v1])
-
-        # inserting faces
-        for f in faces:
-            v2ds = [self.map_v_v2D[v] for v in f.verts]
-            if not v2ds:
-                continue
-            ijs = list(map(self.compute_ij, v2ds))
-            mini, minj = min(i for (i, j) in ijs), min(j for (i, j) in ijs)
-            maxi, maxj = max(i for (i, j) in ijs), max(j for (i, j) in ijs)
-            for i in range(mini, maxi + 1):
-                for j in range(minj, maxj + 1):
-                    self._put(i, j, f)
-            # v0 = v2ds[0]
-            # for v1,v2 in zip(v2ds[1:-1],v2ds[2:]):
-            #    self._put_face(f, v0, v1, v2)
+    @profiler.function
+    def _build_bins(self):
+        ''' (re)builds CSR bins from ranges of all alive elements, and clears extra '''
+        n = self.count
+        ids = np.flatnonzero(self.alive[:n] & (self.ranges[:n, 0] >= 0))
+        i0, i1, j0, j1 = self.ranges[ids].T
+        ni, nj = i1 - i0 + 1, j1 - j0 + 1
+        counts = ni * nj
+        rep = np.repeat(np.arange(len(ids)), counts)
+        k = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+        cells = (j0[rep] + k // ni[rep]) * self.bin_cols + (i0[rep] + k % ni[rep])
+        order = np.argsort(cells, kind='stable')
+        self.bin_elems = ids[rep[order]]
+        self.bin_offsets = np.zeros(self.bin_cols * self.bin_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=self.bin_cols * self.bin_rows), out=self.bin_offsets[1:])
+        self.in_base = np.zeros(len(self.alive), dtype=bool)
+        self.in_base[ids] = True
+        self.extra = {}             # cell -> [ids], for elements inserted / moved since bins were built
+        self.extra_count = 0
+
+    ##########################################################
+    # per-element updates
+
+    def _kind(self, elem):
+        t = type(elem)
+        if t is self.vert_type: return self.VERT
+        if t is self.edge_type: return self.EDGE
+        if t is self.face_type: return self.FACE
+        if hasattr(elem, 'co'): return self.VERT
+        return self.FACE if hasattr(elem, 'edges') else self.EDGE
+
+    def _new_id(self, elem, kind):
+        i = self.count
+        if i == len(self.alive):
+            grow = max(16, i)
+            self.kinds = np.concatenate((self.kinds, np.zeros(grow, dtype=np.int8)))
+            self.alive = np.concatenate((self.alive, np.zeros(grow, dtype=bool)))
+            self.in_base = np.concatenate((self.in_base, np.zeros(grow, dtype=bool)))
+            self.xy = np.vstack((self.xy, np.full((grow, 2), np.nan)))
+            self.ranges = np.vstack((self.ranges, np.full((grow, 4), -1, dtype=np.int64)))
+        self.count += 1
+        self.elems.append(elem)
+        self.ids[elem] = i
+        self.kinds[i] = kind
+        self.alive[i] = True
+        if kind == self.VERT and self.vert_type is None: self.vert_type = type(elem)
+        if kind == self.EDGE and self.edge_type is None: self.edge_type = type(elem)
+        if kind == self.FACE and self.face_type is None: self.face_type = type(elem)
+        return i
+
+    def _unbin(self, i):
+        if self.in_base[i]:
+            # stale entries in CSR bins are skipped
+            self.in_base[i] = False
+        elif self.ranges[i, 0] >= 0:
+            i0, i1, j0, j1 = self.ranges[i].tolist()
+            cols, extra = self.bin_cols, self.extra
+            for cell in (j * cols + ii for j in range(j0, j1 + 1) for ii in range(i0, i1 + 1)):
+                l = extra[cell]
+                l.remove(i)
+                if not l: del extra[cell]
+            self.extra_count -= (i1 - i0 + 1) * (j1 - j0 + 1)
+        self.ranges[i] = -1
+
+    def _bin(self, i):
+        if self.kinds[i] == self.VERT:
+            lo = hi = self.xy[i]
+        else:
+            ids = self.ids
+            vis = [ids[v] for v in self.elems[i].verts if v in ids]
+            if not vis: return
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                lo, hi = np.nanmin(self.xy[vis], axis=0), np.nanmax(self.xy[vis], axis=0)
+        if np.isnan(lo).any(): return
+        i0, j0 = self.compute_ij(lo)
+        i1, j1 = self.compute_ij(hi)
+        self.ranges[i] = (i0, i1, j0, j1)
+        cols, extra = self.bin_cols, self.extra
+        for cell in (j * cols + ii for j in range(j0, j1 + 1) for ii in range(i0, i1 + 1)):
+            extra.setdefault(cell, []).append(i)
+        self.extra_count += (i1 - i0 + 1) * (j1 - j0 + 1)
+        if self.extra_count > max(1024, len(self.bin_elems) // 2): self._build_bins()
+
+    def _set_xy(self, i, v2d):
+        if v2d is None: v2d = self.Point_to_Point2D(self.elems[i].co)
+        self.xy[i] = (v2d[0], v2d[1]) if v2d is not None else (np.nan, np.nan)
+
+    def insert(self, elem, v2d=None):
+        '''
+        adds elem (vert, edge, or face) to accel, or re-bins it if already present.
+        v2d is 2D position of vert (projected with Point_to_Point2D if not given).
+        edges and faces are binned by the positions of their verts that are in accel,
+        so insert verts before the edges and faces that use them
+        '''
+        i = self.ids.get(elem)
+        if i is None: i = self._new_id(elem, self._kind(elem))
+        else:         self._unbin(i)
+        if self.kinds[i] == self.VERT: self._set_xy(i, v2d)
+        self._bin(i)
+
+    def relocate(self, vert, v2d=None):
+        '''
+        moves vert to v2d (projected with Point_to_Point2D if not given), and re-bins the
+        edges and faces in accel that use it (found via link_edges and link_faces, if vert has them)
+        '''
+        self.insert(vert, v2d=v2d)
+        ids = self.ids
+        for o in chain(getattr(vert, 'link_edges', ()), getattr(vert, 'link_faces', ())):
+            i = ids.get(o)
+            if i is None: continue
+            self._unbin(i)
+            self._bin(i)
+
+    def remove(self, elem):
+        i = self.ids.pop(elem, None)
+        if i is None: return
+        self._unbin(i)
+        self.alive[i] = False
 
     @profiler.function
+    def clean_invalid(self):
+        n = self.count
+        valid = np.fromiter((o.is_valid for o in self.elems), dtype=bool, count=n)
+        for i in np.flatnonzero(self.alive[:n] & ~valid).tolist():
+            self.remove(self.elems[i])
+
+    ##########################################################
+    # per-kind views, aligned with each other
+
+    def _of_kind(self, kind):
+        n = self.count
+        return np.flatnonzero(self.alive[:n] & (self.kinds[:n] == kind))
+
+    @property
+    def verts(self): return [self.elems[i] for i in self._of_kind(self.VERT).tolist()]
+    @property
+    def edges(self): return [self.elems[i] for i in self._of_kind(self.EDGE).tolist()]
+    @property
+    def faces(self): return [self.elems[i] for i in self._of_kind(self.FACE).tolist()]
+
+    @property
+    def v2Ds(self):
+        ''' 2D positions of verts (None if unprojectable), aligned with verts '''
+        return [None if np.isnan(x) else Point2D((x, y)) for (x, y) in self.xy[self._of_kind(self.VERT)].tolist()]
+
+    @property
+    def map_v_v2D(self):
+        return {v: v2d for (v, v2d) in zip(self.verts, self.v2Ds) if v2d is not None}
+
+    ##########################################################
+    # queries
+
+    def _compute_ijs(self, xy):
+        ''' vectorized compute_ij for Nx2 array '''
+        (mx, my), (sx, sy) = self.min, self.size
+        i = np.clip(np.floor(self.bin_cols * (xy[:, 0] - mx) / sx), 0, self.bin_cols - 1).astype(np.int64)
+        j = np.clip(np.floor(self.bin_rows * (xy[:, 1] - my) / sy), 0, self.bin_rows - 1).astype(np.int64)
+        return (i, j)
+
     def compute_ij(self, v2d):
-        n = v2d - self.min
-        i = int(self.bin_cols * n.x / self.size.x)
-        j = int(self.bin_rows * n.y / self.size.y)
+        (x, y), (mx, my), (sx, sy) = v2d, self.min, self.size
+        i = int(self.bin_cols * (x - mx) / sx)
+        j = int(self.bin_rows * (y - my) / sy)
         i = max(0, min(self.bin_cols - 1, i))
         j = max(0, min(self.bin_rows - 1, j))
         return (i, j)
 
-    def _put(self, i, j, o):
-        t = (i, j)
-        if t not in self.bins: self.bins[t] = set()
-        self.bins[t].add(o)
+    def _gather(self, i0, i1, j0, j1):
+        ''' returns sorted, unique ids of alive elements binned in cells [i0,i1]x[j0,j1] '''
+        if i0 > i1 or j0 > j1: return np.empty(0, dtype=np.int64)
+        cols = self.bin_cols
+        rows = np.arange(j0, j1 + 1) * cols
+        starts, ends = self.bin_offsets[rows + i0], self.bin_offsets[rows + i1 + 1]
+        lengths = ends - starts
+        total = int(lengths.sum())
+        idx = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(total)
+        ids = self.bin_elems[idx]
+        ids = ids[self.in_base[ids]]
+        if self.extra:
+            ncells = (i1 - i0 + 1) * (j1 - j0 + 1)
+            if len(self.extra) < ncells:
+                more = [l for (cell, l) in self.extra.items() if i0 <= cell % cols <= i1 and j0 <= cell // cols <= j1]
+            else:
+                more = [self.extra.get(j * cols + i) for j in range(j0, j1 + 1) for i in range(i0, i1 + 1)]
+            more = [i for l in more if l for i in l]
+            if more: ids = np.concatenate((ids, np.array(more, dtype=np.int64)))
+        ids = np.unique(ids)
+        return ids[self.alive[ids]]
 
-    def _get(self, i, j):
-        t = (i, j)
-        return self.bins.get(t, set())
+    def _query(self, v2d, within):
+        (x, y) = v2d
+        i0, j0 = self.compute_ij((x - within, y - within))
+        i1, j1 = self.compute_ij((x + within, y + within))
+        return self._gather(i0, i1, j0, j1)
 
-    @profiler.function
-    def clean_invalid(self):
-        self.bins = {
-            t: {o for o in objs if o.is_valid}
-            for (t, objs) in self.bins.items()
-        }
-
-    def _put_edge(self, e, v0, v1, depth=0):
-        i0, j0 = self.compute_ij(v0)
-        i1, j1 = self.compute_ij(v1)
-        if i0 == i1 and j0 == j1:
-            self._put(i0, j0, e)
-        elif i0 == i1:
-            i = i0
-            for j in range(min(j0, j1), max(j0, j1) + 1):
-                self._put(i, j, e)
-        elif j0 == j1:
-            j = j0
-            for i in range(min(i0, i1), max(i0, i1) + 1):
-                self._put(i, j, e)
-        elif depth == 6:
-            self._put(i0, j0, e)
-            self._put(i1, j1, e)
-        else:
-            vm = v0 + (v1 - v0) / 2
-            self._put_edge(e, v0, vm, depth=depth + 1)
-            self._put_edge(e, vm, v1, depth=depth + 1)
-
-    def _put_face(self, f, v0, v1, v2, depth=0):
-        i0, j0 = self.compute_ij(v0)
-        i1, j1 = self.compute_ij(v1)
-        i2, j2 = self.compute_ij(v2)
-        if i0 == i1 and i0 == i2 and j0 == j1 and j0 == j2:
-            self._put(i0, j0, f)
-        elif i0 == i1 and j0 == j1:
-            self._put_edge(f, v0, v2, depth=depth)
-        elif i0 == i2 and j0 == j2:
-            self._put_edge(f, v0, v1, depth=depth)
-        elif i1 == i2 and j1 == j2:
-            self._put_edge(f, v1, v2, depth=depth)
-        elif depth == 6:
-            self._put(i0, j0, f)
-            self._put(i1, j1, f)
-            self._put(i2, j2, f)
-        else:
-            v01 = v0 + (v1 - v0) / 2
-            v12 = v1 + (v2 - v1) / 2
-            v20 = v2 + (v0 - v2) / 2
-            self._put_face(f, v0, v01, v20, depth=depth + 1)
-            self._put_face(f, v1, v12, v01, depth=depth + 1)
-            self._put_face(f, v2, v20, v12, depth=depth + 1)
+    def _elems(self, ids):
+        return [o for o in map(self.elems.__getitem__, ids.tolist()) if o.is_valid]
 
     @profiler.function
     def get(self, v2d, within):
-        delta = Vec2D((within, within))
-        i0, j0 = self.compute_ij(v2d - delta)
-        i1, j1 = self.compute_ij(v2d + delta)
-        l = set()
-        for i in range(i0, i1 + 1):
-            for j in range(j0, j1 + 1):
-                l |= self._get(i, j)
-        return {v for v in l if v.is_valid}
+        return self._elems(self._query(v2d, within))
 
     @profiler.function
     def get_verts(self, v2d, within):
-        vert_type = self.vert_type
-        return {g for g in self.get(v2d, within) if type(g) is vert_type}
+        ids = self._query(v2d, within)
+        return self._elems(ids[self.kinds[ids] == self.VERT])
 
     @profiler.function
     def get_edges(self, v2d, within):
-        edge_type = self.edge_type
-        return {g for g in self.get(v2d, within) if type(g) is edge_type}
+        ids = self._query(v2d, within)
+        return self._elems(ids[self.kinds[ids] == self.EDGE])
 
     @profiler.function
     def get_faces(self, v2d, within):
-        face_type = self.face_type
-        return {g for g in self.get(v2d, within) if type(g) is face_type}
+        ids = self._query(v2d, within)
+        return self._elems(ids[self.kinds[ids] == self.FACE])
 
     def nearest_vert(self, v2d):
-        Point_to_Point2D = self.Point_to_Point2D
-        vert_type = self.vert_type
-        x,y = v2d
+        ''' returns 2D position of vert nearest v2d, searching outward ring by ring '''
+        cols, rows = self.bin_cols, self.bin_rows
+        cw, ch = self.size.x / cols, self.size.y / rows
         i, j = self.compute_ij(v2d)
-        working = {(i,j)}
-        touched = set()
-        bv,bd = None,0
-        while working:
-            binij = working.pop()
-            if binij in touched: continue
-            touched.add(binij)
-            i,j = binij
-            if i < 0 or j < 0 or i >= self.bin_cols or j >= self.bin_rows: continue
-            mx,my = self.min + Vec2D((self.size.x * i / self.bin_cols, self.size.y * j / self.bin_rows))
-            Mx,My = self.min + Vec2D((self.size.x * (i+1) / self.bin_cols, self.size.y * (j+1) / self.bin_rows))
-            closest = Point2D((mid(x, mx, Mx), mid(y, my, My)))
-            d = (v2d - closest).length
-            if bv and d > bd:
-                # we have seen a vert that is closer than anything in this bin
-                continue
-            for v in self._get(i, j):
-                if type(v) is not vert_type: continue
-                d = (Point_to_Point2D(v.co) - v2d).length
-                if bv and d > bd: continue
-                bv,bd = v,d
-            working |= {(i-1,j-1), (i,j-1), (i+1,j-1), (i-1,j), (i+1,j), (i-1,j+1), (i,j+1), (i+1,j+1)}
-        return Point_to_Point2D(bv.co)
+        xy = np.array((v2d[0], v2d[1]))
+        for r in range(max(cols, rows)):
+            ids = self._gather(max(0, i - r), min(cols - 1, i + r), max(0, j - r), min(rows - 1, j + r))
+            ids = [k for k in ids[self.kinds[ids] == self.VERT].tolist() if self.elems[k].is_valid]
+            if not ids: continue
+            d = np.linalg.norm(self.xy[ids] - xy, axis=1)
+            # anything outside searched cells is farther than r cells away
+            if d.min() <= r * min(cw, ch) or r >= max(cols, rows) - 1:
+                return Point2D(self.xy[ids[int(np.argmin(d))]].tolist())
+        return None
 
     @profiler.function
     def nearest_face(self, v2d):
@@ -1742,10 +1883,16 @@ class Accel2D:
         # XXXX: ONLY FINDING FACE UNDER V2D!!! #
         ########################################
 
+        def xy(bmv):
+            k = self.ids.get(bmv)
+            if k is None: return Point_to_Point2D(bmv.co)
+            if np.isnan(self.xy[k, 0]): return None
+            return Point2D(self.xy[k].tolist())
+
         @profiler.function
         def intersect_face(bmf):
-            pts = [Point_to_Point2D(bmv.co) for bmv in bmf.verts]
-            pts = [pt for pt in pts if pt]
+            pts = [pt for pt in map(xy, bmf.verts) if pt]
+            if len(pts) < 3: return False
             pt0 = pts[0]
             for pt1, pt2 in zip(pts[1:-1], pts[2:]):
                 if intersect_point_tri(v2d, pt0, pt1, pt2):
@@ -1753,12 +1900,9 @@ class Accel2D:
             return False
 
         Point_to_Point2D = self.Point_to_Point2D
-        face_type = self.face_type
         i, j = self.compute_ij(v2d)
-        faces = [bmf for bmf in self._get(i, j) if type(bmf) is face_type]
-        for bmf in faces:
-            if not bmf.is_valid:
-                continue
+        ids = self._gather(i, i, j, j)
+        for bmf in self._elems(ids[self.kinds[ids] == self.FACE]):
             if intersect_face(bmf):
                 return bmf
         return None
@@ -119,6 +119,8 @@ class Options:
         'instrument_filename':  'RetopoFlow_instrument',
         'log_filename':         'RetopoFlow_log',
         'backup_filename':      'RetopoFlow_backup.blend',    # if working on unsaved blend file
+        'recovery_filename':    'RetopoFlow_recovery.rfj',    # if working on unsaved blend file
+        'target_backup_filename': 'RetopoFlow_backup.rfj',    # if working on unsaved blend file
         'quickstart_filename':  'RetopoFlow_quickstart',
         'profiler_filename':    'RetopoFlow_profiler.txt',
         'blender state':        'RetopoFlow_BlenderState',    # name of text block that contains data about blender state
@@ -135,6 +137,13 @@ class Options:
 
         # AUTO SAVE
         'last auto save path':  '',     # file path of last auto save (used for recover)
+        'last target auto save path': '',   # file path of last target-only auto save (used for recover)
+        'auto save mode':       'blend',    # 'blend': save copy of .blend file; 'target': save only target mesh, transform, and options to sidecar file
+        'auto save target interval': 30,    # seconds between target-only auto saves ('blend' mode uses Blender's auto save timer)
+        'auto save target compress': True,  # True: compress target-only auto save files (zlib)
+        'last recovery path':   '',     # file path of last recovery journal (used for recover target)
+        'recovery journal':     True,   # True: record target edits to recovery journal on disk (requires undo journal)
+        'recovery checkpoint interval': 200,    # number of edits recorded to recovery journal between checkpoints
 
         # STARTUP
         'check auto save':      True,   # give warning about disabled auto save at start
@@ -165,8 +174,16 @@ class Options:
 
         'undo change tool':     False,  # should undo change the selected tool?
         'undo depth':           100,    # size of undo stack
+        'undo journal':         True,   # True: undo records changes (fast, small); False: undo copies whole target
+        'undo live states':     2,      # number of undo states (nearest current) kept as live copies; rest are packed (only without background packing)
+        'undo memory':          1024,   # memory budget (MB) of undo; oldest states are dropped to stay within
+        'undo compress':        True,   # True: compress packed undo states (zlib)
+        'undo background packing': True,  # True: undo states are serialized / compressed on worker thread
 
         'async mesh loading':   True,   # True: load source meshes asynchronously
+        'unified source bvh':   True,   # True: raycast/nearest against single world-space BVH of all sources
+        'array crawl':          True,   # True: crawl source faces along plane using flat adjacency arrays; False: bmesh
+        'hash sample':          0,      # 0: hash all source vertex coords; N: hash strided sample of N coords (plus bbox and sum)
         'async image loading':  True,
 
         'select dist':          10,             # pixels away to select
@@ -176,6 +193,9 @@ class Options:
         # VISIBILITY TEST TUNING PARAMETERS
         'visible bbox factor':  0.001,          # rf_sources.visibility_preset_*
         'visible dist offset':  0.0008,         # rf_sources.visibility_preset_*
+        'visible depth buffer': True,           # True: test target visibility against CPU depth buffer of sources; False: raycast each vert
+        'incremental vis accel': True,          # True: re-bin only created / moved target geometry when target changes; False: rebuild
+        'face id buffer':       True,           # True: find target faces under cursor with CPU face-ID buffer; False: test each face
 
         # VISUALIZATION SETTINGS
         'warn non-manifold':        True,       # visualize non-manifold warnings
@@ -463,6 +483,20 @@ class Options:
         base, ext = os.path.splitext(bpy.data.filepath)
         return '%s_RetopoFlow_AutoSave%s' % (base, ext)
 
+    def get_target_auto_save_filepath(self):
+        if not getattr(bpy.data, 'filepath', ''):
+            # not working on a saved .blend file, yet!
+            return os.path.join(tempfile.gettempdir(), self['target_backup_filename'])
+        base, _ = os.path.splitext(bpy.data.filepath)
+        return '%s_RetopoFlow_AutoSave.rfj' % base
+
+    def get_recovery_filepath(self):
+        if not getattr(bpy.data, 'filepath', ''):
+            # not working on a saved .blend file, yet!
+            return os.path.join(tempfile.gettempdir(), self['recovery_filename'])
+        base, _ = os.path.splitext(bpy.data.filepath)
+        return '%s_RetopoFlow_Recovery.rfj' % base
+
 
 def ints_to_Color(r, g, b, a=255): return Color((r/255.0, g/255.0, b/255.0, a/255.0))
 class Themes:
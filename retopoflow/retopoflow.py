@@ -220,6 +220,7 @@ class RetopoFlow(
             ('Setting up visualizations',           self.setup_drawing),
             ('Setting up user interface',           self.setup_ui),                  # must be called after self.setup_target() and self.setup_rftools()!!
             ('Setting up undo system',              self.setup_undo),                # must be called after self.setup_ui()!!
+            ('Setting up recovery journal',         self.setup_recovery),            # must be called after self.setup_undo()!!
             ('Checking auto save / save',           self.check_auto_save_warnings),
             ('Loading welcome message',             self.show_welcome_message),
             ('Resuming help image preloading',      self.preload_help_resume),
@@ -298,6 +299,7 @@ class RetopoFlow(
     def end(self):
         options.clear_callbacks()
         self.blender_ui_reset()
+        self.done_recovery()
         self.undo_clear(touch=False)
         self.done_target()
         self.done_sources()
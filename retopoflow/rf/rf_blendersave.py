@@ -39,6 +39,7 @@ from ...addon_common.common.maths import BBox
 from ...addon_common.common.debug import dprint
 
 from .rf_blender import RetopoFlow_Blender
+from ..rfmesh.rfmesh_recovery import RFTargetRecovery, replay_recovery, save_target_backup
 
 
 @persistent
@@ -77,7 +78,8 @@ class RetopoFlow_BlenderSave:
     @staticmethod
     def get_auto_save_settings(context):
         prefs = get_preferences(context)
-        use_auto_save = prefs.filepaths.use_auto_save_temporary_files
+        # target-only auto save does not depend on Blender's auto save
+        use_auto_save = prefs.filepaths.use_auto_save_temporary_files or options['auto save mode'] == 'target'
         path_blend = getattr(bpy.data, 'filepath', '')
         path_autosave = options.get_auto_save_filepath()
         good_auto_save = (not options['check auto save']) or use_auto_save
@@ -124,11 +126,15 @@ class RetopoFlow_BlenderSave:
         )
 
     def handle_auto_save(self):
-        prefs = get_preferences(self.actions.context)
-        use_auto_save = prefs.filepaths.use_auto_save_temporary_files
-        auto_save_time = prefs.filepaths.auto_save_time * 60
-
-        if not use_auto_save: return    # Blender's auto save is disabled  :(
+        if options['auto save mode'] == 'target':
+            # target-only auto save is cheap, so it can run much more often.
+            # it has its own timer, so it runs even if Blender's auto save is disabled
+            auto_save_time = options['auto save target interval']
+        else:
+            prefs = get_preferences(self.actions.context)
+            use_auto_save = prefs.filepaths.use_auto_save_temporary_files
+            auto_save_time = prefs.filepaths.auto_save_time * 60
+            if not use_auto_save: return    # Blender's auto save is disabled  :(
 
         if not hasattr(self, 'time_to_save'):
             # RF just started, so do not save yet
@@ -143,11 +149,18 @@ class RetopoFlow_BlenderSave:
 
     @staticmethod
     def has_backup():
-        filepath = options['last auto save path']
+        if options['auto save mode'] == 'target':
+            filepath = options['last target auto save path']
+        else:
+            filepath = options['last auto save path']
         return filepath and os.path.exists(filepath)
 
     @staticmethod
     def backup_recover():
+        if options['auto save mode'] == 'target':
+            RetopoFlow_BlenderSave.target_backup_recover()
+            return
+
         filepath = options['last auto save path']
         if not filepath or not os.path.exists(filepath): return
 
@@ -163,6 +176,9 @@ class RetopoFlow_BlenderSave:
         if self.last_change_count == self.change_count:
             dprint('skipping backup save')
             return
+        if options['auto save mode'] == 'target':
+            self.save_backup_target()
+            return
         filepath = options.get_auto_save_filepath()
         filepath1 = "%s1" % filepath
         dprint('saving backup to %s' % filepath)
@@ -176,6 +192,140 @@ class RetopoFlow_BlenderSave:
             self._backup_broken = True
             self.alert_user(title='Could not save backup', message=f'Could not save backup file.  Temporarily preventing further backup attempts.  You might try saving file manually.\n\nFile path: `{filepath}`\n\nError message: "{e}"')
 
+    def save_backup_target(self):
+        '''
+        saves only target mesh, its transform, and RF options to a small sidecar file.  target is
+        captured here, but the file is written on a worker thread (see save_target_backup)
+        '''
+        filepath = options.get_target_auto_save_filepath()
+        pending = getattr(self, '_backup_target_pending', None)
+        if pending:
+            if not pending.done():
+                dprint('skipping backup save (still writing previous)')
+                return
+            e = pending.exception()
+            self._backup_target_pending = None
+            if e:
+                self._backup_broken = True
+                self.alert_user(title='Could not save backup', message=f'Could not save backup file.  Temporarily preventing further backup attempts.  You might try saving file manually.\n\nFile path: `{filepath}`\n\nError message: "{e}"')
+                return
+        dprint('saving target backup to %s' % filepath)
+        info = {
+            'object':       self.tar_object.name,
+            'matrix_world': [list(row) for row in self.tar_object.matrix_world],
+            'options':      { key: options[key] for key in options.keys() },
+            'blend':        getattr(bpy.data, 'filepath', ''),
+            'time':         datetime.now().isoformat(),
+            'version':      retopoflow_version,
+        }
+        self._backup_target_pending = save_target_backup(filepath, info, self.rftarget.bme, compress=options['auto save target compress'])
+        options['last target auto save path'] = filepath
+        self.last_change_count = self.change_count
+
+    @staticmethod
+    def target_backup_recover():
+        ''' writes last target-only auto save into its target object, restoring transform and RF options '''
+        info, obj = RetopoFlow_BlenderSave._recover_target(options['last target auto save path'])
+        if not obj: return None
+        obj.matrix_world = Matrix(info['matrix_world'])
+        for (key, val) in info['options'].items():
+            # do not clobber paths of auto save / recovery files
+            if key not in options.default_options or key.startswith('last '): continue
+            options[key] = val
+        return obj.name
+
+    @staticmethod
+    def _custom_data_names(obj):
+        '''
+        returns names of mesh data of obj that recovery / target auto save files do not hold (UVs,
+        vertex groups, shape keys, attributes, etc.), and so would be lost by recovering
+        '''
+        me = obj.data
+        names = [uv_layer.name for uv_layer in me.uv_layers]
+        names += [vertex_color.name for vertex_color in getattr(me, 'vertex_colors', [])]
+        names += [vertex_group.name for vertex_group in obj.vertex_groups]
+        if me.shape_keys: names += [key_block.name for key_block in me.shape_keys.key_blocks]
+        # attributes that files do hold (names starting with '.' are internal)
+        builtin = {'position', 'material_index', 'sharp_face', 'sharp_edge'}
+        names += [
+            attribute.name
+            for attribute in getattr(me, 'attributes', [])
+            if not attribute.name.startswith('.') and attribute.name not in builtin and attribute.name not in names
+        ]
+        return names
+
+    @staticmethod
+    def _recover_target(filepath):
+        '''
+        replays recovery / target auto save file into its target object.  returns (info, obj), or
+        (None, None) if could not recover.  files hold only geometry, so recovering into an
+        object with custom mesh data (see _custom_data_names) is refused rather than losing it
+        '''
+        info, bme = replay_recovery(filepath)
+        if not bme: return (None, None)
+        obj = bpy.data.objects.get(info['object'])
+        if not obj or obj.type != 'MESH':
+            bme.free()
+            return (None, None)
+        custom = RetopoFlow_BlenderSave._custom_data_names(obj)
+        if custom:
+            print('RetopoFlow: not recovering target %s, as recovering would lose its mesh data: %s' % (obj.name, ', '.join(custom)))
+            bme.free()
+            return (None, None)
+        if bpy.context.mode != 'OBJECT': bpy.ops.object.mode_set(mode='OBJECT')
+        print('recover target:', obj.name, info.get('time'))
+        bme.to_mesh(obj.data)
+        obj.data.update()
+        bme.free()
+        return (info, obj)
+
+    #########################################
+    # recovery journal (see rfmesh_recovery.py)
+
+    def setup_recovery(self):
+        self.rftarget_recovery = None
+        if not options['recovery journal'] or not self.undo_journaled: return
+        filepath = options.get_recovery_filepath()
+        info = {
+            'object':   self.tar_object.name,
+            'blend':    getattr(bpy.data, 'filepath', ''),
+            'time':     datetime.now().isoformat(),
+            'version':  retopoflow_version,
+        }
+        self.rftarget_recovery = RFTargetRecovery(filepath, info)
+        self.rftarget_recovery.checkpoint(self._get_undo_journal())
+        options['last recovery path'] = filepath
+
+    def done_recovery(self):
+        if not getattr(self, 'rftarget_recovery', None): return
+        self.rftarget_recovery.done()
+        self.rftarget_recovery = None
+
+    def recovery_record(self, journal, entry):
+        ''' called when entry is done recording (see RetopoFlow_Undo._create_state) '''
+        if not getattr(self, 'rftarget_recovery', None): return
+        self.rftarget_recovery.record(journal, entry)
+
+    def recovery_checkpoint(self):
+        if not getattr(self, 'rftarget_recovery', None): return
+        self.rftarget_recovery.checkpoint(self._get_undo_journal())
+
+    def recovery_stale(self):
+        ''' target no longer matches recovery journal; checkpoint on next record '''
+        if not getattr(self, 'rftarget_recovery', None): return
+        self.rftarget_recovery.mark_stale()
+
+    @staticmethod
+    def has_recovery():
+        filepath = options['last recovery path']
+        return filepath and os.path.exists(filepath)
+
+    @staticmethod
+    def recovery_recover():
+        ''' replays last recovery journal into its target object.  returns name of object, or None if could not recover '''
+        _, obj = RetopoFlow_BlenderSave._recover_target(options['last recovery path'])
+        return obj.name if obj else None
+
     def save_normal(self):
         self.blender_ui_reset()
         try:
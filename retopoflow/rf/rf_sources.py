@@ -21,6 +21,9 @@ Created by Jonathan Denning, Jonathan Williamson
 
 import bpy
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 
 from ...config.options import visualization, options
 from ...addon_common.common.maths import BBox
@@ -30,9 +33,16 @@ from ...addon_common.common.maths import Point, Vec, Direction, Normal, Ray, XFo
 from ...addon_common.common.maths import Point2D, Accel2D
 
 from ..rfmesh.rfmesh import RFSource
+from ..rfmesh.rfmesh_arrays import matrix_to_array, transform_points, plane_intersection_segments
+from ..rfmesh.rfmesh_sources import RFSourcesBVH, RFSourcesDepthBuffer
 from ..rfmesh.rfmesh_render import RFMeshRender
 
 
+# symmetry plane sections of sources (see RetopoFlow_Sources.get_symmetry_sections).
+# kept at module level, so sections survive between RetopoFlow sessions if sources do not change
+symmetry_sections_cache = {}
+
+
 class RetopoFlow_Sources:
     '''
     functions to work on all source meshes (RFSource)
@@ -53,10 +63,15 @@ class RetopoFlow_Sources:
         print('  done!')
         self._detected_bad_normals = False
         self._warned_bad_normals = False
+        self._sources_bvh = None
+        self._sources_depthbuffer = None
+        self._sources_depthbuffer_key = None
 
     def done_sources(self):
         for rfs in self.rfsources:
             rfs.obj.to_mesh_clear()
+        del self._sources_bvh
+        del self._sources_depthbuffer
         del self.sources_bbox
         del self.rfsources_draw
         del self.rfsources
@@ -64,14 +79,12 @@ class RetopoFlow_Sources:
     @profiler.function
     def setup_sources_symmetry(self):
         xyplane,xzplane,yzplane = self.rftarget.get_xy_plane(),self.rftarget.get_xz_plane(),self.rftarget.get_yz_plane()
-        w2l_point = self.rftarget.w2l_point
-        rfsources_xyplanes = [e for rfs in self.rfsources for e in rfs.plane_intersection(xyplane)]
-        rfsources_xzplanes = [e for rfs in self.rfsources for e in rfs.plane_intersection(xzplane)]
-        rfsources_yzplanes = [e for rfs in self.rfsources for e in rfs.plane_intersection(yzplane)]
-
-        def gen_accel(edges, Point_to_Point2D):
-            nonlocal w2l_point
-            edges = [(w2l_point(v0), w2l_point(v1)) for (v0, v1) in edges]
+        imx = matrix_to_array(self.rftarget.xform.imx_p)
+        rfsources_xyplanes, rfsources_xzplanes, rfsources_yzplanes = self.get_symmetry_sections([xyplane, xzplane, yzplane])
+
+        def gen_accel(segments, Point_to_Point2D):
+            segments = transform_points(imx, segments.reshape((-1, 3))).reshape((-1, 2, 3))
+            edges = [(Point(p0), Point(p1)) for (p0, p1) in segments.tolist()]
             return Accel2D.simple_edges(edges, Point_to_Point2D)
 
         self.rftarget.set_symmetry_accel(
@@ -80,6 +93,34 @@ class RetopoFlow_Sources:
             gen_accel(rfsources_yzplanes, lambda p:Point2D((p.y,p.z))),
         )
 
+    @profiler.function
+    def get_symmetry_sections(self, planes):
+        '''
+        returns, for each plane, Kx2x3 array of segments (world) where sources intersect plane.
+        sections are cached per source (keyed by hash_object of source) and plane, so they
+        are only computed for sources that changed.  missing sections are computed concurrently
+        '''
+        cache = symmetry_sections_cache
+        key = lambda rfs, plane: (rfs.hash, tuple(plane.o), tuple(plane.n))
+        todo = {
+            key(rfs, plane): (rfs, plane)
+            for rfs in self.rfsources for plane in planes
+            if key(rfs, plane) not in cache
+        }
+        if todo:
+            # gather inputs (arrays mirrors) here, so that workers only ever see numpy arrays
+            inputs = { k: rfs.plane_intersection_inputs(plane) for (k, (rfs, plane)) in todo.items() }
+            with ThreadPoolExecutor() as executor:
+                futures = { k: executor.submit(plane_intersection_segments, *args) for (k, args) in inputs.items() }
+            for (k, future) in futures.items(): cache[k] = future.result()
+        # only keep sections of current sources
+        current = { rfs.hash for rfs in self.rfsources }
+        for k in [k for k in cache if k[0] not in current]: del cache[k]
+        return [
+            np.concatenate([cache[key(rfs, plane)] for rfs in self.rfsources] + [np.empty((0, 2, 3))])
+            for plane in planes
+        ]
+
     ###################################################
     # snap settings
 
@@ -97,10 +138,29 @@ class RetopoFlow_Sources:
         n = rfsource.get_obj_name()
         return self.snap_sources.get(n, True)
 
+    def get_snappable_rfsources(self):
+        return [rfsource for rfsource in self.rfsources if self.get_rfsource_snap(rfsource)]
+
+    @profiler.function
+    def get_sources_bvh(self):
+        '''
+        returns single world-space BVH over all snappable sources (see RFSourcesBVH),
+        or None if disabled or not worthwhile (fewer than two snappable sources).
+        built on first query rather than in setup_sources, so it costs nothing until used
+        '''
+        if not options['unified source bvh']: return None
+        rfsources = self.get_snappable_rfsources()
+        if len(rfsources) < 2: return None
+        if not self._sources_bvh or self._sources_bvh.rfsources != rfsources:
+            self._sources_bvh = RFSourcesBVH(rfsources)
+        return self._sources_bvh
+
     ###################################################
     # ray casting functions
 
     def raycast_sources_Ray(self, ray:Ray):
+        bvh = self.get_sources_bvh()
+        if bvh: return bvh.raycast(ray)[:4]
         bp,bn,bi,bd = None,None,None,None
         for rfsource in self.rfsources:
             if not self.get_rfsource_snap(rfsource): continue
@@ -120,6 +180,46 @@ class RetopoFlow_Sources:
         if xy is None: return None,None,None,None
         return self.raycast_sources_Ray_all(self.Point2D_to_Ray(xy))
 
+    @profiler.function
+    def raycast_sources_Rays(self, origins, directions, max_dist=float('inf')):
+        '''
+        batched version of raycast_sources_Ray.  origins and directions are Nx3 numpy arrays.
+        each source is cast against all rays in one pass.
+        returns (points, normals, indices, dists) as numpy arrays (see RFMesh.raycast_batch)
+        '''
+        bvh = self.get_sources_bvh()
+        if bvh: return bvh.raycast_batch(origins, directions, max_dist=max_dist)
+        n = len(origins)
+        bp = np.full((n, 3), np.nan)
+        bn = np.full((n, 3), np.nan)
+        bi = np.full(n, -1, dtype=np.int64)
+        bd = np.full(n, np.inf)
+        for rfsource in self.rfsources:
+            if not self.get_rfsource_snap(rfsource): continue
+            hp,hn,hi,hd = rfsource.raycast_batch(origins, directions, max_dist=max_dist)
+            closer = hd < bd
+            bp[closer], bn[closer], bi[closer], bd[closer] = hp[closer], hn[closer], hi[closer], hd[closer]
+        return (bp,bn,bi,bd)
+
+    def raycast_sources_Point2Ds(self, xys):
+        '''
+        batched version of raycast_sources_Point2D.  xys is Nx2 numpy array or list of Point2D;
+        None entries are treated as misses
+        '''
+        if isinstance(xys, np.ndarray):
+            xy, valid = xys, np.ones(len(xys), dtype=bool)
+        else:
+            valid = np.fromiter((xy is not None for xy in xys), dtype=bool, count=len(xys))
+            xy = np.array([(xy.x, xy.y) if xy is not None else (0.0, 0.0) for xy in xys], dtype=np.float64).reshape((-1, 2))
+        origins, directions = self.Point2Ds_to_Rays(xy[valid])
+        n = len(xy)
+        bp = np.full((n, 3), np.nan)
+        bn = np.full((n, 3), np.nan)
+        bi = np.full(n, -1, dtype=np.int64)
+        bd = np.full(n, np.inf)
+        bp[valid], bn[valid], bi[valid], bd[valid] = self.raycast_sources_Rays(origins, directions)
+        return (bp,bn,bi,bd)
+
     def raycast_sources_mouse(self):
         return self.raycast_sources_Point2D(self.actions.mouse)
 
@@ -133,6 +233,8 @@ class RetopoFlow_Sources:
     # nearest surface point (snapping) functions
 
     def nearest_sources_Point(self, point:Point, max_dist=float('inf')): #sys.float_info.max):
+        bvh = self.get_sources_bvh()
+        if bvh: return bvh.nearest(point, max_dist=max_dist)[:4]
         bp,bn,bi,bd = None,None,None,None
         for rfsource in self.rfsources:
             if not self.get_rfsource_snap(rfsource): continue
@@ -142,16 +244,42 @@ class RetopoFlow_Sources:
         return (bp,bn,bi,bd)
 
 
+    @profiler.function
+    def nearest_sources_Points(self, points, max_dist=float('inf')):
+        '''
+        batched version of nearest_sources_Point.  points is Nx3 numpy array.
+        each source is queried for all points in one pass.
+        returns (points, normals, indices, dists) as numpy arrays (see RFMesh.nearest_batch)
+        '''
+        bvh = self.get_sources_bvh()
+        if bvh: return bvh.nearest_batch(points, max_dist=max_dist)
+        n = len(points)
+        bp = np.full((n, 3), np.nan)
+        bn = np.full((n, 3), np.nan)
+        bi = np.full(n, -1, dtype=np.int64)
+        bd = np.full(n, np.inf)
+        for rfsource in self.rfsources:
+            if not self.get_rfsource_snap(rfsource): continue
+            hp,hn,hi,hd = rfsource.nearest_batch(points, max_dist=max_dist)
+            closer = hd < bd
+            bp[closer], bn[closer], bi[closer], bd[closer] = hp[closer], hn[closer], hi[closer], hd[closer]
+        return (bp,bn,bi,bd)
+
+
     ###################################################
     # plane intersection
 
     def plane_intersection_crawl(self, ray:Ray, plane:Plane, walk_to_plane=False):
-        bp,bn,bi,bd,bo = None,None,None,None,None
-        for rfsource in self.rfsources:
-            if not self.get_rfsource_snap(rfsource): continue
-            hp,hn,hi,hd = rfsource.raycast(ray)
-            if bp is None or (hp is not None and hd < bd):
-                bp,bn,bi,bd,bo = hp,hn,hi,hd,rfsource
+        bvh = self.get_sources_bvh()
+        if bvh:
+            bp,bn,bi,bd,bo = bvh.raycast(ray)
+        else:
+            bp,bn,bi,bd,bo = None,None,None,None,None
+            for rfsource in self.rfsources:
+                if not self.get_rfsource_snap(rfsource): continue
+                hp,hn,hi,hd = rfsource.raycast(ray)
+                if bp is None or (hp is not None and hd < bd):
+                    bp,bn,bi,bd,bo = hp,hn,hi,hd,rfsource
         if not bo: return []
         return bo.plane_intersection_crawl(ray, plane, walk_to_plane=walk_to_plane)
 
@@ -174,8 +302,41 @@ class RetopoFlow_Sources:
         ray = self.Point_to_Ray(point, max_dist_offset=-max_dist_offset)
         if not ray: return False
         if normal and normal.dot(ray.d) >= 0: return False
+        bvh = self.get_sources_bvh()
+        if bvh: return not bvh.raycast_hit(ray)
         return not any(rfsource.raycast_hit(ray) for rfsource in self.rfsources if self.get_rfsource_snap(rfsource))
 
+    @profiler.function
+    def get_sources_depthbuffer(self):
+        '''
+        returns depth buffer of snappable sources for current view (see RFSourcesDepthBuffer).
+        buffer is rasterized once per view (and set of snappable sources)
+        '''
+        rfsources = self.get_snappable_rfsources()
+        key = (self.get_view_key(), rfsources)
+        if not self._sources_depthbuffer or self._sources_depthbuffer_key != key:
+            r3d, region = self.actions.r3d, self.actions.region
+            self._sources_depthbuffer = RFSourcesDepthBuffer(
+                rfsources,
+                r3d.view_matrix, r3d.perspective_matrix, r3d.is_perspective,
+                region.width, region.height,
+            )
+            self._sources_depthbuffer_key = key
+        return self._sources_depthbuffer
+
+    @profiler.function
+    def are_visible(self, points, bbox_factor_override=None, dist_offset_override=None):
+        '''
+        batched version of is_visible (without normal test) using depth buffer of sources.
+        points is Nx3 numpy array; returns N bool numpy array
+        '''
+        if not len(points): return np.zeros(0, dtype=bool)
+        bbox_factor = options['visible bbox factor'] if bbox_factor_override is None else bbox_factor_override
+        dist_offset = options['visible dist offset'] if dist_offset_override is None else dist_offset_override
+        max_dist_offset = self.sources_bbox.get_min_dimension() * bbox_factor + dist_offset
+        _, dist, _ = self.Points_to_Point2Ds(points)
+        return self.get_sources_depthbuffer().visible(points, dist, max_dist_offset)
+
     def visibility_preset_normal(self):
         options['visible bbox factor'] = 0.001
         options['visible dist offset'] = 0.0008
@@ -20,6 +20,7 @@ Created by Jonathan Denning, Jonathan Williamson
 '''
 
 import bpy
+import numpy as np
 
 from mathutils import Matrix, Vector
 from bpy_extras.view3d_utils import location_3d_to_region_2d, region_2d_to_vector_3d
@@ -34,6 +35,8 @@ from ...addon_common.common.maths import Ray, XForm, Plane
 from ...addon_common.common.maths import Point2D, Vec2D, Direction2D
 from ...addon_common.common.decorators import blender_version_wrapper
 
+from ..rfmesh.rfmesh_arrays import matrix_to_array
+
 
 class RetopoFlow_Spaces:
     '''
@@ -86,6 +89,72 @@ class RetopoFlow_Spaces:
         if xy is None: return None
         return Point2D(xy)
 
+    @profiler.function
+    def Points_to_Point2Ds(self, co):
+        '''
+        batched version of Point_to_Point2D and Point_to_depth.
+        co is Nx3 numpy array of world points.
+        returns (xy, depth, valid), where xy is Nx2 region coords, depth is distance of
+        each point from view origin, and valid is False where Point_to_Point2D returns None
+        '''
+        region, r3d = self.actions.region, self.actions.r3d
+        n = len(co)
+        if not n:
+            return (np.empty((0, 2)), np.empty(0), np.empty(0, dtype=bool))
+        persp = matrix_to_array(r3d.perspective_matrix)
+        co4 = np.hstack((co, np.ones((n, 1))))
+        prj = co4 @ persp.T
+        w = prj[:, 3]
+        valid = w > 0
+        ndc = prj[:, :2] / np.where(valid, w, 1)[:, None]
+        hw, hh = region.width / 2, region.height / 2
+        xy = np.empty((n, 2))
+        xy[:, 0] = hw + hw * ndc[:, 0]
+        xy[:, 1] = hh + hh * ndc[:, 1]
+        # see region_2d_to_origin_3d
+        if r3d.is_perspective:
+            origin = np.array(r3d.view_matrix.inverted().translation)
+            depth = np.linalg.norm(co - origin, axis=1)
+        else:
+            origins,_ = self.Point2Ds_to_Rays(xy)
+            depth = np.linalg.norm(co - origins, axis=1)
+        return (xy, depth, valid)
+
+    def Point2Ds_to_Rays(self, xy):
+        '''
+        batched version of Point2D_to_Origin and Point2D_to_Direction.
+        xy is Nx2 numpy array of region coords.
+        returns (origins, directions) as Nx3 numpy arrays (see bpy_extras.view3d_utils)
+        '''
+        region, r3d = self.actions.region, self.actions.r3d
+        xy = np.asarray(xy, dtype=np.float64).reshape((-1, 2))
+        n = len(xy)
+        viewinv = matrix_to_array(r3d.view_matrix.inverted())
+        persinv = matrix_to_array(r3d.perspective_matrix.inverted())
+        ndc = np.empty((n, 4))
+        ndc[:, 0] = 2.0 * xy[:, 0] / region.width - 1.0
+        ndc[:, 1] = 2.0 * xy[:, 1] / region.height - 1.0
+        if r3d.is_perspective:
+            ndc[:, 2] = -0.5
+            ndc[:, 3] = 1.0
+            prj = ndc @ persinv.T
+            origins = np.repeat(viewinv[None, :3, 3], n, axis=0)
+            directions = prj[:, :3] / prj[:, 3:4] - origins
+        else:
+            ndc[:, 2] = 0.0
+            ndc[:, 3] = 1.0
+            origins = (ndc @ persinv.T)[:, :3]
+            if r3d.view_perspective != 'CAMERA':
+                origins -= persinv[:3, 2]
+            directions = np.repeat(-viewinv[None, :3, 2], n, axis=0)
+        l = np.linalg.norm(directions, axis=1)
+        l[l == 0] = 1
+        return (origins, directions / l[:, None])
+
+    def get_view_key(self):
+        ''' view version plus region size, which also affects projection '''
+        return (self.get_view_version(), self.actions.region.width, self.actions.region.height)
+
     alerted_small_clip_start = False
     def Point_to_depth(self, xyz):
         '''
@@ -398,7 +398,7 @@ class RetopoFlow_States(CookieCutter):
     @CookieCutter.FSM_State('rotate selected', 'can enter')
     @profiler.function
     def rotate_selected_canenter(self):
-        if not self.get_selected_verts(): return False
+        if not self.any_verts_selected(): return False
 
     @CookieCutter.FSM_State('rotate selected', 'enter')
     def rotate_selected_enter(self):
@@ -435,14 +435,15 @@ class RetopoFlow_States(CookieCutter):
         dx,dy = opts['rotate_x'].dot(delta),opts['rotate_y'].dot(delta)
         theta = math.atan2(dy, dx)
 
-        set2D_vert = self.set2D_vert
+        bmverts,nxys = [],[]
         for bmv,xy in opts['bmverts']:
             if not bmv.is_valid: continue
             dxy = xy - opts['center']
             nx = dxy.x * math.cos(theta) - dxy.y * math.sin(theta)
             ny = dxy.x * math.sin(theta) + dxy.y * math.cos(theta)
-            nxy = Point2D((nx, ny)) + opts['center']
-            set2D_vert(bmv, nxy)
+            bmverts.append(bmv)
+            nxys.append(Point2D((nx, ny)) + opts['center'])
+        self.set2D_verts(bmverts, nxys)
         self.update_verts_faces(v for v,_ in opts['bmverts'])
         self.dirty()
 
@@ -456,7 +457,7 @@ class RetopoFlow_States(CookieCutter):
     @CookieCutter.FSM_State('scale selected', 'can enter')
     @profiler.function
     def scale_selected_canenter(self):
-        if not self.get_selected_verts(): return False
+        if not self.any_verts_selected(): return False
 
     @CookieCutter.FSM_State('scale selected', 'enter')
     def scale_selected_enter(self):
@@ -490,12 +491,13 @@ class RetopoFlow_States(CookieCutter):
 
         dist = (self.actions.mouse - opts['center']).length
 
-        set2D_vert = self.set2D_vert
+        bmverts,nxys = [],[]
         for bmv,xy in opts['bmverts']:
             if not bmv.is_valid: continue
             dxy = xy - opts['center']
-            nxy = dxy * dist / opts['start_dist'] + opts['center']
-            set2D_vert(bmv, nxy)
+            bmverts.append(bmv)
+            nxys.append(dxy * dist / opts['start_dist'] + opts['center'])
+        self.set2D_verts(bmverts, nxys)
         self.update_verts_faces(v for v,_ in opts['bmverts'])
         self.dirty()
 
@@ -21,6 +21,8 @@ Created by Jonathan Denning, Jonathan Williamson
 
 import time
 from itertools import chain
+
+import numpy as np
 from mathutils import Vector
 
 import bpy
@@ -35,6 +37,8 @@ from ...addon_common.common.maths import Point2D, Vec2D, Direction2D, Accel2D
 
 from ..rfmesh.rfmesh import RFMesh, RFVert, RFEdge, RFFace
 from ..rfmesh.rfmesh import RFSource, RFTarget
+from ..rfmesh.rfmesh_arrays import RFMeshProjection
+from ..rfmesh.rfmesh_raster import RFMeshFaceBuffer
 from ..rfmesh.rfmesh_render import RFMeshRender
 
 
@@ -61,8 +65,12 @@ class RetopoFlow_Target:
         self.accel_vis_edges = None
         self.accel_vis_faces = None
         self.accel_vis_accel = None
+        self._accel_rftarget = None
         self._last_visible_bbox_factor = None
         self._last_visible_dist_offset = None
+        self._target_projection = None
+        self._target_facebuffer = None
+        self._target_facebuffer_key = None
 
     def hide_target(self):
         self.rftarget.obj_viewport_hide()
@@ -89,15 +97,18 @@ class RetopoFlow_Target:
         target_version = self.get_target_version(selection=False)
         view_version = self.get_view_version()
 
-        recompute = self.accel_recompute
-        recompute |= self.accel_target_version != target_version
-        recompute |= self.accel_view_version != view_version
-        recompute |= self.accel_vis_verts is None
-        recompute |= self.accel_vis_edges is None
-        recompute |= self.accel_vis_faces is None
-        recompute |= self.accel_vis_accel is None
-        recompute |= options['visible bbox factor'] != self._last_visible_bbox_factor
-        recompute |= options['visible dist offset'] != self._last_visible_dist_offset
+        # changes that require rebuilding from scratch
+        full = self.accel_recompute
+        full |= self.accel_view_version != view_version
+        full |= self.accel_vis_verts is None
+        full |= self.accel_vis_edges is None
+        full |= self.accel_vis_faces is None
+        full |= self.accel_vis_accel is None
+        full |= options['visible bbox factor'] != self._last_visible_bbox_factor
+        full |= options['visible dist offset'] != self._last_visible_dist_offset
+        full |= self._accel_rftarget is not self.rftarget
+
+        recompute = full or self.accel_target_version != target_version
         recompute &= not self.accel_defer_recomputing
         recompute &= not self._nav and (time.time() - self._nav_time) > 0.25
 
@@ -105,14 +116,10 @@ class RetopoFlow_Target:
 
         if force or recompute:
             # print('RECOMPUTE VIS ACCEL')
+            if force or full or not options['incremental vis accel'] or not self._update_vis_accel():
+                self._rebuild_vis_accel()
             self.accel_target_version = target_version
             self.accel_view_version = view_version
-            self.accel_vis_verts = self.visible_verts()
-            self.accel_vis_edges = self.visible_edges(verts=self.accel_vis_verts)
-            self.accel_vis_faces = self.visible_faces(verts=self.accel_vis_verts)
-            self.accel_vis_accel = Accel2D(self.accel_vis_verts, self.accel_vis_edges, self.accel_vis_faces, self.get_point2D)
-            self._last_visible_bbox_factor = options['visible bbox factor']
-            self._last_visible_dist_offset = options['visible dist offset']
         else:
             self.accel_vis_verts = { bmv for bmv in self.accel_vis_verts if bmv.is_valid } if self.accel_vis_verts is not None else None
             self.accel_vis_edges = { bme for bme in self.accel_vis_edges if bme.is_valid } if self.accel_vis_edges is not None else None
@@ -120,6 +127,70 @@ class RetopoFlow_Target:
 
         return self.accel_vis_accel
 
+    @profiler.function
+    def _rebuild_vis_accel(self):
+        self.accel_vis_verts = self.visible_verts()
+        self.accel_vis_edges = self.visible_edges(verts=self.accel_vis_verts)
+        self.accel_vis_faces = self.visible_faces(verts=self.accel_vis_verts)
+        vis_verts = list(self.accel_vis_verts)
+        self.accel_vis_accel = Accel2D(vis_verts, self.accel_vis_edges, self.accel_vis_faces, self.get_point2D, v2Ds=self.Verts_to_xys(vis_verts))
+        self._last_visible_bbox_factor = options['visible bbox factor']
+        self._last_visible_dist_offset = options['visible dist offset']
+        # start tracking changes for _update_vis_accel
+        self._accel_rftarget = self.rftarget
+        self.rftarget.track_changes()
+
+    @profiler.function
+    def _update_vis_accel(self):
+        '''
+        updates visible geometry and accel for only the target elements that were created or
+        moved since last update (see RFMesh.pop_changes), inserting / re-binning / removing
+        them in place.  returns False if too much has changed (or changes are not tracked),
+        in which case a full rebuild should be done instead.
+        '''
+        changes = self.rftarget.pop_changes()
+        if changes is None: return False
+        bmvs, bmes, bmfs, removed = changes
+        if len(bmvs) > max(100, len(self.accel_vis_verts) // 4): return False
+        for bmv in bmvs:
+            bmes.update(bmv.link_edges)
+            bmfs.update(bmv.link_faces)
+        cv = { RFVert(bmv) for bmv in bmvs }
+        ce = { RFEdge(bme) for bme in bmes if bme.is_valid }
+        cf = { RFFace(bmf) for bmf in bmfs if bmf.is_valid }
+
+        vis_verts, vis_edges, vis_faces = self.accel_vis_verts, self.accel_vis_edges, self.accel_vis_faces
+        if removed:
+            # removed elements no longer hash as before, so sets are rebuilt rather than deleted from
+            vis_verts = { bmv for bmv in vis_verts if bmv.is_valid }
+            vis_edges = { bme for bme in vis_edges if bme.is_valid }
+            vis_faces = { bmf for bmf in vis_faces if bmf.is_valid }
+
+        # recompute visibility of changed elements
+        are_visible = self.are_visible if options['visible depth buffer'] else None
+        vis_cv = self.rftarget.visible_verts(self.is_visible, are_visible=are_visible, verts=cv)
+        vis_verts -= cv
+        vis_verts |= vis_cv
+        vis_ce = self.rftarget.visible_edges(self.is_visible, verts=vis_verts, edges=ce)
+        vis_edges -= ce
+        vis_edges |= vis_ce
+        vis_cf = self.rftarget.visible_faces(self.is_visible, verts=vis_verts, faces=cf)
+        vis_faces -= cf
+        vis_faces |= vis_cf
+        self.accel_vis_verts, self.accel_vis_edges, self.accel_vis_faces = vis_verts, vis_edges, vis_faces
+
+        # re-bin changed elements (verts first, as edges and faces are binned by their verts)
+        # note: projecting directly, as target projection would be rebuilt for the changed target
+        accel = self.accel_vis_accel
+        Point_to_Point2D = self.Point_to_Point2D
+        for v in cv:
+            if v in vis_cv: accel.insert(v, Point_to_Point2D(v.co))
+            else:           accel.remove(v)
+        for g, vis_g in chain(((e, vis_ce) for e in ce), ((f, vis_cf) for f in cf)):
+            if g in vis_g: accel.insert(g)
+            else:          accel.remove(g)
+        return True
+
     @profiler.function
     def accel_nearest2D_vert(self, point=None, max_dist=None, vis_accel=None, selected_only=None):
         xy = self.get_point2D(point or self.actions.mouse)
@@ -135,7 +206,7 @@ class RetopoFlow_Target:
         if selected_only is not None:
             verts = { bmv for bmv in verts if bmv.select == selected_only }
 
-        return self.rftarget.nearest2D_bmvert_Point2D(xy, self.Point_to_Point2D, verts=verts, max_dist=max_dist)
+        return self.rftarget.nearest2D_bmvert_Point2D(xy, self.Point_to_Point2D, verts=verts, max_dist=max_dist, projection=self.get_target_projection())
 
     @profiler.function
     def accel_nearest2D_edge(self, point=None, max_dist=None, vis_accel=None, selected_only=None):
@@ -152,7 +223,7 @@ class RetopoFlow_Target:
         if selected_only is not None:
             edges = { bme for bme in edges if bme.select == selected_only }
 
-        return self.rftarget.nearest2D_bmedge_Point2D(xy, self.Point_to_Point2D, edges=edges, max_dist=max_dist)
+        return self.rftarget.nearest2D_bmedge_Point2D(xy, self.Point_to_Point2D, edges=edges, max_dist=max_dist, projection=self.get_target_projection())
 
     @profiler.function
     def accel_nearest2D_face(self, point=None, max_dist=None, vis_accel=None, selected_only=None):
@@ -166,12 +237,107 @@ class RetopoFlow_Target:
             max_dist = self.drawing.scale(max_dist)
             faces = vis_accel.get_faces(xy, max_dist)
 
+        if options['face id buffer']:
+            # single pixel lookup; only front-most visible face under xy is considered.
+            # face must still be among faces within max_dist, same as below
+            facebuffer = self.get_target_facebuffer()
+            i = facebuffer.face_at(xy.x, xy.y)
+            if i < 0: return (None, None)
+            bmf = facebuffer.arrays.bmfaces[i]
+            if not bmf.is_valid: return (None, None)
+            face = RFFace(bmf)
+            if face not in faces: return (None, None)
+            if selected_only is not None and bmf.select != selected_only: return (None, None)
+            return (face, 0)
+
         if selected_only is not None:
             faces = { bmf for bmf in faces if bmf.select == selected_only }
 
         return self.rftarget.nearest2D_bmface_Point2D(self.Vec_forward(), xy, self.Point_to_Point2D, faces=faces) #, max_dist=max_dist)
 
 
+    #########################################
+    # screen space projection of target verts
+
+    @profiler.function
+    def get_target_projection(self):
+        '''
+        returns projection of all target verts into screen space (RFMeshProjection),
+        computed in one batch and shared until either the view or the target topology changes.
+        when only verts moved, just their rows are reprojected
+        '''
+        arrays = self.rftarget.get_arrays()
+        view_key = self.get_view_key()
+        proj = self._target_projection
+        if proj and proj.is_current(arrays, view_key) and proj.serial != arrays.serial:
+            indices = arrays.moved_since(proj.serial)
+            if indices is None:
+                proj = None
+            else:
+                proj.update_verts(indices, *self.Points_to_Point2Ds(arrays.co_world[indices]))
+        if not proj or not proj.is_current(arrays, view_key):
+            xy, depth, valid = self.Points_to_Point2Ds(arrays.co_world)
+            proj = RFMeshProjection(arrays, view_key, xy, depth, valid)
+            self._target_projection = proj
+        return proj
+
+    @profiler.function
+    def Verts_to_Point2Ds(self, verts):
+        '''
+        same as [Point_to_Point2D(v.co) for v in verts], but reads from target projection.
+        verts that are new or have moved since projection was computed are projected individually
+        '''
+        verts = list(verts)
+        proj = self.get_target_projection()
+        Point_to_Point2D, get_Point2D = self.Point_to_Point2D, proj.Point2D
+        return [
+            get_Point2D(i) if i >= 0 else Point_to_Point2D(v.co)
+            for (v, i) in zip(verts, proj.fresh_indices(verts))
+        ]
+
+    @profiler.function
+    def Verts_to_xys(self, verts):
+        '''
+        same as Verts_to_Point2Ds, but returns Nx2 array with NaN for verts that cannot be projected
+        '''
+        verts = list(verts)
+        proj = self.get_target_projection()
+        indices = proj.fresh_indices(verts)
+        xys = np.full((len(verts), 2), np.nan)
+        known = indices >= 0
+        xys[known] = np.where(proj.valid[indices[known], None], proj.xy[indices[known]], np.nan)
+        Point_to_Point2D = self.Point_to_Point2D
+        for k in np.flatnonzero(~known).tolist():
+            p = Point_to_Point2D(verts[k].co)
+            if p: xys[k] = (p.x, p.y)
+        return xys
+
+    def Vert_to_Point2D(self, vert):
+        return self.Verts_to_Point2Ds([vert])[0]
+
+    #########################################
+    # face-ID buffer of visible target faces
+
+    @profiler.function
+    def get_target_facebuffer(self):
+        '''
+        returns face-ID buffer of visible target faces for current view (see RFMeshFaceBuffer).
+        buffer is rasterized once per view and update of visible geometry (see get_vis_accel),
+        so, like the visibility accel, it is not updated while accel recomputing is deferred
+        '''
+        key = (self.get_view_key(), self.accel_target_version, self.accel_view_version)
+        if not self._target_facebuffer or self._target_facebuffer_key != key:
+            r3d, region = self.actions.r3d, self.actions.region
+            arrays = self.rftarget.get_arrays()
+            faces = self.accel_vis_faces if self.accel_vis_faces is not None else self.visible_faces()
+            self._target_facebuffer = RFMeshFaceBuffer(
+                arrays, arrays.face_indices(faces),
+                r3d.view_matrix, r3d.perspective_matrix, r3d.is_perspective,
+                region.width, region.height,
+            )
+            self._target_facebuffer_key = key
+        return self._target_facebuffer
+
     #########################################
     # find target entities in screen space
 
@@ -183,25 +349,25 @@ class RetopoFlow_Target:
     def nearest2D_vert(self, point=None, max_dist=None, verts=None):
         xy = self.get_point2D(point or self.actions.mouse)
         if max_dist: max_dist = self.drawing.scale(max_dist)
-        return self.rftarget.nearest2D_bmvert_Point2D(xy, self.Point_to_Point2D, verts=verts, max_dist=max_dist)
+        return self.rftarget.nearest2D_bmvert_Point2D(xy, self.Point_to_Point2D, verts=verts, max_dist=max_dist, projection=self.get_target_projection())
 
     @profiler.function
     def nearest2D_verts(self, point=None, max_dist:float=10, verts=None):
         xy = self.get_point2D(point or self.actions.mouse)
         max_dist = self.drawing.scale(max_dist)
-        return self.rftarget.nearest2D_bmverts_Point2D(xy, max_dist, self.Point_to_Point2D, verts=verts)
+        return self.rftarget.nearest2D_bmverts_Point2D(xy, max_dist, self.Point_to_Point2D, verts=verts, projection=self.get_target_projection())
 
     @profiler.function
     def nearest2D_edge(self, point=None, max_dist=None, edges=None):
         xy = self.get_point2D(point or self.actions.mouse)
         if max_dist: max_dist = self.drawing.scale(max_dist)
-        return self.rftarget.nearest2D_bmedge_Point2D(xy, self.Point_to_Point2D, edges=edges, max_dist=max_dist)
+        return self.rftarget.nearest2D_bmedge_Point2D(xy, self.Point_to_Point2D, edges=edges, max_dist=max_dist, projection=self.get_target_projection())
 
     @profiler.function
     def nearest2D_edges(self, point=None, max_dist:float=10, edges=None):
         xy = self.get_point2D(point or self.actions.mouse)
         if max_dist: max_dist = self.drawing.scale(max_dist)
-        return self.rftarget.nearest2D_bmedges_Point2D(xy, max_dist, self.Point_to_Point2D, edges=edges)
+        return self.rftarget.nearest2D_bmedges_Point2D(xy, max_dist, self.Point_to_Point2D, edges=edges, projection=self.get_target_projection())
 
     # TODO: implement max_dist
     @profiler.function
@@ -210,11 +376,22 @@ class RetopoFlow_Target:
         if max_dist: max_dist = self.drawing.scale(max_dist)
         return self.rftarget.nearest2D_bmface_Point2D(self.Vec_forward(), xy, self.Point_to_Point2D, faces=faces)
 
-    # TODO: fix this function! Izzza broken
     @profiler.function
     def nearest2D_faces(self, point=None, max_dist:float=10, faces=None):
+        '''
+        returns list of (face, 0) for faces under point.
+        if faces is not given and face id buffer is enabled, these are the visible faces under
+        the brush window of radius max_dist (just the face under point if max_dist is 0 or
+        None), read from the buffer.  otherwise, these are all faces (of faces) containing point
+        '''
         xy = self.get_point2D(point or self.actions.mouse)
         if max_dist: max_dist = self.drawing.scale(max_dist)
+        if faces is None and options['face id buffer']:
+            if not self.get_vis_accel(): return []
+            facebuffer = self.get_target_facebuffer()
+            bmfaces = facebuffer.arrays.bmfaces
+            indices = facebuffer.faces_within(xy.x, xy.y, max_dist or 0)
+            return [(RFFace(bmfaces[i]), 0) for i in indices.tolist() if bmfaces[i].is_valid]
         return self.rftarget.nearest2D_bmfaces_Point2D(xy, self.Point_to_Point2D, faces=faces)
 
     ####################
@@ -274,7 +451,8 @@ class RetopoFlow_Target:
 
     @profiler.function
     def visible_verts(self):
-        return self.rftarget.visible_verts(self.is_visible)
+        are_visible = self.are_visible if options['visible depth buffer'] else None
+        return self.rftarget.visible_verts(self.is_visible, are_visible=are_visible)
 
     @profiler.function
     def visible_edges(self, verts=None):
@@ -297,7 +475,7 @@ class RetopoFlow_Target:
 
     def apply_symmetry(self):
         self.undo_push('applying symmetry')
-        self.rftarget.apply_symmetry(self.nearest_sources_Point)
+        self.rftarget.apply_symmetry(self.nearest_sources_Points)
 
     @profiler.function
     def clip_pointloop(self, pointloop, connected):
@@ -393,11 +571,11 @@ class RetopoFlow_Target:
 
     def snap_all_verts(self):
         self.undo_push('snap all verts')
-        self.rftarget.snap_all_verts(self.nearest_sources_Point)
+        self.rftarget.snap_all_verts(self.nearest_sources_Points)
 
     def snap_selected_verts(self):
         self.undo_push('snap selected verts')
-        self.rftarget.snap_selected_verts(self.nearest_sources_Point)
+        self.rftarget.snap_selected_verts(self.nearest_sources_Points)
 
     def remove_all_doubles(self):
         self.undo_push('remove all doubles')
@@ -422,6 +600,10 @@ class RetopoFlow_Target:
         vert.co = xyz
         vert.normal = norm
 
+    def snap_verts(self, verts):
+        ''' batched version of snap_vert '''
+        self.rftarget.snap_verts(verts, self.nearest_sources_Points)
+
     def snap2D_vert(self, vert:RFVert):
         xy = self.Point_to_Point2D(vert.co)
         xyz,norm,_,_ = self.raycast_sources_Point2D(xy)
@@ -446,6 +628,22 @@ class RetopoFlow_Target:
         vert.normal = norm
         return xyz
 
+    @profiler.function
+    def set2D_verts(self, verts, xys, snap_to_symmetry=None):
+        '''
+        batched version of set2D_vert, casting all rays at once.
+        snap_to_symmetry, if given, is a list with an entry for each vert
+        '''
+        verts = list(verts)
+        points,normals,indices,_ = self.raycast_sources_Point2Ds(list(xys))
+        for k,vert in enumerate(verts):
+            if not vert or indices[k] < 0: continue
+            xyz = Point(points[k])
+            if snap_to_symmetry and snap_to_symmetry[k]:
+                xyz = self.snap_to_symmetry(xyz, snap_to_symmetry[k])
+            vert.co = xyz
+            vert.normal = Normal(normals[k])
+
     def set2D_crawl_vert(self, vert:RFVert, xy:Point2D):
         hits = self.raycast_sources_Point2D_all(xy)
         if not hits: return
@@ -563,6 +761,12 @@ class RetopoFlow_Target:
     def any_selected(self):
         return self.rftarget.any_selected()
 
+    def get_selection_center(self):
+        return self.rftarget.get_selection_center()
+
+    def get_selection_counts(self):
+        return self.rftarget.get_selection_counts()
+
     def none_selected(self):
         return not self.any_selected()
 
@@ -21,17 +21,42 @@ Created by Jonathan Denning, Jonathan Williamson, and Patrick Moore
 
 import copy
 
+from ..rfmesh.rfmesh_journal import RFMeshJournal
+from ..rfmesh.rfmesh_snapshot import RFTargetSnapshot
 from ...config.options import options
 from ...addon_common.common.blender import tag_redraw_all
 
+
 class RetopoFlow_Undo:
+    '''
+    undo stack of states, where a state is the action, selected tool, grease marks, and either
+    - an RFTargetSnapshot of rftarget (snapshot mode), or
+    - RFMeshJournalEntrys (journal mode, options['undo journal']) recording changes made to
+      rftarget from the state until the next state (see rfmesh_journal.py)
+
+    in journal mode, undo reverts the entries of top state and moves them to the redo stack, and
+    redo replays them.  changes made after undo / redo without an undo_push are recorded in a loose
+    entry, which is reverted ("settled") before the next undo, redo, or cancel so the stacks stay
+    valid, or is appended to the entries of top state on the next undo_push.
+
+    in snapshot mode, states are captured packed (see rfmesh_snapshot.py), with serialization and
+    compression done on a worker thread (options['undo background packing']) so undo_push only
+    copies the mesh buffers.  restoring a state waits for its packing to finish.  with
+    background packing off, states are captured as live copies, and only the states nearest the
+    current state are kept live.  in either mode, the oldest states are dropped when the stacks
+    use more than options['undo memory'] MB.
+    '''
+
     def setup_undo(self):
         self.change_count = 0
+        self.undo_journaled = options['undo journal']
+        self.undo_journal = None
         self.undo_clear()
 
     def undo_clear(self, touch=True):
         self.undo = []
         self.redo = []
+        if self.undo_journal: self.undo_journal.entry = None
         if not touch:
             # touching undo stack to work around weird bug
             # to reproduce:
@@ -42,18 +67,123 @@ class RetopoFlow_Undo:
             self.undo_push('initial')
             self.undo_cancel()
 
+    def _get_undo_journal(self):
+        journal = self.undo_journal
+        if journal is None or journal.rftarget is not self.rftarget:
+            # entries of another target are meaningless
+            if journal: journal.detach()
+            journal = self.undo_journal = RFMeshJournal(self.rftarget)
+            self.undo.clear()
+            self.redo.clear()
+        return journal
+
+    def _undo_journal_intact(self, journal, entry):
+        if journal.is_intact(entry): return True
+        print(f'RetopoFlow: changes were made that the undo journal did not record ({entry.action})')
+        print(f'RetopoFlow: clearing undo history')
+        self.undo.clear()
+        self.redo.clear()
+        journal.entry = None
+        return False
+
+    def _undo_loose_entry(self, journal):
+        ''' returns entry recording changes made after undo / redo without undo_push, if any '''
+        entry = journal.entry
+        if entry is None: return None
+        if self.undo and self.undo[-1]['entries'][-1] is entry: return None
+        return entry
+
+    def _undo_settle(self):
+        '''
+        reverts loose entry, so rftarget is in the state the top states of undo and redo stacks
+        expect.  returns False if history was lost
+        '''
+        journal = self._get_undo_journal()
+        entry = self._undo_loose_entry(journal)
+        if entry is None: return True
+        if not self._undo_journal_intact(journal, entry): return False
+        journal.revert(entry)
+        return True
+
+    def _undo_revert_top(self):
+        '''
+        reverts entry of top state of undo stack, returning state (None if history was lost).
+        caller pops state
+        '''
+        if not self._undo_settle(): return None
+        if not self.undo: return None
+        journal = self.undo_journal
+        state = self.undo[-1]
+        entries = state['entries']
+        if journal.entry is entries[-1] and not self._undo_journal_intact(journal, entries[-1]): return None
+        for entry in reversed(entries): journal.revert(entry)
+        return state
+
+    def _undo_top_recorded(self):
+        '''
+        returns True if reverting top state of undo stack reverts changes that the recovery
+        journal has already recorded (only the open entry is not yet recorded)
+        '''
+        return self.undo[-1]['entries'] != [self._get_undo_journal().entry]
+
     def _create_state(self, action):
-        return {
+        state = {
             'action':       action,
             'tool':         self.rftool,
-            'rftarget':     copy.deepcopy(self.rftarget),
             'grease_marks': copy.deepcopy(self.grease_marks),
             }
+        if self.undo_journaled:
+            journal = self._get_undo_journal()
+            if journal.entry is not None and self._undo_journal_intact(journal, journal.entry):
+                loose = self._undo_loose_entry(journal)
+                if loose and not loose.is_empty() and self.undo:
+                    self.undo[-1]['entries'].append(loose)
+            self.recovery_record(journal, journal.entry)
+            state['entries'] = [journal.open(action)]
+        else:
+            background = options['undo background packing']
+            state['snapshot'] = RFTargetSnapshot(
+                self.rftarget, live=not background,
+                compress=options['undo compress'], background=background,
+            )
+        return state
+
+    @staticmethod
+    def _state_nbytes(state):
+        if 'snapshot' in state: return state['snapshot'].nbytes
+        return sum(entry.nbytes for entry in state['entries'])
+
+    def _undo_compact(self):
+        ''' packs all but the states nearest current state, and drops oldest states to fit memory budget '''
+        if not self.undo_journaled:
+            undo, redo = self.undo[::-1], self.redo[::-1]
+            nearest = [
+                state
+                for i in range(max(len(undo), len(redo)))
+                for state in undo[i:i+1] + redo[i:i+1]
+            ]
+            for state in nearest[options['undo live states']:]:
+                state['snapshot'].pack(background=options['undo background packing'])
+        budget = options['undo memory'] * 1024 * 1024
+        nbytes = sum(map(self._state_nbytes, self.undo + self.redo))
+        while nbytes > budget and len(self.undo) > 1:
+            nbytes -= self._state_nbytes(self.undo.pop(0))
+        while nbytes > budget and self.redo:
+            nbytes -= self._state_nbytes(self.redo.pop(0))
+
     def _restore_state(self, state, set_tool=True):
-        self.rftarget = state['rftarget']
-        self.rftarget.rewrap()
-        self.rftarget.dirty()
-        self.rftarget_draw.replace_rfmesh(self.rftarget)
+        if self.undo_journaled:
+            # journal has already put rftarget into state, but may have swapped rftarget for a snapshot
+            rftarget = self.undo_journal.rftarget
+            if rftarget is not self.rftarget:
+                self.rftarget = rftarget
+                self.rftarget.rewrap()
+                self.rftarget_draw.replace_rfmesh(self.rftarget)
+        else:
+            self.rftarget = state['snapshot'].restore(consume=True)
+            self.rftarget.rewrap()
+            self.rftarget.dirty()
+            self.rftarget_draw.replace_rfmesh(self.rftarget)
         self.grease_marks = state['grease_marks']
         if set_tool:
             self.select_rftool(state['tool']) #, forceUpdate=True, changeTool=options['undo change tool'])
@@ -65,33 +195,82 @@ class RetopoFlow_Undo:
         self.undo.append(self._create_state(action))
         while len(self.undo) > options['undo depth']: self.undo.pop(0)     # limit stack size
         self.redo.clear()
+        self._undo_compact()
         self.instrument_write(action)
         self.change_count += 1
 
     def undo_repush(self, action):
         if not self.undo: return
-        self._restore_state(self.undo.pop(), set_tool=False)
+        if self.undo_journaled:
+            recorded = self._undo_top_recorded()
+            state = self._undo_revert_top()
+            if not state: return
+            self.undo.pop()
+            if recorded: self.recovery_stale()
+            self._restore_state(state, set_tool=False)
+        else:
+            self._restore_state(self.undo.pop(), set_tool=False)
         self.undo.append(self._create_state(action))
         self.redo.clear()
+        self._undo_compact()
         self.change_count += 1
 
     def undo_pop(self):
         if not self.undo: return
-        self.redo.append(self._create_state('undo'))
-        self._restore_state(self.undo.pop())
+        if self.undo_journaled:
+            state = self._undo_revert_top()
+            if not state: return
+            self.undo.pop()
+            self.redo.append({
+                'action':       'undo',
+                'tool':         self.rftool,
+                'grease_marks': copy.deepcopy(self.grease_marks),
+                'entries':      state['entries'],
+            })
+            self._restore_state(state)
+            self.undo_journal.open('undo')
+            self.recovery_checkpoint()
+        else:
+            self.redo.append(self._create_state('undo'))
+            self._restore_state(self.undo.pop())
+        self._undo_compact()
         self.instrument_write('undo')
         self.change_count += 1
 
     def undo_cancel(self):
         if not self.undo: return
-        self._restore_state(self.undo.pop())
+        if self.undo_journaled:
+            recorded = self._undo_top_recorded()
+            state = self._undo_revert_top()
+            if not state: return
+            self.undo.pop()
+            self._restore_state(state)
+            self.undo_journal.open('cancel')
+            if recorded: self.recovery_stale()
+        else:
+            self._restore_state(self.undo.pop())
         self.instrument_write('cancel (undo)')
         self.change_count += 1
 
     def redo_pop(self):
         if not self.redo: return
-        self.undo.append(self._create_state('redo'))
-        self._restore_state(self.redo.pop())
+        if self.undo_journaled:
+            if not self._undo_settle() or not self.redo: return
+            state = self.redo.pop()
+            for entry in state['entries']: self.undo_journal.replay(entry)
+            self.undo.append({
+                'action':       'redo',
+                'tool':         self.rftool,
+                'grease_marks': copy.deepcopy(self.grease_marks),
+                'entries':      state['entries'],
+            })
+            self._restore_state(state)
+            self.undo_journal.open('redo')
+            self.recovery_checkpoint()
+        else:
+            self.undo.append(self._create_state('redo'))
+            self._restore_state(self.redo.pop())
+        self._undo_compact()
         self.instrument_write('redo')
         self.change_count += 1
 
@@ -26,6 +26,7 @@ from dataclasses import dataclass, field
 
 import bpy
 import bmesh
+import numpy as np
 from bmesh.types import BMVert, BMEdge, BMFace
 from bmesh.ops import (
     bisect_plane, holes_fill,
@@ -41,6 +42,7 @@ from ...addon_common.common.blender import ModifierWrapper_Mirror
 from ...addon_common.common.maths import Point, Normal, Direction
 from ...addon_common.common.maths import Point2D
 from ...addon_common.common.maths import Ray, XForm, BBox, Plane
+from ...addon_common.common.maths import zero_threshold
 from ...addon_common.common.hasher import hash_object, Hasher
 from ...addon_common.common.utils import min_index, UniqueCounter, iter_pairs, accumulate_last
 from ...addon_common.common.decorators import stats_wrapper, blender_version_wrapper
@@ -52,6 +54,12 @@ from ...config.options import options
 from .rfmesh_wrapper import (
     BMElemWrapper, RFVert, RFEdge, RFFace, RFEdgeSequence
 )
+from .rfmesh_arrays import RFMeshArrays, plane_intersection_segments, matrix_to_array, transform_points, transform_normals, csr_gather, foreach_get_array
+from .rfmesh_grid import RFMeshVertGrid
+from .rfmesh_selection import RFMeshSelection
+
+
+elem_kinds = { BMVert: 0, BMEdge: 1, BMFace: 2 }
 
 
 class RFMesh():
@@ -94,11 +102,7 @@ class RFMesh():
         selection=True, keepeme=False
     ):
         # checking for NaNs
-        hasnan = any(
-            math.isnan(v)
-            for emv in obj.data.vertices
-            for v in emv.co
-        )
+        hasnan = np.isnan(foreach_get_array(obj.data.vertices, 'co', np.float32, width=3)).any()
         if hasnan:
             print('Mesh data contains NaN in vertex coordinate!')
             print('Cleaning mesh')
@@ -112,9 +116,21 @@ class RFMesh():
         self.obj = obj
         self.xform = XForm(self.obj.matrix_world)
         # print('hashing object')
-        self.hash = hash_object(self.obj)
+        self.hash = hash_object(self.obj, sample=options['hash sample'])
         self._version = None
         self._version_selection = None
+        self.arrays = None
+        self.arrays_version = None
+        self.arrays_version_selection = None
+        self._arrays_moved = set()      # BMVerts moved since arrays were last updated (see get_arrays)
+        self._arrays_topology = False   # True if topology changed since arrays were built
+        self.vert_grid = None
+        self._moved_verts = set()
+        self._created = None            # (BMVerts, BMEdges, BMFaces) created since last pop_changes, or None if not tracking
+        self._removed = False           # True if any element was removed since last pop_changes
+        self._selection_index = None
+        self._wrapper_pool = {}         # BMElem -> RFVert/RFEdge/RFFace (see rfmesh_wrapper.py)
+        self._journal = None            # undo journal (see rfmesh_journal.py), only ever set on RFTarget
 
         if bme is not None:
             self.bme = bme
@@ -126,13 +142,12 @@ class RFMesh():
                 # print('copying selection')
                 with profiler.code('copying selection'):
                     self.bme.select_mode = {'FACE', 'EDGE', 'VERT'}
-                    # copy selection from editmesh
-                    for bmf, emf in zip(self.bme.faces, self.obj.data.polygons):
-                        bmf.select = emf.select
-                    for bme, eme in zip(self.bme.edges, self.obj.data.edges):
-                        bme.select = eme.select
-                    for bmv, emv in zip(self.bme.verts, self.obj.data.vertices):
-                        bmv.select = emv.select
+                    # copy selection from editmesh (read in bulk, as per-item access of bpy data is slow)
+                    me = self.obj.data
+                    for bmelems, emelems in [(self.bme.faces, me.polygons), (self.bme.edges, me.edges), (self.bme.verts, me.vertices)]:
+                        sel = foreach_get_array(emelems, 'select', bool).tolist()
+                        for bmelem, s in zip(bmelems, sel):
+                            bmelem.select = s
             else:
                 self.deselect_all()
 
@@ -172,8 +187,20 @@ class RFMesh():
         if not selectionOnly:
             if hasattr(self, 'bvh'): del self.bvh
             self._version = UniqueCounter.next()
+            self._purge_wrapper_pool()
         self._version_selection = UniqueCounter.next()
 
+    def _purge_wrapper_pool(self):
+        '''
+        drops wrappers of elements removed without going through _elem_removing (ex: bmesh.ops).
+        removed elements no longer hash as before, so pool is rebuilt rather than deleted from
+        '''
+        pool = self._wrapper_pool
+        bme = self.bme
+        if len(pool) <= 2 * (len(bme.verts) + len(bme.edges) + len(bme.faces)) + 1024: return
+        self._wrapper_pool = { bmelem:wrapper for (bmelem, wrapper) in pool.items() if bmelem.is_valid }
+        if BMElemWrapper._pool is pool: BMElemWrapper._pool = self._wrapper_pool
+
     def clean(self):
         pass
 
@@ -207,6 +234,169 @@ class RFMesh():
             self.kdt_version = ver
         return self.kdt
 
+    @profiler.function
+    def get_arrays(self):
+        '''
+        returns structure-of-arrays mirror of bmesh (see rfmesh_arrays.py).
+        geometry is rebuilt when topology changes (see _elem_created, _elem_removing,
+        _face_flipping, _journal_untracked); when only verts moved (see vert_moved), just
+        their rows are updated in place.  flags are refreshed when only selection changes
+        '''
+        ver = self.get_version(selection=False)
+        arrays = self.arrays
+        if arrays is None or self._arrays_topology or arrays.is_stale():
+            arrays = self.arrays = RFMeshArrays(self)
+            self.arrays_version = ver
+            self.arrays_version_selection = self._version_selection
+            self._arrays_moved = set()
+            self._arrays_topology = False
+            return arrays
+        if self.arrays_version != ver:
+            if arrays.xform is not self.xform: arrays.update_xform()
+            self.arrays_version = ver
+        if self._arrays_moved:
+            arrays.update_verts(self._arrays_moved)
+            self._arrays_moved = set()
+        if self.arrays_version_selection != self._version_selection:
+            arrays.update_selection()
+            self.arrays_version_selection = self._version_selection
+        return arrays
+
+    def get_current_arrays(self):
+        '''
+        returns arrays mirror if it is in sync with bmesh or can be brought in sync without
+        rebuilding it (only verts moved or selection changed), otherwise None
+        '''
+        if self.arrays is None or self._arrays_topology or self.arrays.is_stale(): return None
+        return self.get_arrays()
+
+    @profiler.function
+    def get_vert_grid(self, dist):
+        '''
+        returns spatial grid of verts (see rfmesh_grid.py) suitable for queries of radius dist.
+        grid is updated incrementally as verts move, so it is only rebuilt if the cell size
+        does not suit dist or if the grid has gotten out of sync with the bmesh
+        '''
+        grid = self.vert_grid
+        if grid is not None and grid.xform is not self.xform: grid = None
+        if grid is not None and not grid.fits(dist): grid = None
+        if grid is not None and len(grid) != len(self.bme.verts): grid = None
+        if grid is None:
+            grid = RFMeshVertGrid(self, dist)
+            self.vert_grid = grid
+        return grid
+
+    def vert_moved(self, bmv):
+        ''' called whenever a vert is moved or created (see RFVert.co setter) '''
+        if self.vert_grid is not None: self.vert_grid.move(bmv)
+        if self._selection_index is not None: self._selection_index.moved(bmv)
+        if self.arrays is not None: self._arrays_moved.add(bmv)
+        self._moved_verts.add(bmv)
+
+    def pop_moved_verts(self):
+        ''' returns set of BMVerts moved or created (see vert_moved) since last call '''
+        moved, self._moved_verts = self._moved_verts, set()
+        return moved
+
+    def track_changes(self):
+        '''
+        starts (or restarts) tracking elements that change; see pop_changes().  changes are
+        collected as they are made (see _elem_created, _elem_removing, and vert_moved), so
+        tracking costs nothing per edit beyond the changed elements themselves
+        '''
+        self._moved_verts = set()
+        self._created = (set(), set(), set())
+        self._removed = False
+
+    @profiler.function
+    def pop_changes(self):
+        '''
+        returns (verts, edges, faces, removed), where verts, edges, faces are sets of BMElems
+        that were created or (verts only) moved since last call to track_changes() or
+        pop_changes(), and removed is True if any element was removed.  removed elements are
+        not reported; they are simply no longer valid.  returns None if not tracking, or if
+        changes were made that could not be tracked (see _journal_untracked)
+        '''
+        if self._created is None: return None
+        cv, ce, cf = self._created
+        removed = self._removed
+        self._created = (set(), set(), set())
+        self._removed = False
+        moved = { bmv for bmv in self.pop_moved_verts() if bmv.is_valid }
+        return (moved | cv, ce, cf, removed)
+
+    def get_selection_index(self):
+        ''' returns index of selected BMElems (see rfmesh_selection.py), rebuilt if selection was changed directly '''
+        index = self._selection_index
+        if index is None or index.version != self._version_selection:
+            index = RFMeshSelection(self.bme, self._version_selection, self.xform)
+            self._selection_index = index
+        return index
+
+    def _selection_update(self, bmelem):
+        ''' called whenever select of bmelem is set (see RFMesh.select and RFVert.select setter) '''
+        if self._selection_index is not None: self._selection_index.update(bmelem)
+
+    def _elem_created(self, bmelem):
+        ''' called after bmelem is created (see RFTarget.new_vert, etc.) '''
+        if self._journal is not None: self._journal.created(bmelem)
+        self._arrays_topology = True
+        if self._created is not None: self._created[elem_kinds[type(bmelem)]].add(bmelem)
+
+    def _elem_removing(self, bmelem):
+        '''
+        called before bmelem is removed from bmesh, to drop references to bmelem (and to
+        elems removed along with it) from selection index, wrapper pool, vert grid, and tracked
+        changes.
+        note: references are dropped while bmelem is still valid, as BMElems no longer hash
+        as before once removed
+        '''
+        if self._selection_index is not None: self._selection_index.remove(bmelem)
+        if self._journal is not None: self._journal.removing(bmelem)
+        pool = self._wrapper_pool
+        t = type(bmelem)
+        if t is BMVert:   removing = [bmelem, *bmelem.link_edges, *bmelem.link_faces]
+        elif t is BMEdge: removing = [bmelem, *bmelem.link_faces]
+        else:             removing = [bmelem]
+        for bmelem_ in removing: pool.pop(bmelem_, None)
+        if t is BMVert:
+            if self.vert_grid is not None: self.vert_grid.remove(bmelem)
+            self._moved_verts.discard(bmelem)
+            self._arrays_moved.discard(bmelem)
+        self._arrays_topology = True
+        if self._created is not None:
+            for bmelem_ in removing: self._created[elem_kinds[type(bmelem_)]].discard(bmelem_)
+            self._removed = True
+
+    def _vert_changing(self, bmv):
+        ''' called before co or normal of bmv is set (see RFVert.co and RFVert.normal setters) '''
+        if self._journal is not None: self._journal.changing(bmv)
+        if self.arrays is not None: self._arrays_moved.add(bmv)
+
+    def _face_flipping(self, bmf):
+        ''' called before winding of bmf is flipped '''
+        if self._journal is not None: self._journal.flipping(bmf)
+        # flipping reorders verts of face in mirror
+        self._arrays_topology = True
+
+    def _journal_untracked(self):
+        '''
+        called before a change that the undo journal cannot record (ex: bmesh.ops).  such a
+        change cannot be tracked for pop_changes either, so tracking stops until restarted
+        '''
+        if self._journal is not None: self._journal.untracked()
+        self._created = None
+        self._arrays_topology = True
+        # verts may be removed without going through _elem_removing
+        self.vert_grid = None
+
+    def _selection_dirty(self):
+        ''' dirties selection, keeping index if it was in sync (all changes were reported to it) '''
+        index = self._selection_index
+        synced = index is not None and index.version == self._version_selection
+        self.dirty(selectionOnly=True)
+        if synced: index.version = self._version_selection
+
     def get_geometry_counts(self):
         ver = self.get_version(selection=False)
         if not hasattr(self, 'geocounts') or self.geocounts_version != ver:
@@ -285,12 +475,14 @@ class RFMesh():
     def triangulate(self):
         faces = [face for face in self.bme.faces if len(face.verts) != 3]
         dprint('%d non-triangles' % len(faces))
+        self._journal_untracked()
         bmesh.ops.triangulate(self.bme, faces=faces)
 
     @profiler.function
     def plane_split(self, plane: Plane):
         plane_local = self.xform.w2l_plane(plane)
         dist = 0.00000001
+        self._journal_untracked()
         geom = (
             list(self.bme.verts) +
             list(self.bme.edges) +
@@ -306,38 +498,25 @@ class RFMesh():
 
     @profiler.function
     def plane_intersection(self, plane: Plane):
+        ''' returns list of segments (pairs of world Points) where plane cuts faces '''
+        return [(Point(p0), Point(p1)) for (p0, p1) in self.plane_intersection_array(plane).tolist()]
+
+    @profiler.function
+    def plane_intersection_array(self, plane: Plane):
+        ''' returns Kx2x3 array of segments (world) where plane cuts faces '''
         # TODO: do not duplicate vertices!
-        l2w_point = self.xform.l2w_point
-        plane_local = self.xform.w2l_plane(plane)
-        side = plane_local.side
-        triangle_intersection = plane_local.triangle_intersection
+        return plane_intersection_segments(*self.plane_intersection_inputs(plane))
 
-        # vert sides
-        vert_side = {
-            bmv: side(bmv.co)
-            for bmv in self.bme.verts
-        }
-        # split edges
-        edges = {
-            bme
-            for bme in self.bme.edges
-            if vert_side[bme.verts[0]] != vert_side[bme.verts[1]]
-        }
-        # split faces
-        faces = {
-            bmf
-            for bme in edges
-            for bmf in bme.link_faces
-        }
-        # intersections
-        intersection = [
-            (l2w_point(p0), l2w_point(p1))
-            for bmf in faces
-            for (p0, p1) in triangle_intersection([
-                bmv.co for bmv in bmf.verts
-            ])
-        ]
-        return intersection
+    @profiler.function
+    def plane_intersection_inputs(self, plane: Plane):
+        '''
+        returns arguments for rfmesh_arrays.plane_intersection_segments (numpy arrays only), so
+        that segments can be computed off the main thread without touching bmesh
+        '''
+        arrays = self.get_arrays()
+        plane_local = self.xform.w2l_plane(plane)
+        tris, _ = arrays.triangles()
+        return (arrays.co, tris, np.array(plane_local.o, dtype=np.float64), np.array(plane_local.n, dtype=np.float64), arrays.mx_p)
 
     def get_xy_plane(self):
         o = self.xform.l2w_point(Point((0, 0, 0)))
@@ -354,11 +533,120 @@ class RFMesh():
         n = self.xform.l2w_normal(Normal((1, 0, 0)))
         return Plane(o, n)
 
-    @profiler.function
     def _crawl(self, bmf_start, plane):
         '''
-        crawl about RFMesh along plane starting with bmf
-        returns list of tuples (face0, edge between face0 and face1, face1, intersection of edge and plane)
+        crawl about RFMesh along plane (local) starting with bmf
+        returns list of tuples (face0, intersection of plane and edge between face0 and face1, face1)
+        '''
+        if options['array crawl']: return self._crawl_arrays(bmf_start, plane)
+        return self._crawl_bmesh(bmf_start, plane)
+
+    @profiler.function
+    def _crawl_arrays(self, bmf_start, plane):
+        '''
+        same as _crawl_bmesh, but walks the flat adjacency tables of the arrays mirror
+        (see RFMeshArrays.build_adjacency) rather than bmesh wrappers.
+        crossings are ('v', vert index) for verts on plane or ('e', edge index) for edges
+        with ends on opposite sides of plane
+        '''
+        arrays = self.get_arrays()
+        start = arrays.face_indices([bmf_start])
+        if not len(start): return self._crawl_bmesh(bmf_start, plane)     # face is not mirrored
+        start = int(start[0])
+        arrays.build_adjacency()
+        co, fo, fv, ev = arrays.co, arrays.face_offsets, arrays.face_verts, arrays.edge_verts
+        po, pn = np.array(plane.o), np.array(plane.n)
+        nf = arrays.counts[2]
+
+        def side(verts):
+            # -1, 0 (on plane, within zero_threshold), or 1; same as side() in _crawl_bmesh
+            d = (co[verts] - po) @ pn
+            return np.where(np.abs(d) < zero_threshold, 0, np.sign(d)).astype(np.int8)
+
+        # find all faces that are connected to start (via verts) and the plane intersects
+        touched = np.zeros(nf, dtype=bool)
+        touched[start] = True
+        frontier = np.array([start], dtype=np.int64)
+        intersect = []
+        while len(frontier):
+            verts, which = csr_gather(fo, fv, frontier)
+            s = side(verts)
+            count = lambda m: np.bincount(which[m], minlength=len(frontier))
+            hit = (count(s == 0) > 0) | ((count(s > 0) > 0) & (count(s < 0) > 0))
+            intersect.append(frontier[hit])
+            faces, _ = csr_gather(arrays.vert_face_offsets, arrays.vert_faces, np.unique(verts[hit[which]]))
+            faces = np.unique(faces)
+            frontier = faces[~touched[faces]]
+            touched[frontier] = True
+        intersect = np.concatenate(intersect)
+        n = len(intersect)
+
+        # keep faces that have exactly two crossings: verts on plane, then edges crossing plane
+        # (edges with an end on plane do not cross, as that vert is the crossing)
+        verts, vwhich = csr_gather(fo, fv, intersect)
+        on = side(verts) == 0
+        edges, ewhich = csr_gather(fo, arrays.face_edges, intersect)
+        crossing = side(ev[edges, 0]) * side(ev[edges, 1]) < 0
+        keep = np.bincount(vwhich[on], minlength=n) + np.bincount(ewhich[crossing], minlength=n) == 2
+        if not keep.any(): return []    # something bad happened
+        on &= keep[vwhich]
+        crossing &= keep[ewhich]
+        kept = np.zeros(nf, dtype=bool)
+        kept[intersect[keep]] = True
+        face_crossings = {}
+        for (f, v) in zip(intersect[vwhich[on]].tolist(), verts[on].tolist()):
+            face_crossings.setdefault(f, []).append(('v', v))
+        for (f, e) in zip(intersect[ewhich[crossing]].tolist(), edges[crossing].tolist()):
+            face_crossings.setdefault(f, []).append(('e', e))
+        if start not in face_crossings:
+            # start must have had only one crossing, so pick any other to be new start
+            start = next(iter(face_crossings))
+
+        # kept faces that use each crossing (crossings of more than two such faces do not connect)
+        crossing_faces = {}
+        for (kind, offsets, links, elems) in [
+            ('v', arrays.vert_face_offsets, arrays.vert_faces, verts[on]),
+            ('e', arrays.edge_face_offsets, arrays.edge_faces, edges[crossing]),
+        ]:
+            uelems = np.unique(elems)
+            efaces, ewhich = csr_gather(offsets, links, uelems)
+            m = kept[efaces]
+            for (i, f) in zip(uelems[ewhich[m]].tolist(), efaces[m].tolist()):
+                crossing_faces.setdefault((kind, i), []).append(f)
+        crossing_faces = { c: l for (c, l) in crossing_faces.items() if len(l) <= 2 }
+
+        ret = []
+        def crawl(c_current):
+            nonlocal ret
+            f_current = start
+            while True:
+                f_next = next((f for f in crossing_faces.get(c_current, []) if f != f_current), None)
+                ret.append((f_current, c_current, f_next))
+                if f_next is None: return False
+                if f_next == start: return True
+                c0, c1 = face_crossings[f_next]
+                c_current = c0 if c_current == c1 else c1
+                f_current = f_next
+        wrapped = crawl(face_crossings[start][0])
+        if not wrapped:
+            # did not wrap, so switch directions
+            ret = [(f1,c,f0) for (f0,c,f1) in reversed(ret)]
+            crawl(face_crossings[start][1])
+
+        def point(c):
+            kind, i = c
+            if kind == 'v': return Point(co[i].tolist())
+            p0, p1 = co[ev[i, 0]], co[ev[i, 1]]
+            d0, d1 = (p0 - po) @ pn, (p1 - po) @ pn
+            return Point((p0 + (p1 - p0) * (d0 / (d0 - d1))).tolist())
+        bmfaces = arrays.bmfaces
+        face = lambda f: bmfaces[f] if f is not None else None
+        return [(face(f0), point(c), face(f1)) for (f0,c,f1) in ret]
+
+    @profiler.function
+    def _crawl_bmesh(self, bmf_start, plane):
+        '''
+        see _crawl
         '''
 
         def intersect_edge(bme):
@@ -368,9 +656,11 @@ class RFMesh():
         def intersect_face(bmf):
             crosses = [(bme, intersect_edge(bme)) for bme in bmf.edges]
             return [(bme, cross) for (bme, cross) in crosses if cross]
+        def side(co):
+            # -1, 0 (on plane, within zero_threshold), or 1; same as side() in _crawl_arrays
+            return plane.side(co)
         def intersected_face(bmf):
-            nonlocal plane
-            sides = [plane.side(bmv.co, threshold=0) for bmv in bmf.verts]
+            sides = [side(bmv.co) for bmv in bmf.verts]
             if any(s == 0 for s in sides): return True
             return any(s0 != s1 for (s0, s1) in iter_pairs(sides, True))
         def adjacent_faces(bmf):
@@ -406,7 +696,7 @@ class RFMesh():
                     continue
                 if bmv in bmvs_touched: continue
                 bmvs_touched.add(bmv)
-                if plane.side(bmv.co, threshold=0) != 0: continue
+                if side(bmv.co) != 0: continue
                 pt = bmv.co
                 points[bmf].append((pt, bmv))
                 points[bmv] = (pt, [bmf])
@@ -419,7 +709,7 @@ class RFMesh():
                 bmes_touched.add(bme)
                 v0, v1 = bme.verts
                 if v0 in points or v1 in points: continue
-                pt = plane.edge_intersection(v0.co, v1.co, threshold=0)
+                pt = plane.edge_intersection(v0.co, v1.co)
                 if not pt: continue
                 points[bmf].append((pt, bme))
                 points[bme] = (pt, [bmf])
@@ -609,14 +899,10 @@ class RFMesh():
         plane = self.xform.w2l_plane(plane)
         w,l2w_point = self._wrap,self.xform.l2w_point
 
-        # find all faces that cross the plane
-        # finding all edges crossing plane
-        dot = plane.n.dot
-        o = dot(plane.o)
-        edges = [bme for bme in self.bme.edges if (dot(bme.verts[0].co)-o) * (dot(bme.verts[1].co)-o) <= 0]
-
-        # finding faces crossing plane
-        faces = set(bmf for bme in edges for bmf in bme.link_faces)
+        # find all faces that cross the plane, classifying all verts at once
+        arrays = self.get_arrays()
+        bmfaces = arrays.bmfaces
+        faces = [bmfaces[i] for i in arrays.plane_crossing_faces(arrays.plane_distances(plane)).tolist()]
 
         # crawling faces along plane
         rets = []
@@ -624,9 +910,9 @@ class RFMesh():
         for bmf in faces:
             if bmf in touched: continue
             ret = self._crawl(bmf, plane)
-            touched |= set(f0 for f0,_,_,_ in ret if f0)
-            touched |= set(f1 for _,_,f1,_ in ret if f1)
-            ret = [(w(f0),w(e),w(f1),l2w_point(c)) for f0,e,f1,c in ret]
+            touched |= set(f0 for f0,_,_ in ret if f0)
+            touched |= set(f1 for _,_,f1 in ret if f1)
+            ret = [(w(f0),l2w_point(c),w(f1)) for f0,c,f1 in ret]
             rets.append(ret)
 
         return rets
@@ -660,6 +946,43 @@ class RFMesh():
         d_w = (ray.o - p_w).length
         return (p_w,n_w,i,d_w)
 
+    @profiler.function
+    def raycast_batch(self, origins, directions, max_dist=float('inf')):
+        '''
+        batched version of raycast.  origins and directions are Nx3 numpy arrays (world).
+        returns (points, normals, indices, dists) as numpy arrays; misses have
+        index -1, dist inf, and nan point and normal
+        '''
+        n = len(origins)
+        points  = np.full((n, 3), np.nan)
+        normals = np.full((n, 3), np.nan)
+        indices = np.full(n, -1, dtype=np.int64)
+        dists   = np.full(n, np.inf)
+        if not n: return (points, normals, indices, dists)
+
+        # transform all rays to local space at once
+        xform = self.xform
+        imx_p = matrix_to_array(xform.imx_p)
+        origins_local = transform_points(imx_p, origins)
+        directions_local = directions @ imx_p[:3, :3].T
+        scale = np.linalg.norm(directions_local, axis=1)
+        scale[scale == 0] = 1
+        directions_local /= scale[:, None]
+        maxs_local = (max_dist * scale) if max_dist != float('inf') else np.full(n, max_dist)
+
+        ray_cast = self.get_bvh().ray_cast
+        Point_within = self.get_bbox().Point_within
+        for k, (o, d, m) in enumerate(zip(origins_local.tolist(), directions_local.tolist(), maxs_local.tolist())):
+            p,nrm,i,_ = ray_cast(o, d, m)
+            if p is None or not Point_within(p, margin=1): continue
+            points[k], normals[k], indices[k] = p, nrm, i
+
+        hit = indices >= 0
+        points[hit] = transform_points(matrix_to_array(xform.mx_p), points[hit])
+        normals[hit] = transform_normals(matrix_to_array(xform.mx_n), normals[hit])
+        dists[hit] = np.linalg.norm(points[hit] - origins[hit], axis=1)
+        return (points, normals, indices, dists)
+
     def raycast_all(self, ray:Ray):
         l2w_point,l2w_normal = self.xform.l2w_point,self.xform.l2w_normal
         ray_local = self.xform.w2l_ray(ray)
@@ -691,67 +1014,83 @@ class RFMesh():
         d = (point - p).length
         return (p,n,i,d)
 
+    @profiler.function
+    def nearest_batch(self, points, max_dist=float('inf')):
+        '''
+        batched version of nearest.  points is Nx3 numpy array (world).
+        returns (points, normals, indices, dists) as numpy arrays; points farther than
+        max_dist from surface have index -1, dist inf, and nan point and normal
+        '''
+        n = len(points)
+        hits    = np.full((n, 3), np.nan)
+        normals = np.full((n, 3), np.nan)
+        indices = np.full(n, -1, dtype=np.int64)
+        dists   = np.full(n, np.inf)
+        if not n: return (hits, normals, indices, dists)
+
+        xform = self.xform
+        imx_p = matrix_to_array(xform.imx_p)
+        points_local = transform_points(imx_p, points)
+        # local search distance must cover world max_dist under any scaling
+        max_local = max_dist * float(np.linalg.norm(imx_p[:3, :3], 2)) if max_dist != float('inf') else max_dist
+
+        find_nearest = self.get_bvh().find_nearest
+        for k, p in enumerate(points_local.tolist()):
+            hp,hn,hi,_ = find_nearest(p, max_local)
+            if hp is None: continue
+            hits[k], normals[k], indices[k] = hp, hn, hi
+
+        hit = indices >= 0
+        hits[hit] = transform_points(matrix_to_array(xform.mx_p), hits[hit])
+        normals[hit] = transform_normals(matrix_to_array(xform.mx_n), normals[hit])
+        dists[hit] = np.linalg.norm(hits[hit] - points[hit], axis=1)
+        far = dists > max_dist
+        hits[far], normals[far], indices[far], dists[far] = np.nan, np.nan, -1, np.inf
+        return (hits, normals, indices, dists)
+
+    @profiler.function
     def nearest_bmvert_Point(self, point:Point, verts=None):
-        if verts is None:
-            verts = [bmv for bmv in self.bme.verts if bmv.is_valid]
-        else:
-            verts = [self._unwrap(bmv) for bmv in verts if bmv.is_valid]
-        point_local = self.xform.w2l_point(point)
-        bv,bd = None,None
-        for bmv in verts:
-            d3d = (bmv.co - point_local).length
-            if bv is None or d3d < bd: bv,bd = bmv,d3d
-        bmv_world = self.xform.l2w_point(bv.co)
-        return (self._wrap_bmvert(bv),(point-bmv_world).length)
+        arrays = self.get_arrays()
+        i,d = arrays.nearest_vert(point, arrays.vert_indices(verts))
+        if i is None: return (None,None)
+        return (self._wrap_bmvert(arrays.bmverts[i]), d)
 
+    @profiler.function
     def nearest_bmverts_Point(self, point:Point, dist3d:float, bmverts=None):
-        nearest = []
-        unwrap = bmverts is not None
-        for bmv in (bmverts or self.bme.verts):
-            if unwrap: bmv = self._unwrap(bmv)
-            if not bmv.is_valid: continue
-            bmv_world = self.xform.l2w_point(bmv.co)
-            d3d = (bmv_world - point).length
-            if d3d > dist3d: continue
-            nearest.append((self._wrap_bmvert(bmv), d3d))
-        return nearest
+        nearest = self.get_vert_grid(dist3d).verts_within(point, dist3d)
+        if bmverts is not None:
+            if not isinstance(bmverts, (set, frozenset)): bmverts = set(bmverts)
+            nearest = [(bmv,d) for (bmv,d) in nearest if bmv in bmverts]
+        return [(self._wrap_bmvert(bmv), d) for (bmv,d) in nearest]
 
+    @profiler.function
     def nearest_bmedge_Point(self, point:Point, edges=None):
-        if edges is None:
-            edges = [bme for bme in self.bme.edges if bme.is_valid]
-        else:
-            edges = [self._unwrap(bme) for bme in edges if bme.is_valid]
-        l2w_point = self.xform.l2w_point
-        be,bd,bpp = None,None,None
-        for bme in self.bme.edges:
-            bmv0,bmv1 = l2w_point(bme.verts[0].co), l2w_point(bme.verts[1].co)
-            diff = bmv1 - bmv0
-            l = diff.length
-            d = diff / l
-            pp = bmv0 + d * max(0, min(l, (point - bmv0).dot(d)))
-            dist = (point - pp).length
-            if be is None or dist < bd: be,bd,bpp = bme,dist,pp
-        if be is None: return (None,None)
-        return (self._wrap_bmedge(be), (point-self.xform.l2w_point(bpp)).length)
+        arrays = self.get_arrays()
+        indices,dists = arrays.edge_distances(point, arrays.edge_indices(edges))
+        if not len(indices): return (None,None)
+        i = int(dists.argmin())
+        return (self._wrap_bmedge(arrays.bmedges[indices[i]]), float(dists[i]))
 
+    @profiler.function
     def nearest_bmedges_Point(self, point:Point, dist3d:float):
-        l2w_point = self.xform.l2w_point
-        nearest = []
-        for bme in self.bme.edges:
-            if not bme.is_valid: continue
-            bmv0,bmv1 = l2w_point(bme.verts[0].co), l2w_point(bme.verts[1].co)
-            diff = bmv1 - bmv0
-            l = diff.length
-            d = diff / l
-            pp = bmv0 + d * max(0, min(l, (point - bmv0).dot(d)))
-            dist = (point - pp).length
-            if dist > dist3d: continue
-            nearest.append((self._wrap_bmedge(bme), dist))
-        return nearest
+        arrays = self.get_arrays()
+        indices,dists = arrays.edge_distances(point)
+        bmedges = arrays.bmedges
+        return [
+            (self._wrap_bmedge(bmedges[i]), float(d))
+            for (i,d) in zip(indices, dists)
+            if d <= dist3d and bmedges[i].is_valid
+        ]
 
-    def nearest2D_bmverts_Point2D(self, xy:Point2D, dist2D:float, Point_to_Point2D, verts=None):
+    def nearest2D_bmverts_Point2D(self, xy:Point2D, dist2D:float, Point_to_Point2D, verts=None, projection=None):
         # TODO: compute distance from camera to point
         # TODO: sort points based on 3d distance
+        if projection:
+            # batched version, using precomputed projection of all verts (see RFMeshProjection)
+            arrays = projection.arrays
+            indices,dists = projection.vert_distances(xy, arrays.vert_indices(verts))
+            bmverts = arrays.bmverts
+            return [(self._wrap_bmvert(bmverts[i]), 0) for i in indices[dists <= dist2D]]
         if verts is None:
             verts = [bmv for bmv in self.bme.verts if bmv.is_valid]
         else:
@@ -765,10 +1104,18 @@ class RFMesh():
             nearest.append((self._wrap_bmvert(bmv), d3d))
         return nearest
 
-    def nearest2D_bmvert_Point2D(self, xy:Point2D, Point_to_Point2D, verts=None, max_dist=None):
+    def nearest2D_bmvert_Point2D(self, xy:Point2D, Point_to_Point2D, verts=None, max_dist=None, projection=None):
         if not max_dist or max_dist < 0: max_dist = float('inf')
         # TODO: compute distance from camera to point
         # TODO: sort points based on 3d distance
+        if projection:
+            # batched version, using precomputed projection of all verts (see RFMeshProjection)
+            arrays = projection.arrays
+            indices,dists = projection.vert_distances(xy, arrays.vert_indices(verts))
+            if not len(indices): return (None,None)
+            i = int(dists.argmin())
+            if dists[i] > max_dist: return (None,None)
+            return (self._wrap_bmvert(arrays.bmverts[indices[i]]), float(dists[i]))
         if verts is None:
             verts = [bmv for bmv in self.bme.verts if bmv.is_valid]
         else:
@@ -784,9 +1131,16 @@ class RFMesh():
         if bv is None: return (None,None)
         return (self._wrap_bmvert(bv),bd)
 
-    def nearest2D_bmedges_Point2D(self, xy:Point2D, dist2D:float, Point_to_Point2D, edges=None, shorten=0.01):
+    def nearest2D_bmedges_Point2D(self, xy:Point2D, dist2D:float, Point_to_Point2D, edges=None, shorten=0.01, projection=None):
         # TODO: compute distance from camera to point
         # TODO: sort points based on 3d distance
+        if projection:
+            # batched version, using precomputed projection of all verts (see RFMeshProjection)
+            arrays = projection.arrays
+            indices,dists = projection.edge_distances(xy, arrays.edge_indices(edges), shorten=shorten)
+            m = dists <= dist2D
+            bmedges = arrays.bmedges
+            return [(self._wrap_bmedge(bmedges[i]), float(d)) for (i,d) in zip(indices[m], dists[m])]
         if edges is None:
             edges = [bme for bme in self.bme.edges if bme.is_valid]
         else:
@@ -809,8 +1163,16 @@ class RFMesh():
             nearest.append((self._wrap_bmedge(bme), math.sqrt(dist2)))
         return nearest
 
-    def nearest2D_bmedge_Point2D(self, xy:Point2D, Point_to_Point2D, edges=None, shorten=0.01, max_dist=None):
+    def nearest2D_bmedge_Point2D(self, xy:Point2D, Point_to_Point2D, edges=None, shorten=0.01, max_dist=None, projection=None):
         if not max_dist or max_dist < 0: max_dist = float('inf')
+        if projection:
+            # batched version, using precomputed projection of all verts (see RFMeshProjection)
+            arrays = projection.arrays
+            indices,dists = projection.edge_distances(xy, arrays.edge_indices(edges), shorten=shorten)
+            if not len(indices): return (None,None)
+            i = int(dists.argmin())
+            if dists[i] > max_dist: return (None,None)
+            return (self._wrap_bmedge(arrays.bmedges[indices[i]]), float(dists[i]))
         if edges is None:
             edges = [bme for bme in self.bme.edges if bme.is_valid]
         else:
@@ -837,8 +1199,10 @@ class RFMesh():
         return (self._wrap_bmedge(be), (xy-bpp).length)
 
     def nearest2D_bmfaces_Point2D(self, xy:Point2D, Point_to_Point2D, faces=None):
-        # TODO: compute distance from camera to point
-        # TODO: sort points based on 3d distance
+        '''
+        returns list of (face, 0) for faces containing xy.
+        see RetopoFlow_Target.get_target_facebuffer for a faster version over visible faces
+        '''
         if faces is None:
             faces = [bmf for bmf in self.bme.faces if bmf.is_valid]
         else:
@@ -847,17 +1211,11 @@ class RFMesh():
         for bmf in faces:
             pts = [Point_to_Point2D(self.xform.l2w_point(bmv.co)) for bmv in bmf.verts]
             pts = [pt for pt in pts if pt]
+            if len(pts) < 3: continue
             pt0 = pts[0]
-            # TODO: Get dist?
-            for pt1,pt2 in zip(pts[1:-1],pts[2:]):
-                if intersect_point_tri_2d(xy, pt0, pt1, pt2):
-                    nearest.append((self._wrap_bmface(bmf), dist))
-            #p2d = Point_to_Point2D(self.xform.l2w_point(bmv.co))
-            #d2d = (xy - p2d).length
-            #if p2d is None: continue
-            #if bv is None or d2d < bd: bv,bd = bmv,d2d
-        #if bv is None: return (None,None)
-        #return (self._wrap_bmvert(bv),bd)
+            if any(intersect_point_tri_2d(xy, pt0, pt1, pt2) for (pt1,pt2) in zip(pts[1:-1],pts[2:])):
+                # xy is inside face, so 2D distance is 0 (same as nearest2D_bmface_Point2D)
+                nearest.append((self._wrap_bmface(bmf), 0))
         return nearest
 
     def nearest2D_bmface_Point2D(self, forward:Direction, xy:Point2D, Point_to_Point2D, faces=None):
@@ -886,33 +1244,81 @@ class RFMesh():
 
     ##########################################################
 
-    def _visible_verts(self, is_visible):
+    def _visible_verts(self, is_visible, bmverts=None):
         l2w_point, l2w_normal = self.xform.l2w_point, self.xform.l2w_normal
         #is_vis = lambda bmv: is_visible(l2w_point(bmv.co), l2w_normal(bmv.normal))
         is_vis = lambda bmv: (
             is_visible(l2w_point(bmv.co), None) or
             is_visible(l2w_point(bmv.co + 0.002 * options['normal offset multiplier'] * l2w_normal(bmv.normal)), None)
         )
-        return { bmv for bmv in self.bme.verts if bmv.is_valid and is_vis(bmv) }
+        if bmverts is None: bmverts = self.bme.verts
+        return { bmv for bmv in bmverts if bmv.is_valid and is_vis(bmv) }
 
-    def _visible_edges(self, is_visible, bmvs=None):
+    @profiler.function
+    def _visible_verts_batch(self, are_visible, bmverts=None):
+        '''
+        same as _visible_verts, but are_visible tests Nx3 array of points at once.
+        bmverts, if given, are read directly rather than through the (possibly stale) mirror
+        '''
+        if bmverts is None:
+            arrays = self.get_arrays()
+            bmverts, co, normal_world, mx_p = arrays.bmverts, arrays.co, arrays.normal_world, arrays.mx_p
+        else:
+            bmverts = [bmv for bmv in bmverts if bmv.is_valid]
+            n = len(bmverts)
+            co = np.fromiter((c for bmv in bmverts for c in bmv.co), dtype=np.float64, count=n*3).reshape((n, 3))
+            normal = np.fromiter((c for bmv in bmverts for c in bmv.normal), dtype=np.float64, count=n*3).reshape((n, 3))
+            mx_p = matrix_to_array(self.xform.mx_p)
+            normal_world = transform_normals(matrix_to_array(self.xform.mx_n), normal)
+        if not len(bmverts): return set()
+        offset = 0.002 * options['normal offset multiplier']
+        # note: offsetting local co by world normal to match _visible_verts
+        co_offset = transform_points(mx_p, co + offset * normal_world)
+        vis = are_visible(transform_points(mx_p, co))
+        vis[~vis] = are_visible(co_offset[~vis])
+        return { bmverts[i] for i in np.flatnonzero(vis).tolist() if bmverts[i].is_valid }
+
+    def _visible_edges(self, is_visible, bmvs=None, bmedges=None):
         if bmvs is None: bmvs = self._visible_verts(is_visible)
-        return { bme for bme in self.bme.edges if bme.is_valid and all(bmv in bmvs for bmv in bme.verts) }
+        if bmedges is None: bmedges = self.bme.edges
+        return { bme for bme in bmedges if bme.is_valid and all(bmv in bmvs for bmv in bme.verts) }
 
-    def _visible_faces(self, is_visible, bmvs=None):
+    def _visible_faces(self, is_visible, bmvs=None, bmfaces=None):
         if bmvs is None: bmvs = self._visible_verts(is_visible)
-        return { bmf for bmf in self.bme.faces if bmf.is_valid and all(bmv in bmvs for bmv in bmf.verts) }
+        if bmfaces is None: bmfaces = self.bme.faces
+        return { bmf for bmf in bmfaces if bmf.is_valid and all(bmv in bmvs for bmv in bmf.verts) }
 
-    def visible_verts(self, is_visible):
-        return { self._wrap_bmvert(bmv) for bmv in self._visible_verts(is_visible) if bmv.is_valid }
+    def visible_verts(self, is_visible, are_visible=None, verts=None):
+        '''
+        are_visible, if given, is batched version of is_visible (ex: RetopoFlow_Sources.are_visible).
+        verts, if given, limits which verts are tested
+        '''
+        bmverts = None if verts is None else [self._unwrap(v) for v in verts]
+        if are_visible: bmvs = self._visible_verts_batch(are_visible, bmverts=bmverts)
+        else:           bmvs = self._visible_verts(is_visible, bmverts=bmverts)
+        return { self._wrap_bmvert(bmv) for bmv in bmvs if bmv.is_valid }
 
-    def visible_edges(self, is_visible, verts=None):
-        bmvs = None if verts is None else { self._unwrap(bmv) for bmv in verts if bmv.is_valid }
-        return { self._wrap_bmedge(bme) for bme in self._visible_edges(is_visible, bmvs=bmvs) if bme.is_valid }
+    def visible_edges(self, is_visible, verts=None, edges=None):
+        '''
+        edges, if given, limits which edges are tested.  in that case verts (visible verts)
+        must also be given, and is used as-is for membership tests
+        '''
+        if edges is not None:
+            bmvs, bmedges = verts, [self._unwrap(e) for e in edges]
+        else:
+            bmvs, bmedges = (None if verts is None else { self._unwrap(bmv) for bmv in verts if bmv.is_valid }), None
+        return { self._wrap_bmedge(bme) for bme in self._visible_edges(is_visible, bmvs=bmvs, bmedges=bmedges) if bme.is_valid }
 
-    def visible_faces(self, is_visible, verts=None):
-        bmvs = None if verts is None else { self._unwrap(bmv) for bmv in verts if bmv.is_valid }
-        bmfs = { self._wrap_bmface(bmf) for bmf in self._visible_faces(is_visible, bmvs=bmvs) if bmf.is_valid }
+    def visible_faces(self, is_visible, verts=None, faces=None):
+        '''
+        faces, if given, limits which faces are tested.  in that case verts (visible verts)
+        must also be given, and is used as-is for membership tests
+        '''
+        if faces is not None:
+            bmvs, bmfaces = verts, [self._unwrap(f) for f in faces]
+        else:
+            bmvs, bmfaces = (None if verts is None else { self._unwrap(bmv) for bmv in verts if bmv.is_valid }), None
+        bmfs = { self._wrap_bmface(bmf) for bmf in self._visible_faces(is_visible, bmvs=bmvs, bmfaces=bmfaces) if bmf.is_valid }
         return bmfs
 
 
@@ -943,40 +1349,54 @@ class RFMesh():
     def get_face_count(self): return len(self.bme.faces)
 
     def get_selected_verts(self):
-        return {self._wrap_bmvert(bmv) for bmv in self.bme.verts if bmv.is_valid and bmv.select}
+        wrap = self._wrap_bmvert
+        return {wrap(bmv) for bmv in self.get_selection_index().verts if bmv.is_valid}
     def get_selected_edges(self):
-        return {self._wrap_bmedge(bme) for bme in self.bme.edges if bme.is_valid and bme.select}
+        wrap = self._wrap_bmedge
+        return {wrap(bme) for bme in self.get_selection_index().edges if bme.is_valid}
     def get_selected_faces(self):
-        return {self._wrap_bmface(bmf) for bmf in self.bme.faces if bmf.is_valid and bmf.select}
+        wrap = self._wrap_bmface
+        return {wrap(bmf) for bmf in self.get_selection_index().faces if bmf.is_valid}
 
     def any_verts_selected(self):
-        return any(bmv.select for bmv in self.bme.verts if bmv.is_valid)
+        return bool(self.get_selection_index().verts)
     def any_edges_selected(self):
-        return any(bme.select for bme in self.bme.edges if bme.is_valid)
+        return bool(self.get_selection_index().edges)
     def any_faces_selected(self):
-        return any(bmf.select for bmf in self.bme.faces if bmf.is_valid)
+        return bool(self.get_selection_index().faces)
     def any_selected(self):
         return self.any_verts_selected() or self.any_edges_selected() or self.any_faces_selected()
 
+    def get_selection_counts(self):
+        return self.get_selection_index().counts()
+
     def get_selection_center(self):
-        v,c = Vector(),0
-        for bmv in self.bme.verts:
-            if not bmv.select or not bmv.is_valid: continue
-            v += bmv.co
-            c += 1
-        if c: self.selection_center = v / c
-        return self.xform.l2w_point(self.selection_center)
+        center = self.get_selection_index().center()
+        if center is None: return self.xform.l2w_point(self.selection_center)
+        self.selection_center = self.xform.w2l_point(Point(center))
+        return Point(center)
     def get_selection_bbox(self):
-        l2w_point = self.xform.l2w_point
-        coords = [l2w_point(bmv.co) for bmv in self.bme.verts if bmv.is_valid and bmv.select]
-        #if not coords: return self.get_bbox()
-        return BBox(from_coords=coords)
+        bounds = self.get_selection_index().get_bounds()
+        if not bounds: return BBox()
+        return BBox(from_coords=bounds)
 
     def deselect_all(self):
-        for bmv in self.bme.verts: bmv.select = False
-        for bme in self.bme.edges: bme.select = False
-        for bmf in self.bme.faces: bmf.select = False
-        self.dirty(selectionOnly=True)
+        index = self._selection_index
+        if index is not None and index.version == self._version_selection:
+            # only need to touch selected elements
+            for bmf in index.faces:
+                if bmf.is_valid: bmf.select = False
+            for bme in index.edges:
+                if bme.is_valid: bme.select = False
+            for bmv in index.verts:
+                if bmv.is_valid: bmv.select = False
+            index.clear()
+        else:
+            for bmv in self.bme.verts: bmv.select = False
+            for bme in self.bme.edges: bme.select = False
+            for bmf in self.bme.faces: bmf.select = False
+            self._selection_index = RFMeshSelection(self.bme, self._version_selection, self.xform)
+        self._selection_dirty()
 
     def deselect(self, elems, supparts=True, subparts=True):
         if elems is None: return
@@ -1004,8 +1424,13 @@ class RFMesh():
                 selems.update(e for e in elem.edges if not (set(e.verts)&elems))
         selems = selems - elems
         selems = { e for e in selems if e.select }
-        for elem in nelems: elem.select = False
-        for elem in selems: elem.select = True
+        update = self._selection_update
+        for elem in nelems:
+            elem.select = False
+            update(self._unwrap(elem))
+        for elem in selems:
+            elem.select = True
+            update(self._unwrap(elem))
         if subparts:
             nelems = set()
             for elem in elems:
@@ -1028,7 +1453,8 @@ class RFMesh():
                         nelems.add(bmv)
             for elem in nelems:
                 elem.select = False
-        self.dirty(selectionOnly=True)
+                update(self._unwrap(elem))
+        self._selection_dirty()
 
     def select(self, elems, supparts=True, subparts=True, only=True):
         if only: self.deselect_all()
@@ -1047,7 +1473,10 @@ class RFMesh():
                     nelems.update(e for e in elem.verts)
                     nelems.update(e for e in elem.edges)
             elems = nelems
-        for elem in elems: elem.select = True
+        update = self._selection_update
+        for elem in elems:
+            elem.select = True
+            update(self._unwrap(elem))
         if supparts:
             for elem in elems:
                 t = type(elem)
@@ -1055,10 +1484,12 @@ class RFMesh():
                 for bme in elem.link_edges:
                     if all(bmv.select for bmv in bme.verts):
                         bme.select = True
+                        update(self._unwrap(bme))
                 for bmf in elem.link_faces:
                     if all(bmv.select for bmv in bmf.verts):
                         bmf.select = True
-        self.dirty(selectionOnly=True)
+                        update(self._unwrap(bmf))
+        self._selection_dirty()
 
     def get_quadwalk_edgesequence(self, edge):
         bme = self._unwrap(edge)
@@ -1294,7 +1725,7 @@ class RFSource(RFMesh):
             if obj.data.name in RFSource.__cache:
                 # does cache match current state?
                 rfsource = RFSource.__cache[obj.data.name]
-                hashed = hash_object(obj)
+                hashed = hash_object(obj, sample=options['hash sample'])
                 if rfsource.hash != hashed:
                     rfsource = None
             if not rfsource:
@@ -1356,8 +1787,8 @@ class RFTarget(RFMesh):
     def __str__(self):
         return '<RFTarget %s>' % self.obj.name
 
-    def __setup__(self, obj:bpy.types.Object, unit_scaling_factor:float, rftarget_copy=None):
-        bme = rftarget_copy.bme.copy() if rftarget_copy else None
+    def __setup__(self, obj:bpy.types.Object, unit_scaling_factor:float, rftarget_copy=None, bme=None):
+        if bme is None and rftarget_copy: bme = rftarget_copy.bme.copy()
         xy_symmetry_accel = rftarget_copy.xy_symmetry_accel if rftarget_copy else None
         xz_symmetry_accel = rftarget_copy.xz_symmetry_accel if rftarget_copy else None
         yz_symmetry_accel = rftarget_copy.yz_symmetry_accel if rftarget_copy else None
@@ -1497,12 +1928,16 @@ class RFTarget(RFMesh):
         # bpy.ops.object.editmode_toggle()
 
         # bmesh.update_edit_mesh(self.obj.data)
-        for bmv,emv in zip(self.bme.verts, self.obj.data.vertices):
-            emv.select = bmv.select
-        for bme,eme in zip(self.bme.edges, self.obj.data.edges):
-            eme.select = bme.select
-        for bmf,emf in zip(self.bme.faces, self.obj.data.polygons):
-            emf.select = bmf.select
+        # write selection in bulk: to_mesh writes elements in bmesh order, so after index_update
+        # BMElem.index is index into mesh data, and only selected elements need to be visited
+        with profiler.code('writing selection'):
+            index = self.get_selection_index()
+            me = self.obj.data
+            for bmelems, emelems, selected in [(self.bme.verts, me.vertices, index.verts), (self.bme.edges, me.edges, index.edges), (self.bme.faces, me.polygons, index.faces)]:
+                bmelems.index_update()
+                sel = np.zeros(len(emelems), dtype=bool)
+                sel[[bmelem.index for bmelem in selected if bmelem.is_valid]] = True
+                emelems.foreach_set('select', sel)
         self.mirror_mod.write()
         self.clean_displace()
 
@@ -1515,6 +1950,7 @@ class RFTarget(RFMesh):
 
     def apply_symmetry(self, nearest):
         out = []
+        self._journal_untracked()
         if self.mirror_mod.x:
             geom = list(self.bme.verts) + list(self.bme.edges) + list(self.bme.faces)
             out += mirror(self.bme, geom=geom, merge_dist=self.mirror_mod.symmetry_threshold, axis='X')['geom']
@@ -1527,18 +1963,14 @@ class RFTarget(RFMesh):
             geom = list(self.bme.verts) + list(self.bme.edges) + list(self.bme.faces)
             out += mirror(self.bme, geom=geom, merge_dist=self.mirror_mod.symmetry_threshold, axis='Z')['geom']
             self.mirror_mod.z = False
-        for v in out:
-            if type(v) is not BMVert: continue
-            v = self._wrap_bmvert(v)
-            xyz,norm,_,_ = nearest(v.co)
-            v.co = xyz
-            v.normal = norm
+        self.snap_verts([v for v in out if type(v) is BMVert], nearest)
         self.dirty()
 
     def new_vert(self, co, norm):
         # assuming co and norm are in world space!
         # so, do not set co directly; need to xform to local first.
         bmv = self.bme.verts.new((0,0,0))
+        self._elem_created(bmv)
         rfv = self._wrap_bmvert(bmv)
         rfv.co = co
         rfv.normal = norm
@@ -1547,6 +1979,7 @@ class RFTarget(RFMesh):
     def new_edge(self, verts):
         verts = [self._unwrap(v) for v in verts]
         bme = self.bme.edges.new(verts)
+        self._elem_created(bme)
         return self._wrap_bmedge(bme)
 
     def new_face(self, verts):
@@ -1554,12 +1987,18 @@ class RFTarget(RFMesh):
         face_in_common = accumulate_last((set(v.link_faces) for v in verts), lambda s0,s1: s0 & s1)
         if face_in_common: return face_in_common
         verts = [self._unwrap(v) for v in verts]
+        bmes = { bme for bmv in verts for bme in bmv.link_edges }
         bmf = self.bme.faces.new(verts)
+        # faces.new creates missing edges, too
+        for bme in bmf.edges:
+            if bme not in bmes: self._elem_created(bme)
+        self._elem_created(bmf)
         self.update_face_normal(bmf)
         return self._wrap_bmface(bmf)
 
     def holes_fill(self, edges, sides):
         edges = list(map(self._unwrap, edges))
+        self._journal_untracked()
         ret = holes_fill(self.bme, edges=edges, sides=sides)
         print('RetopoFlow holes_fill', ret)
 
@@ -1576,38 +2015,53 @@ class RFTarget(RFMesh):
 
 
     def delete_verts(self, verts):
-        for bmv in map(self._unwrap, verts): self.bme.verts.remove(bmv)
+        for bmv in map(self._unwrap, verts):
+            self._elem_removing(bmv)
+            self.bme.verts.remove(bmv)
 
     def delete_edges(self, edges, del_empty_verts=True):
         edges = set(self._unwrap(e) for e in edges)
         verts = set(v for e in edges for v in e.verts)
-        for bme in edges: self.bme.edges.remove(bme)
+        for bme in edges:
+            self._elem_removing(bme)
+            self.bme.edges.remove(bme)
         if del_empty_verts:
             for bmv in verts:
-                if len(bmv.link_edges) == 0: self.bme.verts.remove(bmv)
+                if len(bmv.link_edges) == 0:
+                    self._elem_removing(bmv)
+                    self.bme.verts.remove(bmv)
 
     def delete_faces(self, faces, del_empty_edges=True, del_empty_verts=True):
         faces = set(self._unwrap(f) for f in faces)
         edges = set(e for f in faces for e in f.edges)
         verts = set(v for f in faces for v in f.verts)
-        for bmf in faces: self.bme.faces.remove(bmf)
+        for bmf in faces:
+            self._elem_removing(bmf)
+            self.bme.faces.remove(bmf)
         if del_empty_edges:
             for bme in edges:
-                if len(bme.link_faces) == 0: self.bme.edges.remove(bme)
+                if len(bme.link_faces) == 0:
+                    self._elem_removing(bme)
+                    self.bme.edges.remove(bme)
         if del_empty_verts:
             for bmv in verts:
-                if len(bmv.link_faces) == 0: self.bme.verts.remove(bmv)
+                if len(bmv.link_faces) == 0:
+                    self._elem_removing(bmv)
+                    self.bme.verts.remove(bmv)
 
     def dissolve_verts(self, verts, use_face_split=False, use_boundary_tear=False):
         verts = list(map(self._unwrap, verts))
+        self._journal_untracked()
         dissolve_verts(self.bme, verts=verts, use_face_split=use_face_split, use_boundary_tear=use_boundary_tear)
 
     def dissolve_edges(self, edges, use_verts=True, use_face_split=False):
         edges = list(map(self._unwrap, edges))
+        self._journal_untracked()
         dissolve_edges(self.bme, edges=edges, use_verts=use_verts, use_face_split=use_face_split)
 
     def dissolve_faces(self, faces, use_verts=True):
         faces = list(map(self._unwrap, faces))
+        self._journal_untracked()
         dissolve_faces(self.bme, faces=faces, use_verts=use_verts)
 
     def update_verts_faces(self, verts):
@@ -1616,6 +2070,7 @@ class RFTarget(RFMesh):
             n = compute_normal(v.co for v in bmf.verts)
             vnorm = sum((v.normal for v in bmf.verts), Vector())
             if n.dot(vnorm) < 0:
+                self._face_flipping(bmf)
                 bmf.normal_flip()
             bmf.normal_update()
 
@@ -1624,6 +2079,7 @@ class RFTarget(RFMesh):
         n = compute_normal(v.co for v in bmf.verts)
         vnorm = sum((v.normal for v in bmf.verts), Vector())
         if n.dot(vnorm) < 0:
+            self._face_flipping(bmf)
             bmf.normal_flip()
         bmf.normal_update()
 
@@ -1645,10 +2101,14 @@ class RFTarget(RFMesh):
             bme0.select |= bme1.select
             bme1.select |= bme0.select
             handled = False
+            self._selection_update(bme0)
+            self._selection_update(bme1)
             if l0 == 0:
+                self._elem_removing(bme0)
                 self.bme.edges.remove(bme0)
                 handled = True
             if l1 == 0:
+                self._elem_removing(bme1)
                 self.bme.edges.remove(bme1)
                 handled = True
             if l0 == 1 and l1 == 1:
@@ -1656,6 +2116,7 @@ class RFTarget(RFMesh):
                 lbmv = list(bme1.link_faces[0].verts)
                 bmf = self._wrap_bmface(bme1.link_faces[0])
                 s = bmf.select
+                self._elem_removing(bme1)
                 self.bme.edges.remove(bme1)
                 mapping[bmf] = self.new_face(lbmv)
                 mapping[bmf].select = s
@@ -1685,35 +2146,50 @@ class RFTarget(RFMesh):
                 if check: break
         return mapping
 
+    @profiler.function
+    def snap_verts(self, verts, nearest):
+        '''
+        snaps verts to surface, where nearest is a batched nearest function
+        (ex: RetopoFlow_Sources.nearest_sources_Points).  does not dirty!
+        '''
+        bmverts = [self._unwrap(v) for v in verts]
+        if not bmverts: return
+        co = np.fromiter((c for bmv in bmverts for c in bmv.co), dtype=np.float64, count=len(bmverts)*3).reshape((-1, 3))
+        co = transform_points(matrix_to_array(self.xform.mx_p), co)
+        points,normals,indices,_ = nearest(co)
+        for bmv,p,n,i in zip(bmverts, points.tolist(), normals.tolist(), indices.tolist()):
+            if i < 0: continue
+            v = self._wrap_bmvert(bmv)
+            v.co = Point(p)
+            v.normal = Normal(n)
+
     def snap_all_verts(self, nearest):
-        for v in self.get_verts():
-            xyz,norm,_,_ = nearest(v.co)
-            v.co = xyz
-            v.normal = norm
+        self.snap_verts(self.bme.verts, nearest)
         self.dirty()
 
     def snap_selected_verts(self, nearest):
-        for v in self.get_verts():
-            if not v.select: continue
-            xyz,norm,_,_ = nearest(v.co)
-            v.co = xyz
-            v.normal = norm
+        self.snap_verts([bmv for bmv in self.bme.verts if bmv.select], nearest)
         self.dirty()
 
     def remove_all_doubles(self, dist):
+        self._journal_untracked()
         remove_doubles(self.bme, verts=self.bme.verts, dist=dist)
         self.dirty()
 
     def remove_selected_doubles(self, dist):
+        self._journal_untracked()
         remove_doubles(self.bme, verts=[bmv for bmv in self.bme.verts if bmv.select], dist=dist)
         self.dirty()
 
     def flip_face_normals(self):
         verts = set()
         for bmf in self.get_selected_faces():
+            bmf = self._unwrap(bmf)
+            self._face_flipping(bmf)
             bmf.normal_flip()
             for bmv in bmf.verts: verts.add(bmv)
         for bmv in verts:
+            self._vert_changing(bmv)
             bmv.normal_update()
         self.dirty()
 
@@ -0,0 +1,502 @@
+'''
+Copyright (C) 2021 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import numpy as np
+
+from ...addon_common.common.maths import Point2D, zero_threshold
+from ...addon_common.common.profiler import profiler
+
+
+'''
+RFMeshArrays is a structure-of-arrays mirror of the geometry in an RFMesh.
+
+The bmesh stays the authoritative data.  RFMesh.get_arrays() rebuilds the
+mirror when topology changes (elements created, removed, or flipped, or
+changes made with bmesh.ops), updates the rows of just the moved verts in place
+when only verts moved (see RFMesh.vert_moved, update_verts), and refreshes only
+the select / hide flags when just the selection version changes.  Each in-place
+update bumps serial, so that data derived from the mirror (ex: RFMeshProjection)
+can bring the same rows up to date (see moved_since).
+Read-only queries (nearest, visibility, selection center / bbox, etc.) can
+then work on whole arrays at once rather than walking BMVerts in Python.
+
+Index i in any vert array corresponds to bmverts[i] (same for edges, faces).
+Note: building the mirror calls index_update() on the bmesh, so BMElem.index
+is valid while the mirror is current.
+'''
+
+
+def matrix_to_array(mx):
+    return np.array([list(row) for row in mx], dtype=np.float64)
+
+
+def foreach_get_array(collection, attr, dtype, width=1):
+    ''' reads attr of all items in bpy collection (ex: Mesh.vertices) into flat array with one bulk foreach_get '''
+    arr = np.empty(len(collection) * width, dtype=dtype)
+    collection.foreach_get(attr, arr)
+    return arr
+
+
+def transform_points(mx, co):
+    ''' applies 4x4 matrix (numpy) to Nx3 array of points '''
+    if not len(co): return np.empty((0, 3), dtype=np.float64)
+    return co @ mx[:3, :3].T + mx[:3, 3]
+
+
+def transform_normals(mx3, no):
+    ''' applies 3x3 normal matrix (numpy) to Nx3 array of normals and renormalizes '''
+    if not len(no): return np.empty((0, 3), dtype=np.float64)
+    no = no @ mx3.T
+    l = np.linalg.norm(no, axis=1)
+    l[l == 0] = 1
+    return no / l[:, None]
+
+
+def points2D_distances(xy, pts):
+    ''' distances from xy to each point in Nx2 array pts '''
+    return np.linalg.norm(pts - np.asarray(xy, dtype=np.float64), axis=1)
+
+
+def segments2D_distances(xy, p0, p1, shorten=0.0):
+    '''
+    distances from xy to each segment (p0[i], p1[i]), where p0 and p1 are Nx2 arrays.
+    closest point is clamped to within shorten/2 (fraction of segment length) of either end,
+    matching RFMesh.nearest2D_bmedge(s)_Point2D
+    '''
+    xy = np.asarray(xy, dtype=np.float64)
+    v01 = p1 - p0
+    l2 = np.einsum('ij,ij->i', v01, v01)
+    t = np.einsum('ij,ij->i', xy - p0, v01) / np.where(l2 == 0, 1, l2)
+    t = np.clip(t, shorten / 2, 1 - shorten / 2)
+    pp = p0 + v01 * t[:, None]
+    return np.linalg.norm(xy - pp, axis=1)
+
+
+def csr_gather(offsets, values, rows):
+    '''
+    gathers CSR rows (values[offsets[r]:offsets[r+1]] for r in rows) into one array.
+    returns (values, position in rows of the row each value came from)
+    '''
+    starts, lengths = offsets[rows], offsets[rows + 1] - offsets[rows]
+    which = np.repeat(np.arange(len(rows)), lengths)
+    idx = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(int(lengths.sum()))
+    return (values[idx], which)
+
+
+def csr_invert(keys, values, n):
+    ''' returns CSR (offsets, values) grouping values by keys, where keys are in range(n) '''
+    order = np.argsort(keys, kind='stable')
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n), out=offsets[1:])
+    return (offsets, values[order])
+
+
+def plane_intersection_segments(co, tris, plane_o, plane_n, mx):
+    '''
+    returns Kx2x3 array of segments where plane (plane_o, plane_n) cuts triangles, transformed
+    by 4x4 matrix mx.  co is Nx3 array of points in the same space as plane, and tris is Tx3
+    array of indices into co.  segments match Plane.triangle_intersection (triangles lying in
+    plane are skipped).
+    note: takes and returns only numpy arrays and is not profiled, so it can run on worker
+    threads (see RetopoFlow_Sources.get_symmetry_sections)
+    '''
+    # vert sides (same as Plane.side)
+    dists = (co - plane_o) @ plane_n
+    sides = np.where(np.abs(dists) < zero_threshold, 0, np.sign(dists)).astype(np.int8)
+
+    # split triangles
+    ts = sides[tris]
+    split = (ts[:, 0] != ts[:, 1]) | (ts[:, 1] != ts[:, 2])
+    strict = split & np.all(ts != 0, axis=1)
+
+    def cut(P, D, a, b):
+        # point where edge (a, b) of each triangle crosses plane
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return P[:, a] + (P[:, b] - P[:, a]) * (D[:, a] / (D[:, a] - D[:, b]))[:, None]
+
+    # triangles strictly crossing plane: one vert (lone) is on other side from other two
+    t, s = tris[strict], ts[strict]
+    P, D = co[t], dists[t]
+    p01, p12, p20 = cut(P, D, 0, 1), cut(P, D, 1, 2), cut(P, D, 2, 0)
+    lone = np.where(s[:, 1] == s[:, 2], 0, np.where(s[:, 0] == s[:, 2], 1, 2))[:, None]
+    # same ordering of segment ends as Plane.triangle_intersection
+    s0 = np.where(lone == 2, p12, p01)
+    s1 = np.where(lone == 1, p12, p20)
+    segments = [np.stack((s0, s1), axis=1)]
+
+    # triangles touching plane: segment starts at vert k on plane and ends at
+    # - next vert, if it is also on plane
+    # - k itself, if other two verts are on same side
+    # - crossing of opposite edge, otherwise
+    touching = split & ~strict
+    t, s = tris[touching], ts[touching]
+    P, D = co[t], dists[t]
+    rows = np.arange(len(t))
+    on = (s == 0)
+    two = on.sum(axis=1) == 2
+    k = np.where(two, (np.argmin(on, axis=1) + 1) % 3, np.argmax(on, axis=1))
+    k1, k2 = (k + 1) % 3, (k + 2) % 3
+    opposite = s[rows, k1] != s[rows, k2]
+    a, b = P[rows, k], P[rows, k1]
+    c = cut(np.stack((b, P[rows, k2]), axis=1), np.stack((D[rows, k1], D[rows, k2]), axis=1), 0, 1)
+    end = np.where(two[:, None], b, np.where(opposite[:, None], c, a))
+    segments.append(np.stack((a, end), axis=1))
+
+    segments = np.concatenate(segments)
+    return transform_points(mx, segments.reshape((-1, 3))).reshape((-1, 2, 3))
+
+
+class RFMeshArrays:
+    moved_log_length = 16       # number of recent update_verts calls remembered (see moved_since)
+
+    @profiler.function
+    def __init__(self, rfmesh):
+        self.rfmesh = rfmesh
+        self.serial = 0         # incremented by each update_verts
+        self.moved_log = []     # (serial, vert indices) of recent update_verts
+        self.update_geometry()
+        self.update_selection()
+
+    @profiler.function
+    def update_geometry(self):
+        rfmesh = self.rfmesh
+        bme = rfmesh.bme
+
+        bme.verts.index_update()
+        bme.edges.index_update()
+        bme.faces.index_update()
+        rfmesh.ensure_lookup_tables()
+
+        self.bmverts = list(bme.verts)
+        self.bmedges = list(bme.edges)
+        self.bmfaces = list(bme.faces)
+        nv, ne, nf = len(self.bmverts), len(self.bmedges), len(self.bmfaces)
+        self.counts = (nv, ne, nf)
+
+        # vertex data (local space)
+        self.co = np.fromiter((c for bmv in self.bmverts for c in bmv.co), dtype=np.float64, count=nv*3).reshape((nv, 3))
+        self.normal = np.fromiter((c for bmv in self.bmverts for c in bmv.normal), dtype=np.float64, count=nv*3).reshape((nv, 3))
+
+        # edge data: Ex2 vert indices
+        self.edge_verts = np.fromiter((bmv.index for bmedge in self.bmedges for bmv in bmedge.verts), dtype=np.int64, count=ne*2).reshape((ne, 2))
+
+        # face data: CSR-style offsets into flat vert index array
+        face_counts = np.fromiter((len(bmf.verts) for bmf in self.bmfaces), dtype=np.int64, count=nf)
+        self.face_offsets = np.zeros(nf + 1, dtype=np.int64)
+        np.cumsum(face_counts, out=self.face_offsets[1:])
+        self.face_verts = np.fromiter((bmv.index for bmf in self.bmfaces for bmv in bmf.verts), dtype=np.int64, count=int(self.face_offsets[-1]))
+
+        # adjacency tables (see build_adjacency)
+        self.face_edges = None
+
+        # edge / face flags (see build_flags) and custom data layers (see rfmesh_snapshot.capture_target_layers)
+        self.edge_seam = None
+        self.layers = None
+
+        # world space data
+        self.update_xform()
+
+    def update_xform(self):
+        xform = self.rfmesh.xform
+        self.xform = xform
+        self.mx_p = matrix_to_array(xform.mx_p)
+        self.mx_n = matrix_to_array(xform.mx_n)
+        self.co_world = transform_points(self.mx_p, self.co)
+        self.normal_world = transform_normals(self.mx_n, self.normal)
+
+    @profiler.function
+    def update_verts(self, bmverts):
+        '''
+        updates co / normal rows of given (moved) verts in place.  topology must be unchanged
+        since mirror was built.  returns mirror indices of updated verts
+        '''
+        indices = self.vert_indices(bmverts)
+        if not len(indices): return indices
+        bmvs = [self.bmverts[i] for i in indices.tolist()]
+        n = len(bmvs)
+        self.co[indices] = np.fromiter((c for bmv in bmvs for c in bmv.co), dtype=np.float64, count=n*3).reshape((n, 3))
+        self.normal[indices] = np.fromiter((c for bmv in bmvs for c in bmv.normal), dtype=np.float64, count=n*3).reshape((n, 3))
+        self.co_world[indices] = transform_points(self.mx_p, self.co[indices])
+        self.normal_world[indices] = transform_normals(self.mx_n, self.normal[indices])
+        self.serial += 1
+        self.moved_log = self.moved_log[-(self.moved_log_length - 1):] + [(self.serial, indices)]
+        return indices
+
+    def moved_since(self, serial):
+        '''
+        returns mirror indices of verts updated in place (see update_verts) after serial, or None
+        if that is too long ago to know
+        '''
+        if serial == self.serial: return np.empty(0, dtype=np.int64)
+        log = [indices for (s, indices) in self.moved_log if s > serial]
+        if len(log) != self.serial - serial: return None
+        return np.unique(np.concatenate(log))
+
+    @profiler.function
+    def update_selection(self):
+        nv, ne, nf = self.counts
+        self.vert_select = np.fromiter((bmv.select for bmv in self.bmverts), dtype=bool, count=nv)
+        self.edge_select = np.fromiter((bmedge.select for bmedge in self.bmedges), dtype=bool, count=ne)
+        self.face_select = np.fromiter((bmf.select for bmf in self.bmfaces), dtype=bool, count=nf)
+        self.vert_hide = np.fromiter((bmv.hide for bmv in self.bmverts), dtype=bool, count=nv)
+        self.edge_hide = np.fromiter((bmedge.hide for bmedge in self.bmedges), dtype=bool, count=ne)
+        self.face_hide = np.fromiter((bmf.hide for bmf in self.bmfaces), dtype=bool, count=nf)
+
+    ##########################################################
+
+    def is_stale(self):
+        ''' cheap check to catch geometry added / removed without dirtying RFMesh '''
+        bme = self.rfmesh.bme
+        return self.counts != (len(bme.verts), len(bme.edges), len(bme.faces))
+
+    def _indices(self, elems, lookup):
+        n = len(lookup)
+        unwrap = self.rfmesh._unwrap
+        indices = []
+        for elem in elems:
+            bmelem = unwrap(elem)
+            if not bmelem.is_valid: continue
+            i = bmelem.index
+            if 0 <= i < n and lookup[i] == bmelem: indices.append(i)
+        return np.array(indices, dtype=np.int64)
+
+    def vert_index(self, vert):
+        ''' returns index of vert in mirror, or -1 if vert is not mirrored (new, removed, etc.) '''
+        bmv = self.rfmesh._unwrap(vert)
+        if bmv is None or not bmv.is_valid: return -1
+        i = bmv.index
+        if 0 <= i < self.counts[0] and self.bmverts[i] == bmv: return i
+        return -1
+
+    def vert_indices(self, verts):
+        if verts is None: return np.arange(self.counts[0], dtype=np.int64)
+        return self._indices(verts, self.bmverts)
+
+    def edge_indices(self, edges):
+        if edges is None: return np.arange(self.counts[1], dtype=np.int64)
+        return self._indices(edges, self.bmedges)
+
+    def face_indices(self, faces):
+        if faces is None: return np.arange(self.counts[2], dtype=np.int64)
+        return self._indices(faces, self.bmfaces)
+
+    def face_vert_lists(self, face_indices):
+        ''' generator of vert index arrays for given faces '''
+        offsets, fverts = self.face_offsets, self.face_verts
+        for i in face_indices:
+            yield fverts[offsets[i]:offsets[i+1]]
+
+    def triangles(self, face_indices=None):
+        '''
+        returns (Tx3 vert indices, T face indices) of faces (fan-triangulating any non-triangles).
+        face_indices, if given, limits which faces are triangulated
+        '''
+        fo, fv = self.face_offsets, self.face_verts
+        counts = np.diff(fo)
+        if face_indices is None:
+            if np.all(counts == 3): return (fv.reshape((-1, 3)), np.arange(len(counts)))
+            face_indices = np.arange(len(counts))
+        # fan: triangle k of face f is (fv[o], fv[o+k+1], fv[o+k+2]) where o = fo[f]
+        ntris = np.maximum(counts[face_indices] - 2, 0)
+        tri_face = np.repeat(face_indices, ntris)
+        k = np.arange(int(ntris.sum())) - np.repeat(np.cumsum(ntris) - ntris, ntris)
+        o = fo[tri_face]
+        tris = np.stack((fv[o], fv[o + k + 1], fv[o + k + 2]), axis=1)
+        return (tris, tri_face)
+
+    @profiler.function
+    def build_adjacency(self):
+        '''
+        builds flat adjacency tables, if not built already.  these are built on demand, as
+        only crawls need them (see RFMesh._crawl_arrays); for RFSources, which never
+        change, they are built once.
+        - face_edges: edge index of each face corner, aligned with face_verts.  edge k of a
+          face goes from its vert k to vert k+1 (same order as BMFace.edges)
+        - vert_face_offsets, vert_faces: CSR of faces using each vert (BMVert.link_faces)
+        - edge_face_offsets, edge_faces: CSR of faces using each edge (BMEdge.link_faces)
+        '''
+        if self.face_edges is not None: return
+        nv, ne, nf = self.counts
+        fo, fv = self.face_offsets, self.face_verts
+        counts = np.diff(fo)
+        corner_face = np.repeat(np.arange(nf), counts)
+
+        # corner k+1 of each corner k, wrapping around within face
+        nxt = np.arange(len(fv)) + 1
+        nonempty = counts > 0
+        nxt[fo[1:][nonempty] - 1] = fo[:-1][nonempty]
+
+        # look up edges by (sorted) pair of vert indices
+        ev = self.edge_verts
+        ekeys = np.minimum(ev[:, 0], ev[:, 1]) * nv + np.maximum(ev[:, 0], ev[:, 1])
+        order = np.argsort(ekeys)
+        v0, v1 = fv, fv[nxt]
+        ckeys = np.minimum(v0, v1) * nv + np.maximum(v0, v1)
+        found = np.minimum(np.searchsorted(ekeys[order], ckeys), max(ne - 1, 0))
+        self.face_edges = order[found] if ne else np.zeros(0, dtype=np.int64)
+
+        self.vert_face_offsets, self.vert_faces = csr_invert(fv, corner_face, nv)
+        self.edge_face_offsets, self.edge_faces = csr_invert(self.face_edges, corner_face, ne)
+
+    @profiler.function
+    def build_flags(self):
+        '''
+        reads edge / face flags that only packed snapshots need (see rfmesh_snapshot.py), if not
+        read already: edge_seam, edge_smooth, face_smooth, face_material.
+        these change only along with a rebuild of the mirror (RFEdge.seam etc. go through
+        RFMesh._journal_untracked), so they are read once per mirror
+        '''
+        if self.edge_seam is not None: return
+        nv, ne, nf = self.counts
+        self.edge_seam = np.fromiter((bmedge.seam for bmedge in self.bmedges), dtype=bool, count=ne)
+        self.edge_smooth = np.fromiter((bmedge.smooth for bmedge in self.bmedges), dtype=bool, count=ne)
+        self.face_smooth = np.fromiter((bmf.smooth for bmf in self.bmfaces), dtype=bool, count=nf)
+        self.face_material = np.fromiter((bmf.material_index for bmf in self.bmfaces), dtype=np.int32, count=nf)
+
+    ##########################################################
+
+    def plane_distances(self, plane):
+        ''' signed distances of verts to plane (both local space) '''
+        return (self.co - np.array(plane.o)) @ np.array(plane.n)
+
+    def plane_crossing_faces(self, dists):
+        '''
+        returns indices of faces that have verts on both sides of (or touching) plane,
+        given signed distances of verts to plane (see plane_distances)
+        '''
+        fo, fv = self.face_offsets, self.face_verts
+        nonempty = np.flatnonzero(np.diff(fo) > 0)
+        if not len(nonempty): return nonempty
+        d = dists[fv]
+        dmin = np.minimum.reduceat(d, fo[nonempty])
+        dmax = np.maximum.reduceat(d, fo[nonempty])
+        return nonempty[(dmin <= 0) & (dmax >= 0)]
+
+    ##########################################################
+
+    def selected_vert_indices(self):
+        return np.flatnonzero(self.vert_select)
+
+    def selected_edge_indices(self):
+        return np.flatnonzero(self.edge_select)
+
+    def selected_face_indices(self):
+        return np.flatnonzero(self.face_select)
+
+    def nearest_vert(self, point, vert_indices=None):
+        ''' returns (index, distance) of vert nearest point (world), or (None, None) '''
+        if vert_indices is None: vert_indices = self.vert_indices(None)
+        if not len(vert_indices): return (None, None)
+        d = np.linalg.norm(self.co_world[vert_indices] - np.array(point), axis=1)
+        i = int(np.argmin(d))
+        return (int(vert_indices[i]), float(d[i]))
+
+    def verts_within(self, point, dist, vert_indices=None):
+        ''' returns (indices, distances) of verts within dist of point (world) '''
+        if vert_indices is None: vert_indices = self.vert_indices(None)
+        d = np.linalg.norm(self.co_world[vert_indices] - np.array(point), axis=1)
+        m = d <= dist
+        return (vert_indices[m], d[m])
+
+    def edge_distances(self, point, edge_indices=None):
+        ''' returns (edge indices, distances) from point (world) to edge segments '''
+        if edge_indices is None: edge_indices = self.edge_indices(None)
+        ev = self.edge_verts[edge_indices]
+        p0, p1 = self.co_world[ev[:, 0]], self.co_world[ev[:, 1]]
+        p = np.array(point)
+        v01 = p1 - p0
+        l2 = np.einsum('ij,ij->i', v01, v01)
+        t = np.einsum('ij,ij->i', p - p0, v01) / np.where(l2 == 0, 1, l2)
+        t = np.clip(t, 0, 1)
+        pp = p0 + v01 * t[:, None]
+        return (edge_indices, np.linalg.norm(p - pp, axis=1))
+
+    def selection_center(self):
+        ''' returns average of selected verts (local space), or None if none selected '''
+        sel = self.vert_select
+        if not sel.any(): return None
+        return self.co[sel].mean(axis=0)
+
+    def selection_bounds(self):
+        ''' returns (min, max) of selected verts (world space), or (None, None) if none selected '''
+        sel = self.vert_select
+        if not sel.any(): return (None, None)
+        co = self.co_world[sel]
+        return (co.min(axis=0), co.max(axis=0))
+
+
+class RFMeshProjection:
+    '''
+    screen-space projection of all verts in an RFMeshArrays for a single view.
+    see RetopoFlow_Target.get_target_projection()
+    '''
+
+    def __init__(self, arrays, view_key, xy, depth, valid):
+        self.arrays = arrays
+        self.view_key = view_key
+        self.serial = arrays.serial     # serial of arrays that projection reflects (see RFMeshArrays.update_verts)
+        self.xy = xy            # Nx2 region coords
+        self.depth = depth      # N distances from view origin (see RetopoFlow_Spaces.Point_to_depth)
+        self.valid = valid      # N bool; False if vert is behind view
+
+    def is_current(self, arrays, view_key):
+        ''' True if projection is of arrays and view (rows of verts moved since may still need update_verts) '''
+        return self.arrays is arrays and self.view_key == view_key
+
+    def update_verts(self, vert_indices, xy, depth, valid):
+        ''' updates projection of given (moved) verts, bringing projection up to date with arrays '''
+        self.xy[vert_indices] = xy
+        self.depth[vert_indices] = depth
+        self.valid[vert_indices] = valid
+        self.serial = self.arrays.serial
+
+    def Point2D(self, i):
+        if i < 0 or not self.valid[i]: return None
+        x, y = self.xy[i]
+        return Point2D((float(x), float(y)))
+
+    def vert_distances(self, xy, vert_indices):
+        ''' returns (vert indices, 2D distances) for projected verts (unprojectable verts are dropped) '''
+        vert_indices = vert_indices[self.valid[vert_indices]]
+        return (vert_indices, points2D_distances(xy, self.xy[vert_indices]))
+
+    def edge_distances(self, xy, edge_indices, shorten=0.0):
+        ''' returns (edge indices, 2D distances) for projected edges (unprojectable edges are dropped) '''
+        ev = self.arrays.edge_verts[edge_indices]
+        m = self.valid[ev[:, 0]] & self.valid[ev[:, 1]]
+        edge_indices, ev = edge_indices[m], ev[m]
+        return (edge_indices, segments2D_distances(xy, self.xy[ev[:, 0]], self.xy[ev[:, 1]], shorten=shorten))
+
+    def fresh_indices(self, verts):
+        '''
+        returns array of mirror indices for verts, with -1 for verts that are
+        either not mirrored or have moved since the mirror was built
+        '''
+        arrays = self.arrays
+        unwrap = arrays.rfmesh._unwrap
+        indices = np.fromiter((arrays.vert_index(v) for v in verts), dtype=np.int64, count=len(verts))
+        if not len(verts): return indices
+        cur = np.fromiter((c for v in verts for c in unwrap(v).co), dtype=np.float64, count=len(verts)*3).reshape((-1, 3))
+        known = indices >= 0
+        moved = np.zeros(len(verts), dtype=bool)
+        moved[known] = np.any(arrays.co[indices[known]] != cur[known], axis=1)
+        indices[moved] = -1
+        return indices
@@ -0,0 +1,140 @@
+'''
+Copyright (C) 2021 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import math
+from itertools import chain, product, repeat
+
+import numpy as np
+
+from .rfmesh_arrays import matrix_to_array
+from ...addon_common.common.profiler import profiler
+
+
+'''
+RFMeshVertGrid is a sparse uniform grid (spatial hash) of the BMVerts of an
+RFMesh, used for brush-radius queries (see RFMesh.nearest_bmverts_Point).
+
+Unlike KDTree, the grid is not rebuilt whenever RFMesh is dirtied.  Instead,
+it is kept up to date per vert:
+
+- RFVert.co setter calls RFMesh.vert_moved(), which (re)inserts the vert
+- RFMesh._elem_removing() removes a vert before it is removed from the bmesh,
+  while it still hashes as it did when inserted (removed BMVerts do not)
+
+so the cost of a query scales with the number of verts near the query point
+rather than with the size of the mesh.  Verts are binned by local position,
+so moving the object does not touch the grid.
+
+A (re)build bins all verts at once from the numpy mirror (RFMesh.get_arrays):
+cell keys are floored in bulk and sorted, and each run of equal keys becomes
+one cell.  Python only touches each vert once to fill the dicts.
+
+Changes made with bmesh.ops drop the grid (see RFMesh._journal_untracked).  As
+a safety net, RFMesh.get_vert_grid() also rebuilds the grid if the number of
+verts in the bmesh disagrees with the grid.
+'''
+
+
+class RFMeshVertGrid:
+    @profiler.function
+    def __init__(self, rfmesh, dist):
+        ''' dist is expected query radius (world), which determines cell size '''
+        self.rfmesh = rfmesh
+        self.xform = rfmesh.xform
+        # upper bound on how much world->local can stretch a distance
+        imx = matrix_to_array(self.xform.imx_p)
+        self.w2l_scale = float(np.linalg.norm(imx[:3, :3], 2))
+        self.cell_size = max(dist, 1e-6) * self.w2l_scale   # local space
+        self.cells = {}                 # cell key -> {BMVert}
+        self.vert_cell = {}             # BMVert -> cell key
+        self._build(rfmesh.get_arrays())
+
+    @profiler.function
+    def _build(self, arrays):
+        n = len(arrays.bmverts)
+        if not n: return
+        # same binning as _key, but over all verts at once
+        keys = np.floor(arrays.co / self.cell_size).astype(np.int64)
+        order = np.lexsort((keys[:, 2], keys[:, 1], keys[:, 0]))
+        keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, np.any(keys[1:] != keys[:-1], axis=1)])
+        counts = np.diff(np.r_[starts, n]).tolist()
+        ukeys = [tuple(k) for k in keys[starts].tolist()]
+        bmverts = arrays.bmverts
+        sorted_bmverts = [bmverts[i] for i in order.tolist()]
+        cells = self.cells
+        for key, i0, c in zip(ukeys, starts.tolist(), counts):
+            cells[key] = set(sorted_bmverts[i0:i0 + c])
+        self.vert_cell = dict(zip(sorted_bmverts, chain.from_iterable(map(repeat, ukeys, counts))))
+
+    def __len__(self):
+        return len(self.vert_cell)
+
+    def _key(self, co):
+        s = self.cell_size
+        return (math.floor(co[0] / s), math.floor(co[1] / s), math.floor(co[2] / s))
+
+    def fits(self, dist):
+        ''' returns True if grid cell size is reasonable for queries of radius dist (world) '''
+        r = dist * self.w2l_scale
+        return self.cell_size / 4 <= r <= self.cell_size * 4
+
+    def move(self, bmv):
+        ''' inserts bmv, or updates its cell if already in grid '''
+        key = self._key(bmv.co)
+        old = self.vert_cell.pop(bmv, None)
+        if old is not None:
+            # always pop and reinsert so that an invalid BMVert that compares
+            # equal to bmv (reused bmesh memory) is replaced by bmv
+            cell = self.cells[old]
+            cell.discard(bmv)
+            if old != key and not cell: del self.cells[old]
+        self.cells.setdefault(key, set()).add(bmv)
+        self.vert_cell[bmv] = key
+
+    insert = move
+
+    def remove(self, bmv):
+        key = self.vert_cell.pop(bmv, None)
+        if key is None: return
+        cell = self.cells[key]
+        cell.discard(bmv)
+        if not cell: del self.cells[key]
+
+    @profiler.function
+    def verts_within(self, point, dist):
+        ''' returns list of (BMVert, distance) for verts within dist of point (world) '''
+        l2w_point = self.xform.l2w_point
+        c = self.xform.w2l_point(point)
+        r = dist * self.w2l_scale
+        (x0, y0, z0) = self._key((c[0] - r, c[1] - r, c[2] - r))
+        (x1, y1, z1) = self._key((c[0] + r, c[1] + r, c[2] + r))
+        found = []
+        cells = self.cells
+        for key in product(range(x0, x1 + 1), range(y0, y1 + 1), range(z0, z1 + 1)):
+            cell = cells.get(key)
+            if not cell: continue
+            for bmv in cell:
+                # skip verts removed behind grid's back (grid is rebuilt once counts disagree)
+                if not bmv.is_valid: continue
+                d = (l2w_point(bmv.co) - point).length
+                if d <= dist: found.append((bmv, d))
+        return found
@@ -0,0 +1,476 @@
+'''
+Copyright (C) 2021 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from bmesh.types import BMVert, BMEdge, BMFace
+
+from .rfmesh_snapshot import RFTargetSnapshot, bmesh_layers, layer_value_get, layer_value_set
+from ...addon_common.common.profiler import profiler
+from ...config.options import options
+
+
+'''
+RFMeshJournal records the changes made to an RFTarget between undo checkpoints
+(see RetopoFlow_Undo), so that undo / redo replay the changes of an operation
+rather than copying the whole target for every undo_push.
+
+Each checkpoint opens an RFMeshJournalEntry, which records
+- elements created (RFTarget.new_vert/new_edge/new_face)
+- elements removed, along with enough data to recreate them (RFTarget.delete_*)
+- verts moved, with their coords and normal before first move (RFVert.co, RFVert.normal)
+- faces flipped (RFTarget.update_face_normal, etc.)
+- ids of elements selected when entry was opened (and when it was reverted, for redo)
+
+The data kept to recreate an element includes its values in each custom data
+layer of the bmesh (UVs and other loop layers for faces, vertex groups, crease,
+etc.; see rfmesh_snapshot.layer_value_get), so undoing a removal does not lose
+them.
+
+Elements are referred to by journal ids rather than BMElems, because undoing
+a removal (or redoing a creation) makes a new BMElem.  Only elements touched by
+the journal get an id.
+
+Changes that cannot be journaled (bmesh.ops, bmesh.utils, etc.) call
+RFTarget._journal_untracked() beforehand, which takes a full (packed, see
+rfmesh_snapshot.py) snapshot of the target and stops recording the entry.
+Reverting such an entry restores the snapshot and then reverts the changes
+recorded before it.  Snapshots carry the bmesh index of each id, so ids are
+remapped to the restored bmesh.
+
+Changes made behind the journal's back (ex: creating elements through bmesh
+directly) are caught by comparing element counts and by checking that the
+elements the entry refers to are still valid; see RFMeshJournal.is_intact.
+'''
+
+
+VERT, EDGE, FACE = 0, 1, 2
+elem_kinds = { BMVert: VERT, BMEdge: EDGE, BMFace: FACE }
+
+
+def select_exactly(bmvs, bmes, bmfs):
+    '''
+    selects exactly the given elements, assuming nothing is selected.  selecting a face (edge)
+    also selects its edges and verts (verts), which may not have been selected, so those are
+    deselected afterward.  returns lists of elements whose select was set
+    '''
+    extra_bmes = { bme for bmf in bmfs for bme in bmf.edges }.difference(bmes)
+    extra_bmvs = { bmv for bme in bmes for bmv in bme.verts }
+    extra_bmvs.update(bmv for bmf in bmfs for bmv in bmf.verts)
+    extra_bmvs.difference_update(bmvs)
+    for bmf in bmfs: bmf.select = True
+    for bme in bmes: bme.select = True
+    for bme in extra_bmes: bme.select = False
+    for bmv in bmvs: bmv.select = True
+    for bmv in extra_bmvs: bmv.select = False
+    return (bmfs, bmes, extra_bmes, bmvs, extra_bmvs)
+
+
+class RFMeshJournalEntry:
+    def __init__(self, action, counts, selection):
+        self.action = action
+        self.counts = counts        # element counts when entry was opened
+        self.delta = [0, 0, 0]      # change in element counts from created and removed
+        self.created = {}           # id -> kind, in order of creation
+        self.removed = []           # (kind, id, data), in order of removal
+        self.moved = {}             # vert id -> (co, normal) before first move
+        self.flipped = set()        # ids of faces with flipped winding
+        self.sel_before = selection # (vert ids, edge ids, face ids)
+        self.snapshot = None        # (RFTargetSnapshot, index map) taken before first untracked change
+
+        # filled when entry is reverted, so that it can be replayed (redo)
+        self.sel_after = None
+        self.created_data = None
+        self.moved_after = None
+        self.redo_snapshot = None
+
+    @property
+    def nbytes(self):
+        ''' approximate memory used '''
+        records = len(self.created) + len(self.removed) + len(self.moved) + len(self.flipped)
+        records += sum(map(len, self.sel_before))
+        if self.sel_after: records += sum(map(len, self.sel_after))
+        n = records * 100
+        for snapshot in (self.snapshot, self.redo_snapshot):
+            if snapshot: n += snapshot[0].nbytes
+        return n
+
+    def is_empty(self):
+        return not (self.created or self.removed or self.moved or self.flipped or self.snapshot)
+
+
+class RFMeshJournal:
+    def __init__(self, rftarget):
+        self.rftarget = None
+        self.next_id = 0
+        self.entry = None       # entry currently recording
+        self.paused = False     # True while journal is replaying
+        self.attach(rftarget)
+
+    def attach(self, rftarget, index_map=None):
+        '''
+        starts journaling rftarget.  index_map (see snapshot) maps ids to elements of rftarget;
+        without it, all ids are forgotten
+        '''
+        if self.rftarget is not None and self.rftarget._journal is self:
+            self.rftarget._journal = None
+        self.rftarget = rftarget
+        rftarget._journal = self
+        self._update_layers()
+        self.elem_id = {}       # BMElem -> id
+        self.id_elem = {}       # id -> BMElem
+        if index_map:
+            rftarget.ensure_lookup_tables()
+            bme = rftarget.bme
+            seqs = (bme.verts, bme.edges, bme.faces)
+            for (i, (kind, index)) in index_map.items():
+                self._map(seqs[kind][index], i)
+
+    def detach(self):
+        if self.rftarget is not None and self.rftarget._journal is self:
+            self.rftarget._journal = None
+        self.rftarget = None
+        self.entry = None
+
+    ##########################################################
+    # ids
+
+    def _map(self, bmelem, i):
+        self.elem_id[bmelem] = i
+        self.id_elem[i] = bmelem
+
+    def _forget(self, bmelem):
+        i = self.elem_id.pop(bmelem, None)
+        if i is not None and self.id_elem.get(i) is bmelem: del self.id_elem[i]
+
+    def id_of(self, bmelem):
+        i = self.elem_id.get(bmelem)
+        # a stale key (element removed without journal knowing) can compare equal to a new element
+        if i is None or self.id_elem.get(i) is not bmelem:
+            i = self.next_id
+            self.next_id += 1
+            self._map(bmelem, i)
+        return i
+
+    def elem(self, i):
+        bmelem = self.id_elem.get(i)
+        return bmelem if bmelem is not None and bmelem.is_valid else None
+
+    ##########################################################
+    # custom data layers
+
+    def _update_layers(self):
+        ''' caches custom data layers of target, by domain (layers are added / removed by untracked changes only) '''
+        self.layers = { 'verts': [], 'edges': [], 'faces': [], 'loops': [] }
+        for (domain, kind, name, layer) in bmesh_layers(self.rftarget.bme):
+            self.layers[domain].append((kind, name, layer))
+
+    def _layer_values(self, domain, bmelem):
+        ''' returns values of bmelem in each custom data layer, as tuple of (kind, name, value) '''
+        values = []
+        for (kind, name, layer) in self.layers[domain]:
+            try:
+                values.append((kind, name, layer_value_get(kind, bmelem[layer])))
+            except NotImplementedError:
+                # layer type cannot be accessed from Python
+                pass
+        return tuple(values)
+
+    def _set_layer_values(self, domain, bmelem, values):
+        if not values: return
+        layers = getattr(self.rftarget.bme, domain).layers
+        for (kind, name, value) in values:
+            layer = getattr(layers, kind).get(name)
+            if layer is not None: layer_value_set(bmelem, layer, kind, value)
+
+    ##########################################################
+    # recording
+
+    def counts(self):
+        bme = self.rftarget.bme
+        return (len(bme.verts), len(bme.edges), len(bme.faces))
+
+    def selection_ids(self):
+        index = self.rftarget.get_selection_index()
+        id_of = self.id_of
+        return tuple(
+            frozenset(id_of(bmelem) for bmelem in bmelems if bmelem.is_valid)
+            for bmelems in (index.verts, index.edges, index.faces)
+        )
+
+    @profiler.function
+    def open(self, action):
+        ''' starts recording new entry '''
+        self._update_layers()
+        self.entry = RFMeshJournalEntry(action, self.counts(), self.selection_ids())
+        return self.entry
+
+    def _recording(self):
+        entry = self.entry
+        if entry is None or self.paused or entry.snapshot is not None: return None
+        return entry
+
+    def is_intact(self, entry=None):
+        '''
+        returns False if changes were made behind journal's back: element counts do not agree
+        with recorded changes, or an element the entry refers to is no longer valid (ex: merged
+        into another, which counts alone miss when an element was also created)
+        '''
+        entry = entry or self.entry
+        if entry is None or entry.snapshot is not None: return True
+        if self.counts() != tuple(c + d for (c, d) in zip(entry.counts, entry.delta)): return False
+        refs = set(entry.created)
+        refs.update(entry.moved)
+        refs.update(entry.flipped)
+        for ids in entry.sel_before: refs.update(ids)
+        for (kind, _, data) in entry.removed:
+            if kind == EDGE: refs.update(data[:2])
+            elif kind == FACE: refs.update(data[0])
+        refs.difference_update(i for (_, i, _) in entry.removed)
+        return all(self.elem(i) is not None for i in refs)
+
+    def created(self, bmelem):
+        entry = self._recording()
+        if not entry: return
+        kind = elem_kinds[type(bmelem)]
+        entry.created[self.id_of(bmelem)] = kind
+        entry.delta[kind] += 1
+
+    def changing(self, bmv):
+        ''' call before co or normal of bmv changes '''
+        entry = self._recording()
+        if not entry: return
+        i = self.id_of(bmv)
+        if i in entry.created or i in entry.moved: return
+        entry.moved[i] = (tuple(bmv.co), tuple(bmv.normal))
+
+    def flipping(self, bmf):
+        ''' call before winding of bmf is flipped '''
+        entry = self._recording()
+        if not entry: return
+        i = self.id_of(bmf)
+        if i in entry.created: return
+        entry.flipped ^= {i}
+
+    def removing(self, bmelem):
+        ''' call before bmelem is removed.  removing a vert (edge) also removes its linked edges and faces (faces) '''
+        kind = elem_kinds[type(bmelem)]
+        removed = []
+        if kind == VERT:
+            removed += [(FACE, bmf) for bmf in bmelem.link_faces]
+            removed += [(EDGE, bme) for bme in bmelem.link_edges]
+        elif kind == EDGE:
+            removed += [(FACE, bmf) for bmf in bmelem.link_faces]
+        removed += [(kind, bmelem)]
+        entry = self._recording()
+        for (kind, bmelem) in removed:
+            if entry:
+                i = self.id_of(bmelem)
+                data = self.capture(kind, bmelem)
+                entry.delta[kind] -= 1
+                if i in entry.created: del entry.created[i]
+                else: entry.removed.append((kind, i, data))
+            self._forget(bmelem)
+
+    @profiler.function
+    def untracked(self):
+        '''
+        call before a change that cannot be journaled.  the snapshot is copied synchronously, which
+        is cheap only while the arrays mirror of the target is in sync (see rfmesh_snapshot.py)
+        '''
+        entry = self._recording()
+        if not entry: return
+        entry.snapshot = self.snapshot()
+
+    ##########################################################
+    # snapshots
+
+    @profiler.function
+    def index_map(self):
+        ''' returns dict mapping each id to (kind, bmesh index) of its element '''
+        bme = self.rftarget.bme
+        bme.verts.index_update()
+        bme.edges.index_update()
+        bme.faces.index_update()
+        return {
+            i: (elem_kinds[type(bmelem)], bmelem.index)
+            for (i, bmelem) in self.id_elem.items()
+            if bmelem.is_valid
+        }
+
+    @profiler.function
+    def snapshot(self):
+        ''' returns packed copy of target, along with bmesh index of each id '''
+        index_map = self.index_map()
+        rftsnapshot = RFTargetSnapshot(
+            self.rftarget, live=False,
+            compress=options['undo compress'], background=options['undo background packing'],
+        )
+        return (rftsnapshot, index_map)
+
+    def _restore(self, snapshot):
+        # snapshot is not consumed, as entry may be reverted / replayed again
+        rftsnapshot, index_map = snapshot
+        self.attach(rftsnapshot.restore(), index_map)
+
+    ##########################################################
+    # replaying
+
+    def capture(self, kind, bmelem):
+        '''
+        returns data needed to recreate bmelem.  custom data layer values come last (for faces,
+        followed by values of each loop, in verts order)
+        '''
+        if kind == VERT:
+            return (tuple(bmelem.co), tuple(bmelem.normal), self._layer_values('verts', bmelem))
+        if kind == EDGE:
+            bmv0, bmv1 = bmelem.verts
+            return (self.id_of(bmv0), self.id_of(bmv1), bmelem.seam, bmelem.smooth, self._layer_values('edges', bmelem))
+        return (
+            tuple(self.id_of(bmv) for bmv in bmelem.verts), bmelem.smooth, bmelem.material_index,
+            self._layer_values('faces', bmelem),
+            tuple(self._layer_values('loops', bml) for bml in bmelem.loops) if self.layers['loops'] else (),
+        )
+
+    def _create(self, kind, i, data):
+        rftarget = self.rftarget
+        bme = rftarget.bme
+        if kind == VERT:
+            bmelem = bme.verts.new(data[0])
+            bmelem.normal = data[1]
+            self._set_layer_values('verts', bmelem, data[2])
+            rftarget.vert_moved(bmelem)
+        elif kind == EDGE:
+            bmelem = bme.edges.new((self.elem(data[0]), self.elem(data[1])))
+            bmelem.seam, bmelem.smooth = data[2], data[3]
+            self._set_layer_values('edges', bmelem, data[4])
+        else:
+            bmelem = bme.faces.new([self.elem(v) for v in data[0]])
+            bmelem.smooth, bmelem.material_index = data[1], data[2]
+            self._set_layer_values('faces', bmelem, data[3])
+            # loops of new face start at its first vert, so they are in same order as captured
+            for (bml, values) in zip(bmelem.loops, data[4]):
+                self._set_layer_values('loops', bml, values)
+            bmelem.normal_update()
+        rftarget._elem_created(bmelem)
+        self._map(bmelem, i)
+
+    def _remove(self, kind, i):
+        bmelem = self.elem(i)
+        if bmelem is None: return
+        rftarget = self.rftarget
+        rftarget._elem_removing(bmelem)
+        if kind == VERT:
+            rftarget.bme.verts.remove(bmelem)
+        elif kind == EDGE:
+            rftarget.bme.edges.remove(bmelem)
+        else:
+            rftarget.bme.faces.remove(bmelem)
+
+    def _move(self, moved):
+        rftarget = self.rftarget
+        bmfs = set()
+        for (i, (co, normal)) in moved.items():
+            bmv = self.elem(i)
+            if bmv is None: continue
+            bmv.co = co
+            bmv.normal = normal
+            rftarget.vert_moved(bmv)
+            bmfs.update(bmv.link_faces)
+        for bmf in bmfs: bmf.normal_update()
+
+    def _flip(self, flipped):
+        rftarget = self.rftarget
+        for i in flipped:
+            bmf = self.elem(i)
+            if not bmf: continue
+            rftarget._face_flipping(bmf)
+            bmf.normal_flip()
+
+    def _select(self, selection):
+        rftarget = self.rftarget
+        rftarget.deselect_all()
+        elem = self.elem
+        bmvs, bmes, bmfs = (
+            [bmelem for bmelem in map(elem, ids) if bmelem is not None]
+            for ids in selection
+        )
+        update = rftarget._selection_update
+        for bmelems in select_exactly(bmvs, bmes, bmfs):
+            for bmelem in bmelems: update(bmelem)
+
+    def _dirty(self):
+        ''' dirties target, keeping selection index (kept in sync while replaying) '''
+        rftarget = self.rftarget
+        index = rftarget._selection_index
+        synced = index is not None and index.version == rftarget._version_selection
+        rftarget.dirty()
+        if synced: index.version = rftarget._version_selection
+
+    @profiler.function
+    def revert(self, entry):
+        '''
+        undoes changes recorded in entry, which must be the latest entry (target is in state
+        right after entry).  also captures what is needed to replay entry (see replay)
+        '''
+        self.paused = True
+        try:
+            if entry.snapshot is not None:
+                entry.redo_snapshot = self.snapshot()
+                self._restore(entry.snapshot)
+            else:
+                entry.redo_snapshot = None
+                entry.sel_after = self.selection_ids()
+                entry.created_data = [
+                    (kind, i, self.capture(kind, self.elem(i)))
+                    for (i, kind) in entry.created.items()
+                    if self.elem(i) is not None
+                ]
+                entry.moved_after = {
+                    i: (tuple(bmv.co), tuple(bmv.normal))
+                    for i in entry.moved
+                    for bmv in [self.elem(i)] if bmv is not None
+                }
+            for (i, kind) in reversed(list(entry.created.items())): self._remove(kind, i)
+            for (kind, i, data) in reversed(entry.removed): self._create(kind, i, data)
+            self._move(entry.moved)
+            self._flip(entry.flipped)
+            self._select(entry.sel_before)
+            self._dirty()
+        finally:
+            self.paused = False
+        if self.entry is entry: self.entry = None
+
+    @profiler.function
+    def replay(self, entry):
+        ''' redoes changes of entry, which must have been reverted last '''
+        self.paused = True
+        try:
+            if entry.redo_snapshot is not None:
+                self._restore(entry.redo_snapshot)
+                self._dirty()
+                return
+            for (kind, i, _) in entry.removed: self._remove(kind, i)
+            for (kind, i, data) in entry.created_data: self._create(kind, i, data)
+            self._move(entry.moved_after)
+            self._flip(entry.flipped)
+            self._select(entry.sel_after)
+            self._dirty()
+        finally:
+            self.paused = False
@@ -0,0 +1,169 @@
+'''
+Copyright (C) 2021 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import numpy as np
+
+from .rfmesh_arrays import matrix_to_array
+from ...addon_common.common.profiler import profiler
+
+
+'''
+RFMeshRaster is a small CPU rasterizer of RFMeshArrays faces for a single view,
+shared by the screen-space buffers:
+
+- RFSourcesDepthBuffer (rfmesh_sources.py): nearest depth of sources per pixel
+- RFMeshFaceBuffer: index of nearest (visible) target face per pixel
+
+Pixels are sampled at their centers, depth is eye depth (distance along view
+direction) interpolated perspective-correctly, and triangles that cross the
+near clip plane are skipped.
+'''
+
+
+class RFMeshRaster:
+    def __init__(self, view_matrix, perspective_matrix, is_perspective, width, height):
+        self.view = matrix_to_array(view_matrix)
+        self.persp = matrix_to_array(perspective_matrix)
+        self.is_perspective = is_perspective
+        self.width, self.height = width, height
+
+    def _project(self, co):
+        '''
+        returns (region x, region y, 1/w, eye depth, clip coords) for Nx3 world points.
+        x, y, 1/w are only meaningful where w > 0
+        '''
+        co4 = np.hstack((co, np.ones((len(co), 1))))
+        clip = co4 @ self.persp.T
+        w = clip[:, 3]
+        iw = 1.0 / np.where(w > 0, w, 1)
+        hw, hh = self.width / 2, self.height / 2
+        x = hw + hw * clip[:, 0] * iw
+        y = hh + hh * clip[:, 1] * iw
+        eye = -(co4 @ self.view[2])
+        return (x, y, iw, eye, clip)
+
+    def _fragments(self, co_world, tris):
+        '''
+        generator of (flat pixel indices, eye depths, triangle indices) covered by triangles
+        tris (Tx3 indices into Nx3 world points co_world), in chunks
+        '''
+        W, H = self.width, self.height
+        if not len(tris): return
+        x, y, iw, eye, clip = self._project(co_world)
+        valid = (clip[:, 3] > 0) & (clip[:, 2] >= -clip[:, 3])     # in front of near clip plane
+        tri_ids = np.flatnonzero(valid[tris].all(axis=1))
+        tris = tris[tri_ids]
+        tx, ty = x[tris], y[tris]                               # Tx3 region coords
+        tiw, tew = iw[tris], (eye * iw)[tris]                   # interpolated perspective-correctly
+
+        # range of pixels whose centers (i + 0.5) may be covered
+        x0 = np.maximum(np.ceil(tx.min(axis=1) - 0.5), 0)
+        x1 = np.minimum(np.floor(tx.max(axis=1) - 0.5), W - 1)
+        y0 = np.maximum(np.ceil(ty.min(axis=1) - 0.5), 0)
+        y1 = np.minimum(np.floor(ty.max(axis=1) - 0.5), H - 1)
+        area = (tx[:, 1] - tx[:, 0]) * (ty[:, 2] - ty[:, 0]) - (ty[:, 1] - ty[:, 0]) * (tx[:, 2] - tx[:, 0])
+        keep = (x0 <= x1) & (y0 <= y1) & (area != 0)
+        tri_ids, tx, ty, tiw, tew, area = tri_ids[keep], tx[keep], ty[keep], tiw[keep], tew[keep], area[keep]
+        x0, x1, y0, y1 = x0[keep].astype(np.int64), x1[keep].astype(np.int64), y0[keep].astype(np.int64), y1[keep].astype(np.int64)
+        if not len(tx): return
+
+        # bucket triangles by (power of two) pixel extent so each bucket is a single broadcast
+        size = np.maximum(x1 - x0, y1 - y0) + 1
+        bucket = np.left_shift(1, np.ceil(np.log2(size)).astype(np.int64))
+        for S in np.unique(bucket).tolist():
+            in_bucket = np.flatnonzero(bucket == S)
+            chunk = max(1, (1 << 20) // (S * S))
+            offs = np.arange(S)
+            for c in range(0, len(in_bucket), chunk):
+                t = in_bucket[c:c+chunk]
+                px = x0[t, None, None] + offs[None, None, :]
+                py = y0[t, None, None] + offs[None, :, None]
+                cx, cy = px + 0.5, py + 0.5
+                ax, bx, cx_ = (tx[t, i, None, None] for i in range(3))
+                ay, by, cy_ = (ty[t, i, None, None] for i in range(3))
+                a = area[t, None, None]
+                b0 = ((cx_ - bx) * (cy - by) - (cy_ - by) * (cx - bx)) / a
+                b1 = ((ax - cx_) * (cy - cy_) - (ay - cy_) * (cx - cx_)) / a
+                b2 = 1.0 - b0 - b1
+                eps = -1e-6
+                inside = (b0 >= eps) & (b1 >= eps) & (b2 >= eps) & (px <= x1[t, None, None]) & (py <= y1[t, None, None])
+                if not inside.any(): continue
+                iwi = b0 * tiw[t, 0, None, None] + b1 * tiw[t, 1, None, None] + b2 * tiw[t, 2, None, None]
+                ewi = b0 * tew[t, 0, None, None] + b1 * tew[t, 1, None, None] + b2 * tew[t, 2, None, None]
+                d = ewi / iwi
+                flat = np.broadcast_to(py * W + px, inside.shape)
+                tid = np.broadcast_to(tri_ids[t, None, None], inside.shape)
+                yield (flat[inside], d[inside], tid[inside])
+
+
+class RFMeshFaceBuffer(RFMeshRaster):
+    '''
+    CPU face-ID buffer of (visible) target faces rasterized at viewport resolution, so
+    finding the face under a point is a single pixel lookup rather than a 2D containment
+    test per face (see RetopoFlow_Target.accel_nearest2D_face), and finding the faces under
+    a brush is a scan of the pixels in its window (see RetopoFlow_Target.nearest2D_faces).
+
+    Each pixel stores the mirror index (see RFMeshArrays) of the nearest face covering the
+    pixel center, or -1 if uncovered.
+    '''
+
+    @profiler.function
+    def __init__(self, arrays, face_indices, view_matrix, perspective_matrix, is_perspective, width, height):
+        super().__init__(view_matrix, perspective_matrix, is_perspective, width, height)
+        self.arrays = arrays
+        depth = np.full(width * height, np.inf)
+        ids = np.full(width * height, -1, dtype=np.int64)
+        tris, tri_face = arrays.triangles(face_indices)
+        for (pix, d, tid) in self._fragments(arrays.co_world, tris):
+            # nearest fragment per pixel within chunk, then depth test against buffer
+            order = np.lexsort((d, pix))
+            pix, d, tid = pix[order], d[order], tid[order]
+            first = np.ones(len(pix), dtype=bool)
+            first[1:] = pix[1:] != pix[:-1]
+            pix, d, tid = pix[first], d[first], tid[first]
+            closer = d < depth[pix]
+            depth[pix[closer]] = d[closer]
+            ids[pix[closer]] = tri_face[tid[closer]]
+        self.depth = depth
+        self.ids = ids
+
+    def face_at(self, x, y):
+        ''' returns mirror index of face covering region point (x, y), or -1 '''
+        W, H = self.width, self.height
+        px, py = int(np.floor(x)), int(np.floor(y))
+        if px < 0 or py < 0 or px >= W or py >= H: return -1
+        return int(self.ids[py * W + px])
+
+    def faces_within(self, x, y, radius):
+        '''
+        returns unique mirror indices of faces covering pixels whose centers are within radius of
+        region point (x, y) (brush window).  pixel under (x, y) always counts, so radius 0 gives
+        same face as face_at
+        '''
+        W, H = self.width, self.height
+        x0, x1 = max(0, int(np.floor(x - radius))), min(W - 1, int(np.floor(x + radius)))
+        y0, y1 = max(0, int(np.floor(y - radius))), min(H - 1, int(np.floor(y + radius)))
+        if x0 > x1 or y0 > y1: return np.empty(0, dtype=np.int64)
+        px, py = np.meshgrid(np.arange(x0, x1 + 1), np.arange(y0, y1 + 1))
+        inside = (px + 0.5 - x) ** 2 + (py + 0.5 - y) ** 2 <= radius * radius
+        inside |= (px == int(np.floor(x))) & (py == int(np.floor(y)))
+        ids = self.ids.reshape((H, W))[y0:y1+1, x0:x1+1][inside]
+        return np.unique(ids[ids >= 0])
@@ -0,0 +1,372 @@
+'''
+Copyright (C) 2021 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import os
+import json
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .rfmesh_journal import VERT, EDGE, FACE, select_exactly
+from .rfmesh_snapshot import capture_buffers, capture_target_buffers, serialize_buffers, deserialize_buffers, bmesh_from_buffers
+from ...addon_common.common.profiler import profiler
+from ...config.options import options
+
+
+'''
+RFTargetRecovery writes an append-only journal of the edits made to an
+RFTarget to disk, so that RetopoFlow work can be recovered after a crash
+without saving the whole .blend file (see RetopoFlow_BlenderSave).
+
+The file starts with an info record (json; target object name, etc.) and a
+checkpoint record (the packed target, see rfmesh_snapshot.py, along with the
+bmesh index of each RFMeshJournal id), followed by one delta record per undo
+step.  A delta is built from the RFMeshJournalEntry of the step when the next
+step starts (see RetopoFlow_Undo._create_state), and holds
+- ids of removed elements
+- ids and data of created verts, edges, faces
+- ids and final coords of moved verts
+- ids of flipped faces
+- ids of selected elements (only if selection changed)
+
+Deltas can only refer to ids the file knows about (ids in the checkpoint or
+created by an earlier delta).  If a step touches any other element, or the
+step could not be journaled (entry has snapshot), or after undo / redo, a new
+checkpoint is written instead.  A checkpoint is also written every
+options['recovery checkpoint interval'] deltas to keep the file compact.
+Checkpoints start a new file, which is written next to the old one and then
+renamed over it, so the file on disk is always complete up to its last record.
+
+All file writing (and compressing of checkpoints) is done on a worker thread,
+in order of submission.  replay_recovery() rebuilds a bmesh from the file; a
+truncated last record (crash while writing) is ignored.
+
+Target-only auto saves (see RetopoFlow_BlenderSave.save_backup) use the same
+file format, but hold only the info record and a single checkpoint (with no
+ids), so replay_recovery() reads them, too.
+
+Note: only geometry and select / hide / seam / smooth / material flags are
+recorded, not custom data layers (ex: UVs).  Writing a replayed bmesh into a
+mesh would drop the mesh's layers, so RetopoFlow_BlenderSave._recover_target
+refuses to recover into a target that has any.
+'''
+
+
+magic = b'RFJ1'
+record_header = struct.Struct('<BI')    # record type, payload length
+array_header = struct.Struct('<3sI')    # dtype (ex: b'<i8'), item count
+RECORD_INFO, RECORD_CHECKPOINT, RECORD_DELTA = 0, 1, 2
+
+
+def pack_arrays(arrays):
+    parts = [struct.pack('<I', len(arrays))]
+    for arr in arrays:
+        arr = np.ascontiguousarray(arr)
+        parts += [array_header.pack(arr.dtype.str.encode('ascii'), arr.size), arr.tobytes()]
+    return b''.join(parts)
+
+
+def unpack_arrays(data):
+    (count,) = struct.unpack_from('<I', data)
+    offset = 4
+    arrays = []
+    for _ in range(count):
+        dtype, size = array_header.unpack_from(data, offset)
+        offset += array_header.size
+        arr = np.frombuffer(data, dtype=np.dtype(dtype.decode('ascii')), count=size, offset=offset)
+        offset += arr.nbytes
+        arrays.append(arr)
+    return arrays
+
+
+def pack_record(kind, payload):
+    return record_header.pack(kind, len(payload)) + payload
+
+
+def _ids(ids):
+    return np.fromiter(ids, dtype=np.int64)
+
+
+# functions below are run on worker thread, so must not be profiled
+
+def _write_checkpoint(filepath, info, buffers, index_arrays, compress):
+    mesh = serialize_buffers(buffers, compress=compress)
+    payload = pack_arrays([np.frombuffer(mesh, dtype=np.uint8), np.array([compress], dtype=np.uint8)] + index_arrays)
+    filepath_tmp = '%s.tmp' % filepath
+    with open(filepath_tmp, 'wb') as f:
+        f.write(magic)
+        f.write(pack_record(RECORD_INFO, info))
+        f.write(pack_record(RECORD_CHECKPOINT, payload))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(filepath_tmp, filepath)
+
+def _append_record(filepath, record):
+    with open(filepath, 'ab') as f:
+        f.write(record)
+
+
+# single worker, so target auto saves are written in order.
+# created when first needed, and shut down when add-on is unregistered (see shutdown_backup_executor)
+backup_executor = None
+
+
+def get_backup_executor():
+    global backup_executor
+    if backup_executor is None: backup_executor = ThreadPoolExecutor(max_workers=1)
+    return backup_executor
+
+
+def shutdown_backup_executor():
+    ''' waits for pending target auto saves to be written and stops worker thread (called when add-on is unregistered) '''
+    global backup_executor
+    if backup_executor is None: return
+    backup_executor.shutdown(wait=True)
+    backup_executor = None
+
+
+@profiler.function
+def save_target_backup(filepath, info, bme, compress=True):
+    '''
+    writes bme and info (json) to filepath as a recovery file with a single checkpoint.  bme is
+    captured right away, but the file is written on a worker thread.  returns future of write
+    '''
+    buffers = capture_buffers(bme)
+    index_arrays = [_ids(()), np.zeros(0, dtype=np.uint8), _ids(())]
+    info = json.dumps(info).encode('utf-8')
+    return get_backup_executor().submit(_write_checkpoint, filepath, info, buffers, index_arrays, compress)
+
+
+class RFTargetRecovery:
+    def __init__(self, filepath, info):
+        self.filepath = filepath
+        self.info = json.dumps(info).encode('utf-8')
+        self.journal = None         # RFMeshJournal whose ids the file uses
+        self.known = set()          # ids the file knows about
+        self.selection = None       # last selection written
+        self.deltas = 0             # deltas written since checkpoint
+        self.stale = True           # True: file does not match target, so next record writes checkpoint
+        self.error = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def _submit(self, fn, *args):
+        if self.error:
+            print(f'RetopoFlow: could not write recovery journal {self.filepath}: {self.error}')
+            print(f'RetopoFlow: recovery journal is disabled')
+            self.executor = None
+        if not self.executor: return
+        self.executor.submit(fn, *args).add_done_callback(self._done)
+
+    def _done(self, future):
+        # called on worker thread
+        if future.exception(): self.error = future.exception()
+
+    def mark_stale(self):
+        self.stale = True
+
+    @profiler.function
+    def checkpoint(self, journal):
+        ''' starts new file with checkpoint of journal's target '''
+        if not self.executor: return
+        index_map = journal.index_map()
+        index_arrays = [
+            _ids(index_map.keys()),
+            np.array([kind for (kind, _) in index_map.values()], dtype=np.uint8),
+            np.array([index for (_, index) in index_map.values()], dtype=np.int64),
+        ]
+        buffers = capture_target_buffers(journal.rftarget)
+        self._submit(_write_checkpoint, self.filepath, self.info, buffers, index_arrays, options['undo compress'])
+        self.journal = journal
+        self.known = set(index_map)
+        self.selection = None
+        self.deltas = 0
+        self.stale = False
+
+    @profiler.function
+    def record(self, journal, entry):
+        '''
+        writes changes recorded in entry, which must be the latest entry (target is in state
+        right after entry)
+        '''
+        if not self.executor: return
+        if self.stale or journal is not self.journal or entry is None or entry.snapshot is not None:
+            return self.checkpoint(journal)
+        if self.deltas >= options['recovery checkpoint interval']:
+            return self.checkpoint(journal)
+
+        elem = journal.elem
+        created = { VERT: [], EDGE: [], FACE: [] }
+        for (i, kind) in entry.created.items():
+            bmelem = elem(i)
+            if bmelem is not None: created[kind].append((i, journal.capture(kind, bmelem)))
+        removed = [(kind, i) for (kind, i, _) in entry.removed]
+        moved = [(i, bmv) for i in entry.moved for bmv in [elem(i)] if bmv is not None]
+        flipped = [i for i in entry.flipped if elem(i) is not None]
+        selection = journal.selection_ids()
+        if selection == self.selection: selection = None
+
+        # all referenced elements must be known by file
+        refs = { i for (_, i) in removed }
+        refs.update(i for (i, _) in moved)
+        refs.update(flipped)
+        for (_, data) in created[EDGE]: refs.update(data[:2])
+        for (_, data) in created[FACE]: refs.update(data[0])
+        if selection: refs.update(i for ids in selection for i in ids)
+        known = self.known.union(entry.created)
+        if not refs.issubset(known):
+            return self.checkpoint(journal)
+
+        cverts, cedges, cfaces = created[VERT], created[EDGE], created[FACE]
+        payload = pack_arrays([
+            np.array([kind for (kind, _) in removed], dtype=np.uint8),
+            _ids(i for (_, i) in removed),
+            _ids(i for (i, _) in cverts),
+            np.array([data[0] for (_, data) in cverts], dtype=np.float32).reshape(-1),
+            np.array([data[1] for (_, data) in cverts], dtype=np.float32).reshape(-1),
+            _ids(i for (i, _) in cedges),
+            _ids(v for (_, data) in cedges for v in data[:2]),
+            np.array([data[2] for (_, data) in cedges], dtype=bool),
+            np.array([data[3] for (_, data) in cedges], dtype=bool),
+            _ids(i for (i, _) in cfaces),
+            np.array([len(data[0]) for (_, data) in cfaces], dtype=np.int32),
+            _ids(v for (_, data) in cfaces for v in data[0]),
+            np.array([data[1] for (_, data) in cfaces], dtype=bool),
+            np.array([data[2] for (_, data) in cfaces], dtype=np.int32),
+            _ids(i for (i, _) in moved),
+            np.array([tuple(bmv.co) for (_, bmv) in moved], dtype=np.float32).reshape(-1),
+            np.array([tuple(bmv.normal) for (_, bmv) in moved], dtype=np.float32).reshape(-1),
+            _ids(flipped),
+            np.array([selection is not None], dtype=bool),
+        ] + [_ids(ids) for ids in (selection or ((), (), ()))])
+        self._submit(_append_record, self.filepath, pack_record(RECORD_DELTA, payload))
+
+        self.known = known.difference(i for (_, i) in removed)
+        if selection is not None: self.selection = selection
+        self.deltas += 1
+
+    def done(self):
+        ''' waits for all writing to finish '''
+        if self.executor: self.executor.shutdown(wait=True)
+        self.executor = None
+
+
+##########################################################
+# replaying
+
+def _replay_checkpoint(payload):
+    arrays = unpack_arrays(payload)
+    mesh, compressed, ids, kinds, indices = arrays
+    bme = bmesh_from_buffers(deserialize_buffers(mesh.tobytes(), compressed=bool(compressed[0])))
+    seqs = (bme.verts, bme.edges, bme.faces)
+    for seq in seqs: seq.ensure_lookup_table()
+    id_elem = {
+        i: seqs[kind][index]
+        for (i, kind, index) in zip(ids.tolist(), kinds.tolist(), indices.tolist())
+    }
+    return (bme, id_elem)
+
+def _replay_delta(bme, id_elem, selected, payload):
+    (
+        rkinds, rids,
+        vids, vco, vnorm,
+        eids, everts, eseam, esmooth,
+        fids, fcounts, fverts, fsmooth, fmaterial,
+        mids, mco, mnorm,
+        flipped,
+        has_selection, sel_vids, sel_eids, sel_fids,
+    ) = unpack_arrays(payload)
+
+    def elem(i):
+        bmelem = id_elem.get(i)
+        return bmelem if bmelem is not None and bmelem.is_valid else None
+
+    seqs = (bme.verts, bme.edges, bme.faces)
+    for (kind, i) in zip(rkinds.tolist(), rids.tolist()):
+        bmelem = elem(i)
+        if bmelem is not None: seqs[kind].remove(bmelem)
+        id_elem.pop(i, None)
+
+    for (i, co, norm) in zip(vids.tolist(), vco.reshape((-1, 3)).tolist(), vnorm.reshape((-1, 3)).tolist()):
+        bmv = bme.verts.new(co)
+        bmv.normal = norm
+        id_elem[i] = bmv
+    for (i, (v0, v1), seam, smooth) in zip(eids.tolist(), everts.reshape((-1, 2)).tolist(), eseam.tolist(), esmooth.tolist()):
+        bmedge = bme.edges.new((elem(v0), elem(v1)))
+        bmedge.seam, bmedge.smooth = seam, smooth
+        id_elem[i] = bmedge
+    offsets = np.concatenate([[0], np.cumsum(fcounts)]).tolist()
+    fverts = fverts.tolist()
+    for (k, (i, smooth, material)) in enumerate(zip(fids.tolist(), fsmooth.tolist(), fmaterial.tolist())):
+        bmf = bme.faces.new([elem(v) for v in fverts[offsets[k]:offsets[k+1]]])
+        bmf.smooth, bmf.material_index = smooth, material
+        bmf.normal_update()
+        id_elem[i] = bmf
+
+    bmfs = set()
+    for (i, co, norm) in zip(mids.tolist(), mco.reshape((-1, 3)).tolist(), mnorm.reshape((-1, 3)).tolist()):
+        bmv = elem(i)
+        if bmv is None: continue
+        bmv.co, bmv.normal = co, norm
+        bmfs.update(bmv.link_faces)
+    for i in flipped.tolist():
+        bmf = elem(i)
+        if bmf is not None: bmf.normal_flip()
+    for bmf in bmfs: bmf.normal_update()
+
+    if has_selection[0]:
+        for bmelem in selected:
+            if bmelem.is_valid: bmelem.select = False
+        bmvs, bmes, bmfs = (
+            [bmelem for bmelem in map(elem, ids.tolist()) if bmelem is not None]
+            for ids in (sel_vids, sel_eids, sel_fids)
+        )
+        select_exactly(bmvs, bmes, bmfs)
+        selected.clear()
+        selected.update(bmvs + bmes + bmfs)
+
+@profiler.function
+def replay_recovery(filepath):
+    '''
+    replays recovery journal at filepath into a new bmesh.  returns (info, bme), or (None, None)
+    if file has nothing to recover.  a truncated last record (crash while writing) is ignored
+    '''
+    if not filepath or not os.path.exists(filepath): return (None, None)
+    with open(filepath, 'rb') as f: data = f.read()
+    if not data.startswith(magic): return (None, None)
+    info, bme, id_elem, selected = None, None, None, None
+    offset = len(magic)
+    while offset + record_header.size <= len(data):
+        kind, length = record_header.unpack_from(data, offset)
+        offset += record_header.size
+        if offset + length > len(data): break
+        payload = data[offset:offset+length]
+        offset += length
+        if kind == RECORD_INFO:
+            info = json.loads(payload.decode('utf-8'))
+        elif kind == RECORD_CHECKPOINT:
+            if bme: bme.free()
+            bme, id_elem = _replay_checkpoint(payload)
+            selected = { bmelem for seq in (bme.verts, bme.edges, bme.faces) for bmelem in seq if bmelem.select }
+        elif kind == RECORD_DELTA and bme:
+            _replay_delta(bme, id_elem, selected, payload)
+    if not bme: return (None, None)
+    return (info, bme)
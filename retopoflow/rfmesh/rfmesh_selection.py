@@ -0,0 +1,161 @@
+'''
+Copyright (C) 2021 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import numpy as np
+from bmesh.types import BMVert, BMEdge, BMFace
+
+from .rfmesh_arrays import matrix_to_array, transform_points
+from ...addon_common.common.profiler import profiler
+
+
+'''
+RFMeshSelection is an index of the selected BMElems of an RFMesh, so that
+selection queries (see RFMesh.get_selected_verts, any_verts_selected, etc.)
+cost O(selected) rather than a scan of the whole mesh.
+
+The index is kept up to date by the RFMesh methods that change selection or
+remove elements (select, deselect, deselect_all, delete_*) and by the
+RFVert/RFEdge/RFFace select setter.  New elements are created unselected, so
+creating them does not change the index.  Selection changes made any other way
+(ex: setting BMElem.select directly, bmesh.ops) are caught by stamping the
+index with RFMesh._version_selection: if the version has changed since the
+index was last synced, RFMesh.get_selection_index() rebuilds it.
+
+Note: setting select on BMEdge / BMFace also changes select of its verts
+(and edges), so update() re-reads the subparts, too.
+
+The index also keeps aggregates of the selected verts (count, sum and bounds
+of world coords), updated as verts are (de)selected or moved (see
+RFMesh.vert_moved), so that the selection center and bbox do not require
+iterating over the selection.  Bounds cannot shrink incrementally, so they
+are dropped whenever a vert on the boundary is deselected or moved inward,
+and recomputed lazily.
+'''
+
+
+class RFMeshSelection:
+    @profiler.function
+    def __init__(self, bme, version, xform):
+        self.version = version
+        self.xform = xform
+        self.verts = { bmv for bmv in bme.verts if bmv.select }
+        self.edges = { bme for bme in bme.edges if bme.select }
+        self.faces = { bmf for bmf in bme.faces if bmf.select }
+        self._recompute()
+
+    def _recompute(self):
+        ''' full recompute of aggregates '''
+        bmvs = [bmv for bmv in self.verts if bmv.is_valid]
+        co = np.array([bmv.co for bmv in bmvs], dtype=np.float64).reshape((-1, 3))
+        co = transform_points(matrix_to_array(self.xform.mx_p), co)
+        self.co = dict(zip(bmvs, map(tuple, co.tolist())))
+        self.sum = co.sum(axis=0).tolist()
+        self.bounds = (co.min(axis=0).tolist(), co.max(axis=0).tolist()) if len(co) else None
+
+    def _add_vert(self, bmv):
+        if bmv in self.co: self._remove_vert(bmv)
+        self.verts.add(bmv)
+        co = self.co[bmv] = tuple(self.xform.l2w_point(bmv.co))
+        s = self.sum
+        s[0] += co[0]; s[1] += co[1]; s[2] += co[2]
+        if len(self.co) == 1: self.bounds = (list(co), list(co))
+        if not self.bounds: return
+        mn, mx = self.bounds
+        for i in range(3):
+            if co[i] < mn[i]: mn[i] = co[i]
+            if co[i] > mx[i]: mx[i] = co[i]
+
+    def _remove_vert(self, bmv):
+        self.verts.discard(bmv)
+        co = self.co.pop(bmv, None)
+        if co is None: return
+        if not self.co:
+            # nothing selected; also resets accumulated rounding error
+            self.sum, self.bounds = [0.0, 0.0, 0.0], None
+            return
+        s = self.sum
+        s[0] -= co[0]; s[1] -= co[1]; s[2] -= co[2]
+        if not self.bounds: return
+        mn, mx = self.bounds
+        if any(co[i] <= mn[i] or co[i] >= mx[i] for i in range(3)):
+            self.bounds = None
+
+    def _sync_vert(self, bmv):
+        if bmv.select: self._add_vert(bmv)
+        else:          self._remove_vert(bmv)
+
+    @staticmethod
+    def _sync(elems, bmelem):
+        if bmelem.select: elems.add(bmelem)
+        else:             elems.discard(bmelem)
+
+    def update(self, bmelem):
+        ''' re-reads select of bmelem (and its subparts) '''
+        t = type(bmelem)
+        if t is BMVert:
+            self._sync_vert(bmelem)
+        elif t is BMEdge:
+            self._sync(self.edges, bmelem)
+            for bmv in bmelem.verts: self._sync_vert(bmv)
+        elif t is BMFace:
+            self._sync(self.faces, bmelem)
+            for bme in bmelem.edges: self._sync(self.edges, bme)
+            for bmv in bmelem.verts: self._sync_vert(bmv)
+
+    def moved(self, bmv):
+        ''' updates aggregates if bmv is selected '''
+        if bmv in self.co: self._add_vert(bmv)
+
+    def remove(self, bmelem):
+        '''
+        call before bmelem is removed from bmesh (invalid BMElems cannot be found).
+        removing a vert (edge) also removes its linked edges and faces (faces)
+        '''
+        t = type(bmelem)
+        if t is BMVert:
+            self._remove_vert(bmelem)
+            self.edges.difference_update(bmelem.link_edges)
+            self.faces.difference_update(bmelem.link_faces)
+        elif t is BMEdge:
+            self.edges.discard(bmelem)
+            self.faces.difference_update(bmelem.link_faces)
+        elif t is BMFace:
+            self.faces.discard(bmelem)
+
+    def clear(self):
+        self.verts.clear()
+        self.edges.clear()
+        self.faces.clear()
+        self._recompute()
+
+    def counts(self):
+        return (len(self.verts), len(self.edges), len(self.faces))
+
+    def center(self):
+        ''' returns average of selected verts (world), or None if none selected '''
+        n = len(self.co)
+        if not n: return None
+        return [v / n for v in self.sum]
+
+    def get_bounds(self):
+        ''' returns (min, max) of selected verts (world), or None if none selected '''
+        if not self.bounds and self.co: self._recompute()
+        return self.bounds
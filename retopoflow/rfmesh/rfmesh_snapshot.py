@@ -0,0 +1,410 @@
+'''
+Copyright (C) 2021 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import copy
+import zlib
+import struct
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+import bpy
+import bmesh
+import numpy as np
+
+from .rfmesh import RFTarget
+from .rfmesh_arrays import foreach_get_array
+from ...addon_common.common.profiler import profiler
+
+
+'''
+RFTargetSnapshot is a copy of an RFTarget, held either live (an RFTarget
+with its own bmesh) or packed into a compact binary form, so that undo can
+keep many states without keeping a bmesh per state (see RetopoFlow_Undo).
+
+Packing writes the bmesh into a scratch Mesh (BMesh.to_mesh) and reads the
+mesh data out with bulk foreach_get into flat buffers:
+
+    verts: co, normal, select, hide
+    edges: vertices, select, hide, use_seam, use_edge_sharp
+    loops: vertex_index, edge_index
+    faces: loop_start, loop_total, select, hide, use_smooth, material_index
+
+which are concatenated behind a small header of element counts and
+optionally zlib compressed.  Restoring goes the other way (foreach_set into a
+scratch Mesh, then BMesh.from_mesh), and is done only when the snapshot is
+restored.  Both directions keep element order, so bmesh indices of a packed
+target are still valid once restored (see RFMeshJournal.snapshot).
+
+The Mesh buffers hold none of the custom data layers of the bmesh (UVs, vertex
+groups, shape keys, crease, generic attributes, etc.), so those are read per
+element straight from the bmesh layers (see capture_layers), packed alongside
+the buffers, and written back into the restored bmesh (see restore_layers).
+Elements are read in bmesh order (loops face by face), which is the order
+from_mesh recreates them in.  Layer types that bmesh cannot read from Python
+(ex: freestyle marks) are skipped.
+
+Besides the bmesh, a snapshot keeps the few RFTarget attributes that are not
+derived from the object (see RFTarget.__deepcopy__).
+
+Packing can be split in two (background=True): the buffers and layers are
+copied out of the bmesh synchronously, as bmesh / bpy must only be touched from
+the main thread, and serializing / compressing them is left to a worker thread.
+Anything that needs the packed data (restore) waits for the worker first.
+Note: the worker must not call profiled functions, as profiler is not thread
+safe.
+
+The synchronous copy is cheap only when the arrays mirror of the target
+(rfmesh_arrays.py) is in sync, which it usually is, as picking keeps it up to
+date: buffers are then copied out of the mirror (see capture_arrays_buffers)
+rather than through to_mesh, and layers captured earlier are reused (see
+capture_target_layers).  The first snapshot after the mirror is rebuilt still
+reads edge / face flags and custom data layers element by element (bmesh has no
+bulk access to them), and without an in-sync mirror, packing goes through
+to_mesh as described above.
+'''
+
+
+vert_fields = [('co', np.float32, 3), ('normal', np.float32, 3), ('select', bool, 1), ('hide', bool, 1)]
+edge_fields = [('vertices', np.int32, 2), ('select', bool, 1), ('hide', bool, 1), ('use_seam', bool, 1), ('use_edge_sharp', bool, 1)]
+loop_fields = [('vertex_index', np.int32, 1), ('edge_index', np.int32, 1)]
+face_fields = [('loop_start', np.int32, 1), ('loop_total', np.int32, 1), ('select', bool, 1), ('hide', bool, 1), ('use_smooth', bool, 1), ('material_index', np.int32, 1)]
+
+header = struct.Struct('<4I')   # vert, edge, loop, face counts
+
+layer_domains = ['verts', 'edges', 'faces', 'loops']
+# layer types whose values are numbers (or fixed-size vectors of numbers), packed as arrays
+layer_kinds_numeric = {
+    'float', 'int', 'bool', 'float_vector', 'float_color', 'color',
+    'shape', 'bevel_weight', 'crease', 'paint_mask', 'face_map',
+}
+
+# single worker, so snapshots are packed in order and do not compete with each other for cpu.
+# created when first needed, and shut down when add-on is unregistered (see shutdown_snapshot_executor)
+snapshot_executor = None
+
+
+def get_snapshot_executor():
+    global snapshot_executor
+    if snapshot_executor is None: snapshot_executor = ThreadPoolExecutor(max_workers=1)
+    return snapshot_executor
+
+
+def shutdown_snapshot_executor():
+    ''' waits for pending packing to finish and stops worker thread (called when add-on is unregistered) '''
+    global snapshot_executor
+    if snapshot_executor is None: return
+    snapshot_executor.shutdown(wait=True)
+    snapshot_executor = None
+
+
+def _mesh_collections(me):
+    return [
+        (me.vertices, vert_fields),
+        (me.edges,    edge_fields),
+        (me.loops,    loop_fields),
+        (me.polygons, face_fields),
+    ]
+
+
+def capture_buffers(bme):
+    ''' returns flat buffers of bme (see module doc) as list of arrays, in field order '''
+    me = bpy.data.meshes.new('RetopoFlow snapshot')
+    try:
+        bme.to_mesh(me)
+        return [
+            foreach_get_array(collection, attr, dtype, width=width)
+            for (collection, fields) in _mesh_collections(me)
+            for (attr, dtype, width) in fields
+        ]
+    finally:
+        bpy.data.meshes.remove(me)
+
+
+def capture_arrays_buffers(arrays):
+    '''
+    same as capture_buffers, but copied out of arrays mirror (RFMeshArrays) of bmesh, which must
+    be in sync (see RFMesh.get_current_arrays).  mirror index order is bmesh order, which is the
+    order to_mesh writes elements (and loops, face by face) in
+    '''
+    arrays.build_adjacency()
+    arrays.build_flags()
+    fo = arrays.face_offsets
+    return [
+        arrays.co.astype(np.float32).ravel(), arrays.normal.astype(np.float32).ravel(),
+        arrays.vert_select.copy(), arrays.vert_hide.copy(),
+        arrays.edge_verts.astype(np.int32).ravel(), arrays.edge_select.copy(), arrays.edge_hide.copy(),
+        arrays.edge_seam.copy(), ~arrays.edge_smooth,
+        arrays.face_verts.astype(np.int32), arrays.face_edges.astype(np.int32),
+        fo[:-1].astype(np.int32), np.diff(fo).astype(np.int32), arrays.face_select.copy(), arrays.face_hide.copy(),
+        arrays.face_smooth.copy(), arrays.face_material.copy(),
+    ]
+
+
+def capture_target_buffers(rftarget):
+    ''' capture_buffers of rftarget's bmesh, copied from its arrays mirror when that is in sync '''
+    arrays = rftarget.get_current_arrays()
+    if arrays is None: return capture_buffers(rftarget.bme)
+    return capture_arrays_buffers(arrays)
+
+
+def bmesh_layers(bme):
+    ''' returns list of (domain, kind, name, layer) for each custom data layer of bme '''
+    layers = []
+    for domain in layer_domains:
+        access = getattr(bme, domain).layers
+        for kind in dir(access):
+            if kind.startswith('_'): continue
+            collection = getattr(access, kind)
+            # skip anything that is not a BMLayerCollection
+            if not hasattr(collection, 'items') or not hasattr(collection, 'new'): continue
+            layers += [(domain, kind, name, layer) for (name, layer) in collection.items()]
+    return layers
+
+
+def domain_elems(bme, domain):
+    if domain == 'loops': return (bml for bmf in bme.faces for bml in bmf.loops)
+    return getattr(bme, domain)
+
+
+def layer_value_get(kind, value):
+    ''' returns plain Python copy of layer value (BMElem[layer]) '''
+    if kind == 'deform': return dict(value.items())
+    if kind == 'uv':     return (tuple(value.uv), value.pin_uv)
+    if kind == 'skin':   return (tuple(value.radius), value.use_root, value.use_loose)
+    if hasattr(value, '__len__') and not isinstance(value, (str, bytes)): return tuple(value)
+    return value
+
+
+def layer_value_set(bmelem, layer, kind, value):
+    ''' sets layer value of bmelem from copy made by layer_value_get '''
+    if kind == 'deform':
+        dvert = bmelem[layer]
+        dvert.clear()
+        for (group, weight) in value.items(): dvert[group] = weight
+    elif kind == 'uv':
+        luv = bmelem[layer]
+        luv.uv, luv.pin_uv = value
+    elif kind == 'skin':
+        skin = bmelem[layer]
+        skin.radius, skin.use_root, skin.use_loose = value
+    else:
+        bmelem[layer] = value
+
+
+def capture_layers(bme):
+    '''
+    returns copies of all custom data layers of bme as list of (domain, kind, name, values),
+    where values are in element order.  values of numeric layers are packed into arrays
+    '''
+    captured = []
+    for (domain, kind, name, layer) in bmesh_layers(bme):
+        try:
+            values = [layer_value_get(kind, bmelem[layer]) for bmelem in domain_elems(bme, domain)]
+        except NotImplementedError:
+            # layer type cannot be accessed from Python
+            continue
+        if kind in layer_kinds_numeric:
+            values = np.array(values, dtype=np.int32 if kind in {'int', 'face_map'} else bool if kind == 'bool' else np.float32)
+        elif kind == 'uv':
+            values = (
+                np.array([uv for (uv, _) in values], dtype=np.float32).reshape((-1, 2)),
+                np.array([pin for (_, pin) in values], dtype=bool),
+            )
+        captured.append((domain, kind, name, values))
+    return captured
+
+
+def capture_target_layers(rftarget):
+    '''
+    capture_layers of rftarget's bmesh.  layer values only change along with a rebuild of the
+    arrays mirror (elements created / removed, or untracked changes), so while the mirror is in
+    sync, captured layers are kept with it and reused.
+    note: captured values are never modified (only serialized), so they can be shared
+    '''
+    arrays = rftarget.get_current_arrays()
+    if arrays is None: return capture_layers(rftarget.bme)
+    if arrays.layers is None: arrays.layers = capture_layers(rftarget.bme)
+    return arrays.layers
+
+
+def restore_layers(bme, layers):
+    ''' writes layers captured with capture_layers into bme, which must have same elements in same order '''
+    for (domain, kind, name, values) in layers:
+        collection = getattr(getattr(bme, domain).layers, kind)
+        layer = collection.get(name) or collection.new(name)
+        if kind in layer_kinds_numeric:
+            values = values.tolist()
+        elif kind == 'uv':
+            values = zip(values[0].tolist(), values[1].tolist())
+        for (bmelem, value) in zip(domain_elems(bme, domain), values):
+            layer_value_set(bmelem, layer, kind, value)
+
+
+def serialize_layers(layers, compress=True):
+    data = pickle.dumps(layers, protocol=pickle.HIGHEST_PROTOCOL)
+    return zlib.compress(data, 1) if compress else data
+
+
+def deserialize_layers(data, compressed=True):
+    if compressed: data = zlib.decompress(data)
+    return pickle.loads(data)
+
+
+def buffers_counts(buffers):
+    fields = vert_fields + edge_fields + loop_fields + face_fields
+    firsts = [0, len(vert_fields), len(vert_fields) + len(edge_fields), len(fields) - len(face_fields)]
+    return tuple(len(buffers[i]) // fields[i][2] for i in firsts)
+
+
+def serialize_buffers(buffers, compress=True):
+    data = header.pack(*buffers_counts(buffers)) + b''.join(buf.tobytes() for buf in buffers)
+    return zlib.compress(data, 1) if compress else data
+
+
+def deserialize_buffers(data, compressed=True):
+    if compressed: data = zlib.decompress(data)
+    counts = header.unpack_from(data)
+    offset = header.size
+    buffers = []
+    for (count, fields) in zip(counts, [vert_fields, edge_fields, loop_fields, face_fields]):
+        for (_, dtype, width) in fields:
+            buf = np.frombuffer(data, dtype=dtype, count=count * width, offset=offset)
+            offset += buf.nbytes
+            buffers.append(buf)
+    return buffers
+
+
+@profiler.function
+def bmesh_from_buffers(buffers):
+    counts = buffers_counts(buffers)
+    me = bpy.data.meshes.new('RetopoFlow snapshot')
+    try:
+        me.vertices.add(counts[0])
+        me.edges.add(counts[1])
+        me.loops.add(counts[2])
+        me.polygons.add(counts[3])
+        bufs = iter(buffers)
+        normals = None
+        for (collection, fields) in _mesh_collections(me):
+            for ((attr, _, _), buf) in zip(fields, bufs):
+                if attr == 'normal':
+                    # vertex normals are read-only in newer versions of Blender
+                    try:
+                        collection.foreach_set(attr, buf)
+                    except (AttributeError, TypeError, RuntimeError):
+                        normals = buf.reshape((-1, 3)).tolist()
+                    continue
+                collection.foreach_set(attr, buf)
+        bme = bmesh.new()
+        bme.from_mesh(me)
+    finally:
+        bpy.data.meshes.remove(me)
+    bme.select_mode = {'FACE', 'EDGE', 'VERT'}
+    if normals is not None:
+        for (bmv, n) in zip(bme.verts, normals): bmv.normal = n
+    return bme
+
+
+def _serialize(buffers, layers, compress):
+    # note: run on worker thread (see RFTargetSnapshot._pack)
+    return (serialize_buffers(buffers, compress=compress), serialize_layers(layers, compress=compress))
+
+
+class RFTargetSnapshot:
+    @profiler.function
+    def __init__(self, rftarget, live=True, compress=True, background=False):
+        self.obj = rftarget.obj
+        self.unit_scaling_factor = rftarget.unit_scaling_factor
+        self.symmetry_accels = (rftarget.xy_symmetry_accel, rftarget.xz_symmetry_accel, rftarget.yz_symmetry_accel)
+        self.prev_state = copy.deepcopy(rftarget.prev_state)
+        self.rftarget = None    # live copy
+        self.data = None        # packed copy: (buffers, layers)
+        self.pending = None     # (future, nbytes) of packing on worker thread
+        self.compressed = compress
+        if live: self.rftarget = copy.deepcopy(rftarget)
+        else:    self._pack(rftarget, background)
+
+    def _pack(self, rftarget, background):
+        buffers = capture_target_buffers(rftarget)
+        layers = capture_target_layers(rftarget)
+        if background:
+            future = get_snapshot_executor().submit(_serialize, buffers, layers, self.compressed)
+            self.pending = (future, sum(buf.nbytes for buf in buffers))
+        else:
+            self.data = _serialize(buffers, layers, self.compressed)
+
+    def wait(self):
+        ''' waits for packing on worker thread (if any) to finish '''
+        if self.pending is None: return
+        future, _ = self.pending
+        self.data = future.result()
+        self.pending = None
+
+    @property
+    def is_live(self):
+        return self.rftarget is not None
+
+    @property
+    def nbytes(self):
+        ''' approximate memory used '''
+        if self.pending is not None:
+            future, nbytes = self.pending
+            if not future.done(): return nbytes
+            self.wait()
+        if self.data is not None: return sum(map(len, self.data))
+        # rough sizes of BMesh element structs (with loops approximated as two per edge)
+        bme = self.rftarget.bme
+        return len(bme.verts) * 80 + len(bme.edges) * (100 + 2 * 64) + len(bme.faces) * 80
+
+    @profiler.function
+    def pack(self, background=False):
+        ''' drops live copy, keeping packed copy only '''
+        if not self.is_live: return
+        self._pack(self.rftarget, background)
+        self.rftarget = None
+
+    @profiler.function
+    def restore_bmesh(self):
+        ''' returns new bmesh in snapshotted state (snapshot must be packed) '''
+        self.wait()
+        buffers, layers = self.data
+        bme = bmesh_from_buffers(deserialize_buffers(buffers, compressed=self.compressed))
+        restore_layers(bme, deserialize_layers(layers, compressed=self.compressed))
+        return bme
+
+    @profiler.function
+    def restore(self, consume=False):
+        '''
+        returns RFTarget in snapshotted state.  if consume is True, the snapshot is no longer
+        needed, so the live copy (if any) is handed over rather than copied
+        '''
+        if self.is_live:
+            if consume:
+                rftarget, self.rftarget = self.rftarget, None
+                return rftarget
+            return copy.deepcopy(self.rftarget)
+        bme = self.restore_bmesh()
+        rftarget = RFTarget.__new__(RFTarget)
+        rftarget.__setup__(self.obj, self.unit_scaling_factor, bme=bme)
+        rftarget.set_symmetry_accel(*self.symmetry_accels)
+        rftarget.prev_state = copy.deepcopy(self.prev_state)
+        if consume: self.data = None
+        return rftarget
@@ -0,0 +1,184 @@
+'''
+Copyright (C) 2021 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import numpy as np
+from mathutils.bvhtree import BVHTree
+
+from .rfmesh_raster import RFMeshRaster
+from ...addon_common.common.maths import Point, Normal
+from ...addon_common.common.profiler import profiler
+
+
+'''
+RFSourcesBVH is a single world-space BVHTree built over the faces of several
+RFSources, so raycast / nearest queries take one traversal rather than one
+per source (each with its own world-to-local transform).
+
+The merged BVH is built over triangles (RFMeshArrays.triangles; RFSources are
+triangulated, so these are usually just the faces).  Merged triangle i belongs
+to rfsources[s] where offsets[s] <= i < offsets[s+1], and tri_face[i] is the
+face index into that source's own BVH, so results match what RFSource.raycast /
+RFSource.nearest would return.
+
+Only the given (snappable) sources are included; see
+RetopoFlow_Sources.get_sources_bvh(), which builds it on first query and
+rebuilds when snap settings change.
+'''
+
+
+class RFSourcesBVH:
+    @profiler.function
+    def __init__(self, rfsources):
+        self.rfsources = list(rfsources)
+        verts, tris, tri_faces = [], [], []
+        offsets = [0]
+        base = 0
+        for rfsource in self.rfsources:
+            arrays = rfsource.get_arrays()
+            t, tf = arrays.triangles()
+            # reflected xform flips winding, so flip back to keep normals facing same way as RFSource.raycast
+            if rfsource.xform.mx_p.determinant() < 0: t = t[:, ::-1]
+            verts.append(arrays.co_world)
+            tris.append(t + base)
+            tri_faces.append(tf)
+            base += len(arrays.co_world)
+            offsets.append(offsets[-1] + len(t))
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.tri_face = np.concatenate(tri_faces + [np.empty(0, dtype=np.int64)])
+        verts = np.concatenate(verts + [np.empty((0, 3))])
+        tris = np.concatenate(tris + [np.empty((0, 3), dtype=np.int64)])
+        # note: FromPolygons reads Python sequences, so arrays are converted with tolist (one C pass each)
+        self.bvh = BVHTree.FromPolygons(verts.tolist(), tris.tolist())
+
+    def _source(self, i):
+        ''' maps merged triangle index to (rfsource, source face index) '''
+        s = int(np.searchsorted(self.offsets, i, side='right')) - 1
+        return (self.rfsources[s], int(self.tri_face[i]))
+
+    def _sources(self, indices):
+        ''' vectorized version of _source, returning (source indices, source face indices); misses are -1 '''
+        hit = indices >= 0
+        s = np.full(len(indices), -1, dtype=np.int64)
+        s[hit] = np.searchsorted(self.offsets, indices[hit], side='right') - 1
+        local = np.full(len(indices), -1, dtype=np.int64)
+        local[hit] = self.tri_face[indices[hit]]
+        return (s, local)
+
+    def raycast(self, ray):
+        ''' returns (point, normal, face index, dist, rfsource), all None if miss '''
+        p,n,i,d = self.bvh.ray_cast(ray.o, ray.d, ray.max)
+        if p is None: return (None,None,None,None,None)
+        rfsource, i = self._source(i)
+        return (Point(p), Normal(n).normalize(), i, d, rfsource)
+
+    def raycast_hit(self, ray):
+        p,_,_,_ = self.bvh.ray_cast(ray.o, ray.d, ray.max)
+        return p is not None
+
+    def nearest(self, point, max_dist=float('inf')):
+        ''' returns (point, normal, face index, dist, rfsource), all None if nothing within max_dist '''
+        p,n,i,d = self.bvh.find_nearest(point, max_dist)
+        if p is None: return (None,None,None,None,None)
+        rfsource, i = self._source(i)
+        return (Point(p), Normal(n).normalize(), i, d, rfsource)
+
+    @profiler.function
+    def raycast_batch(self, origins, directions, max_dist=float('inf')):
+        '''
+        see RFMesh.raycast_batch; face indices are into each hit's source.
+        note: BVHTree has no batched traversal, so this still makes one ray_cast call per ray;
+        only gathering the results and mapping them to sources is done on whole arrays
+        '''
+        n = len(origins)
+        points  = np.full((n, 3), np.nan)
+        normals = np.full((n, 3), np.nan)
+        indices = np.full(n, -1, dtype=np.int64)
+        dists   = np.full(n, np.inf)
+        ray_cast = self.bvh.ray_cast
+        for k, (o, d) in enumerate(zip(origins.tolist(), directions.tolist())):
+            p,nrm,i,dist = ray_cast(o, d, max_dist)
+            if p is None: continue
+            points[k], normals[k], indices[k], dists[k] = p, nrm, i, dist
+        _, indices = self._sources(indices)
+        return (points, normals, indices, dists)
+
+    @profiler.function
+    def nearest_batch(self, points, max_dist=float('inf')):
+        '''
+        see RFMesh.nearest_batch; face indices are into each hit's source.
+        note: as with raycast_batch, this makes one find_nearest call per point
+        '''
+        n = len(points)
+        hits    = np.full((n, 3), np.nan)
+        normals = np.full((n, 3), np.nan)
+        indices = np.full(n, -1, dtype=np.int64)
+        dists   = np.full(n, np.inf)
+        find_nearest = self.bvh.find_nearest
+        for k, p in enumerate(points.tolist()):
+            hp,hn,hi,hd = find_nearest(p, max_dist)
+            if hp is None: continue
+            hits[k], normals[k], indices[k], dists[k] = hp, hn, hi, hd
+        _, indices = self._sources(indices)
+        return (hits, normals, indices, dists)
+
+
+class RFSourcesDepthBuffer(RFMeshRaster):
+    '''
+    CPU depth buffer of RFSources rasterized at viewport resolution, used to
+    classify many points as visible / occluded at once rather than casting a
+    ray per point (see RetopoFlow_Sources.are_visible).
+
+    Each pixel stores the nearest eye depth (distance along view direction)
+    of the source surfaces sampled at the pixel center, or inf if uncovered.
+    See RFMeshRaster for details on rasterization.
+    '''
+
+    @profiler.function
+    def __init__(self, rfsources, view_matrix, perspective_matrix, is_perspective, width, height):
+        super().__init__(view_matrix, perspective_matrix, is_perspective, width, height)
+        depth = np.full(width * height, np.inf)
+        for rfsource in rfsources:
+            arrays = rfsource.get_arrays()
+            tris, _ = arrays.triangles()
+            for (pix, d, _) in self._fragments(arrays.co_world, tris):
+                np.minimum.at(depth, pix, d)
+        self.depth = depth
+
+    @profiler.function
+    def visible(self, co, dist, max_dist_offset):
+        '''
+        co is Nx3 world points; dist is N distances of points from their view ray origin
+        (see RetopoFlow_Spaces.Point_to_Ray).  returns N bool, where point is visible if it
+        is within region and no source surface is closer than dist - max_dist_offset
+        (same test as RetopoFlow_Sources.is_visible)
+        '''
+        W, H = self.width, self.height
+        x, y, _, eye, clip = self._project(co)
+        valid = (clip[:, 3] > 0) & (x >= 0) & (x <= W) & (y >= 0) & (y <= H)
+        px = np.clip(np.floor(x), 0, W - 1).astype(np.int64)
+        py = np.clip(np.floor(y), 0, H - 1).astype(np.int64)
+        surf_eye = self.depth[py * W + px]
+        # convert eye depth of surface to distance along point's view ray
+        k = dist / np.where(eye == 0, 1, eye) if self.is_perspective else 1.0
+        with np.errstate(invalid='ignore'):
+            surf_dist = dist + (surf_eye - eye) * k
+            occluded = (surf_dist >= 0) & (surf_dist < dist - max_dist_offset)
+        return valid & ~occluded
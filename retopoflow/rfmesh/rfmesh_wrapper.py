@@ -57,12 +57,30 @@ user-writable properties:
     common: hide, index. select, tag
 
 NOTE: RFVert, RFEdge, RFFace do NOT mark RFMesh as dirty!
+      RFVert.co does notify RFMesh (vert_moved) so the vert grid stays current.
+      select does notify RFMesh (_selection_update) so the selection index stays current.
+      RFVert.co and RFVert.normal notify RFMesh (_vert_changing) before the change, and
+      changes the undo journal cannot record notify RFMesh (_journal_untracked); see
+      rfmesh_journal.py.
+
+Wrappers are interned: RFVert(bmv) returns the wrapper already made for bmv
+(if any) from the pool of the current RFTarget (RFMesh._wrapper_pool), so
+queries do not allocate a new wrapper per element and per-wrapper caches
+survive between queries.  RFMesh drops pool entries of elements it removes,
+and purges invalid entries when the pool grows too large (see RFMesh.dirty).
+
+RFVert caches its world coords along with the local coords they were computed
+from, so the cache also catches verts moved directly through BMVert.co.
 '''
 
 
 class BMElemWrapper:
+    __slots__ = ('bmelem',)
+    _pool = {}
+
     @staticmethod
     def wrap(rftarget):
+        BMElemWrapper._pool = rftarget._wrapper_pool
         BMElemWrapper.rftarget = rftarget
         BMElemWrapper.xform = rftarget.xform
         BMElemWrapper.l2w_point = rftarget.xform.l2w_point
@@ -80,7 +98,17 @@ class BMElemWrapper:
             return bmelem.bmelem
         return bmelem
 
-    def __init__(self, bmelem):
+    def __new__(cls, bmelem):
+        if isinstance(bmelem, BMElemWrapper): bmelem = bmelem.bmelem
+        pool = BMElemWrapper._pool
+        wrapper = pool.get(bmelem)
+        if type(wrapper) is not cls:
+            wrapper = object.__new__(cls)
+            wrapper._setup(bmelem)
+            if bmelem is not None: pool[bmelem] = wrapper
+        return wrapper
+
+    def _setup(self, bmelem):
         self.bmelem = bmelem
 
     def __repr__(self):
@@ -122,6 +150,7 @@ class BMElemWrapper:
     @select.setter
     def select(self, v):
         self.bmelem.select = v
+        BMElemWrapper.rftarget._selection_update(self.bmelem)
 
     @property
     def tag(self):
@@ -132,12 +161,18 @@ class BMElemWrapper:
         self.bmelem.tag = v
 
     def __getattr__(self, k):
-        if k in self.__dict__:
-            return getattr(self, k)
+        if k == 'bmelem': raise AttributeError(k)   # not set up yet (ex: copying)
         return getattr(self.bmelem, k)
 
 
 class RFVert(BMElemWrapper):
+    __slots__ = ('_co_local', '_co_world')
+
+    def _setup(self, bmelem):
+        self.bmelem = bmelem
+        self._co_local = None   # local coords that _co_world was computed from
+        self._co_world = None
+
     def __repr__(self):
         return '<RFVert: %s>' % repr(self.bmelem)
 
@@ -151,7 +186,11 @@ class RFVert(BMElemWrapper):
 
     @property
     def co(self):
-        return self.l2w_point(self.bmelem.co)
+        co = self.bmelem.co
+        if co != self._co_local:
+            self._co_local = co.copy()
+            self._co_world = self.l2w_point(co)
+        return self._co_world.copy()
 
     @co.setter
     def co(self, co):
@@ -166,7 +205,10 @@ class RFVert(BMElemWrapper):
         #     nx,ny,nz = (mm.x and abs(ox) <= th),(mm.y and abs(oy) <= th),(mm.z and abs(oz) <= th)
         #     if nx or ny or nz:
         #         co = rft.snap_to_symmetry(co, mm._symmetry, to_world=False, from_world=False)
+        BMElemWrapper.rftarget._vert_changing(self.bmelem)
         self.bmelem.co = co
+        self._co_local = None
+        BMElemWrapper.rftarget.vert_moved(self.bmelem)
 
     @property
     def normal(self):
@@ -174,6 +216,7 @@ class RFVert(BMElemWrapper):
 
     @normal.setter
     def normal(self, norm):
+        BMElemWrapper.rftarget._vert_changing(self.bmelem)
         self.bmelem.normal = self.w2l_normal(norm)
 
     @property
@@ -227,6 +270,7 @@ class RFVert(BMElemWrapper):
     def merge(self, other):
         bmv0 = BMElemWrapper._unwrap(self)
         bmv1 = BMElemWrapper._unwrap(other)
+        self.rftarget._journal_untracked()
         try:
             vert_splice(bmv1, bmv0)
             return bmv0
@@ -262,6 +306,7 @@ class RFVert(BMElemWrapper):
 
     def dissolve(self):
         bmv = BMElemWrapper._unwrap(self)
+        self.rftarget._journal_untracked()
         vert_dissolve(bmv)
 
     def compute_normal(self):
@@ -270,6 +315,8 @@ class RFVert(BMElemWrapper):
 
 
 class RFEdge(BMElemWrapper):
+    __slots__ = ()
+
     def __repr__(self):
         return '<RFEdge: %s>' % repr(self.bmelem)
 
@@ -284,6 +331,7 @@ class RFEdge(BMElemWrapper):
 
     @seam.setter
     def seam(self, v):
+        BMElemWrapper.rftarget._journal_untracked()
         self.bmelem.seam = v
 
     @property
@@ -292,6 +340,7 @@ class RFEdge(BMElemWrapper):
 
     @smooth.setter
     def smooth(self, v):
+        BMElemWrapper.rftarget._journal_untracked()
         self.bmelem.smooth = v
 
     def first_vert(self):
@@ -478,6 +527,7 @@ class RFEdge(BMElemWrapper):
     def split(self, vert=None, fac=0.5):
         bme = BMElemWrapper._unwrap(self)
         bmv = BMElemWrapper._unwrap(vert) or bme.verts[0]
+        self.rftarget._journal_untracked()
         bme_new, bmv_new = edge_split(bme, bmv, fac)
         return RFEdge(bme_new), RFVert(bmv_new)
 
@@ -485,6 +535,7 @@ class RFEdge(BMElemWrapper):
         bme = BMElemWrapper._unwrap(self)
         bmv0, bmv1 = bme.verts
         del_faces = [f for f in bme.link_faces if len(f.verts) == 3]
+        self.rftarget._journal_untracked()
         for bmf in del_faces:
             self.rftarget.bme.faces.remove(bmf)
         bmesh.ops.collapse(self.rftarget.bme, edges=[bme], uvs=True)
@@ -492,6 +543,8 @@ class RFEdge(BMElemWrapper):
 
 
 class RFFace(BMElemWrapper):
+    __slots__ = ()
+
     def __repr__(self):
         return '<RFFace: %s>' % repr(self.bmelem)
 
@@ -506,6 +559,7 @@ class RFFace(BMElemWrapper):
 
     @material_index.setter
     def material_index(self, v):
+        BMElemWrapper.rftarget._journal_untracked()
         self.bmelem.material_index = v
 
     @property
@@ -514,6 +568,7 @@ class RFFace(BMElemWrapper):
 
     @normal.setter
     def normal(self, v):
+        BMElemWrapper.rftarget._journal_untracked()
         self.bmelem.normal = self.w2l_normal(v)
 
     @property
@@ -522,6 +577,7 @@ class RFFace(BMElemWrapper):
 
     @smooth.setter
     def smooth(self, v):
+        BMElemWrapper.rftarget._journal_untracked()
         self.bmelem.smooth = v
 
     @property
@@ -668,6 +724,7 @@ class RFFace(BMElemWrapper):
         verts0, verts1 = list(self.bmelem.verts), list(other.bmelem.verts)
         l = len(verts0)
         assert l == len(verts1), 'RFFaces must have same vert count'
+        self.rftarget._journal_untracked()
         self.rftarget.bme.faces.remove(self._unwrap(other))
         offset = min(range(l), key=lambda i: (
             verts1[i].co - verts0[0].co).length)
@@ -696,10 +753,12 @@ class RFFace(BMElemWrapper):
         bmva = BMElemWrapper._unwrap(vert_a)
         bmvb = BMElemWrapper._unwrap(vert_b)
         coords = [BMElemWrapper.w2l_point(c) for c in coords]
+        self.rftarget._journal_untracked()
         bmf_new, bml_new = face_split(bmf, bmva, bmvb, coords=coords)
         return RFFace(bmf_new)
 
     def shatter(self):
+        self.rftarget._journal_untracked()
         working = [ self ]
         ret = set()
 
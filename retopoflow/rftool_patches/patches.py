@@ -232,10 +232,12 @@ class Patches(RFTool_Patches, Patches_RFWidgets):
         self.sel_verts = self.rfcontext.get_selected_verts()
         self.vis_accel = self.rfcontext.get_vis_accel()
         self.vis_verts = self.rfcontext.accel_vis_verts
-        Point_to_Point2D = self.rfcontext.Point_to_Point2D
 
-        self.bmverts = [(bmv, Point_to_Point2D(bmv.co)) for bmv in self.sel_verts]
-        self.vis_bmverts = [(bmv, Point_to_Point2D(bmv.co)) for bmv in self.vis_verts if bmv and bmv not in self.sel_verts]
+        Verts_to_Point2Ds = self.rfcontext.Verts_to_Point2Ds
+        bmverts = list(self.sel_verts)
+        vis_bmverts = [bmv for bmv in self.vis_verts if bmv and bmv not in self.sel_verts]
+        self.bmverts = list(zip(bmverts, Verts_to_Point2Ds(bmverts)))
+        self.vis_bmverts = list(zip(vis_bmverts, Verts_to_Point2Ds(vis_bmverts)))
         self.mousedown = self.rfcontext.actions.mouse
         self.defer_recomputing = True
 
@@ -285,11 +285,8 @@ class PolyPen(RFTool_PolyPen, PolyPen_RFWidgets):
 
 
     def set_vis_bmverts(self):
-        self.vis_bmverts = [
-            (bmv, self.rfcontext.Point_to_Point2D(bmv.co))
-            for bmv in self.vis_verts
-            if bmv.is_valid and bmv not in self.sel_verts
-        ]
+        bmverts = [bmv for bmv in self.vis_verts if bmv.is_valid and bmv not in self.sel_verts]
+        self.vis_bmverts = list(zip(bmverts, self.rfcontext.Verts_to_Point2Ds(bmverts)))
 
 
     @RFTool_PolyPen.FSM_State('insert')
@@ -613,7 +610,8 @@ class PolyPen(RFTool_PolyPen, PolyPen_RFWidgets):
 
     def prep_move(self, bmverts=None, defer_recomputing=True):
         if not bmverts: bmverts = self.sel_verts
-        self.bmverts = [(bmv, self.rfcontext.Point_to_Point2D(bmv.co)) for bmv in bmverts if bmv and bmv.is_valid]
+        bmverts = [bmv for bmv in bmverts if bmv and bmv.is_valid]
+        self.bmverts = list(zip(bmverts, self.rfcontext.Verts_to_Point2Ds(bmverts)))
         self.set_vis_bmverts()
         self.mousedown = self.actions.mouse
         self.last_delta = None
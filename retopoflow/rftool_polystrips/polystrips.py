@@ -474,15 +474,13 @@ class PolyStrips(RFTool_PolyStrips, PolyStrips_Props, PolyStrips_Ops, PolyStrips
         vec1 = self.actions.mouse - self.scale_from
         scale = vec1.length / vec0.length
 
-        snap2D_vert = self.rfcontext.snap2D_vert
-        snap_vert = self.rfcontext.snap_vert
         for bmv in self.scale_bmv.keys():
             l = self.scale_bmv[bmv]
             n = Vector()
             for c,v,sc in l:
                 n += c + v * max(0, 1 + (scale-1) * sc)
             bmv.co = n / len(l)
-            snap_vert(bmv)
+        self.rfcontext.snap_verts(self.scale_bmv.keys())
 
     @RFTool_PolyStrips.FSM_State('scale', 'exit')
     def scale_exit(self):
@@ -223,6 +223,7 @@ class Relax(RFTool_Relax, Relax_RFWidgets):
             if opt_mask_selected == 'exclude' and bmv.select: continue
             if opt_mask_selected == 'only' and not bmv.select: continue
             self._bmverts.append(bmv)
+        self._bmverts_lookup = frozenset(self._bmverts)     # membership tests in nearest_verts_point
         print(f'Relaxing max of {len(self._bmverts)} bmverts')
 
     @RFTool_Relax.FSM_State('relax', 'exit')
@@ -248,7 +249,7 @@ class Relax(RFTool_Relax, Relax_RFWidgets):
 
         # collect data for smoothing
         radius = self.rfwidget.get_scaled_radius()
-        nearest = self.rfcontext.nearest_verts_point(hit_pos, radius, bmverts=self._bmverts)
+        nearest = self.rfcontext.nearest_verts_point(hit_pos, radius, bmverts=self._bmverts_lookup)
         verts,edges,faces,vert_strength = set(),set(),set(),dict()
         for bmv,d in nearest:
             verts.add(bmv)
@@ -405,6 +406,6 @@ class Relax(RFTool_Relax, Relax_RFWidgets):
                     snap_to_symmetry = self.rfcontext.symmetry_planes_for_point(bmv.co)
                     co = self.rfcontext.snap_to_symmetry(co, snap_to_symmetry)
                 bmv.co = co
-                self.rfcontext.snap_vert(bmv)
+            self.rfcontext.snap_verts(displace)
             self.rfcontext.update_verts_faces(displace)
         # print(f'relaxed {len(verts)} ({len(chk_verts)}) in {time.time() - st} with {strength}')
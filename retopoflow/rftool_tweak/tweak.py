@@ -194,7 +194,6 @@ class Tweak(RFTool_Tweak, Tweak_RFWidgets):
         opt_mask_hidden   = options['tweak mask hidden']
         opt_mask_selected = options['tweak mask selected']
 
-        Point_to_Point2D = self.rfcontext.Point_to_Point2D
         get_strength_dist = self.rfwidget.get_strength_dist
         def is_visible(bmv):
             return self.rfcontext.is_visible(bmv.co, bmv.normal)
@@ -204,7 +203,8 @@ class Tweak(RFTool_Tweak, Tweak_RFWidgets):
         # get all verts under brush
         radius = self.rfwidget.get_scaled_radius()
         nearest = self.rfcontext.nearest_verts_mouse(radius)
-        self.bmverts = [(bmv, on_planes(bmv), Point_to_Point2D(bmv.co), get_strength_dist(d3d)) for (bmv, d3d) in nearest]
+        xys = self.rfcontext.Verts_to_Point2Ds(bmv for (bmv, _) in nearest)
+        self.bmverts = [(bmv, on_planes(bmv), xy, get_strength_dist(d3d)) for ((bmv, d3d), xy) in zip(nearest, xys)]
         # filter verts based on options
         if self.sel_only:                  self.bmverts = [(bmv,sympl,p2d,s) for (bmv,sympl,p2d,s) in self.bmverts if bmv.select]
         if opt_mask_boundary == 'exclude': self.bmverts = [(bmv,sympl,p2d,s) for (bmv,sympl,p2d,s) in self.bmverts if not bmv.is_on_boundary()]
@@ -233,11 +233,13 @@ class Tweak(RFTool_Tweak, Tweak_RFWidgets):
         if self.actions.mouse_prev == self.actions.mouse: return
 
         delta = Vec2D(self.rfcontext.actions.mouse - self.mousedown)
-        set2D_vert = self.rfcontext.set2D_vert
         update_face_normal = self.rfcontext.update_face_normal
 
-        for bmv,sympl,xy,strength in self.bmverts:
-            nco = set2D_vert(bmv, xy + delta*strength, sympl)
+        self.rfcontext.set2D_verts(
+            [bmv for (bmv,_,_,_) in self.bmverts],
+            [xy + delta*strength for (_,_,xy,strength) in self.bmverts],
+            snap_to_symmetry=[sympl for (_,sympl,_,_) in self.bmverts],
+        )
         for bmf in self.bmfaces:
             update_face_normal(bmf)
 
@@ -0,0 +1,95 @@
+'''
+Copyright (C) 2021 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import os
+import sys
+import ast
+import types
+
+
+'''
+These tests run outside of Blender (run `python -m pytest tests` from the
+add-on root).  The Blender modules (bpy, bmesh, mathutils, bgl) are replaced
+with the small pure Python stand-ins in tests/stubs, which model only what the
+modules under test use.
+
+The add-on is loaded as package `retopoflow_addon` (ex: `from
+retopoflow_addon.retopoflow.rfmesh import rfmesh_grid`), but its __init__
+modules (which register the add-on and build the UI) are skipped: packages are
+set up empty, so that only the modules a test imports (and their imports) are
+loaded.
+
+config/options.py builds the UI settings, so it is replaced with a module
+holding just the default options (read from config/options.py).
+'''
+
+
+path_tests = os.path.dirname(os.path.abspath(__file__))
+path_root  = os.path.dirname(path_tests)
+sys.path.insert(0, os.path.join(path_tests, 'stubs'))
+
+addon = 'retopoflow_addon'
+
+
+def _package(name, path):
+    module = types.ModuleType(name)
+    module.__path__ = [path]
+    sys.modules[name] = module
+    return module
+
+
+def _default_options():
+    tree = ast.parse(open(os.path.join(path_root, 'config', 'options.py')).read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ClassDef) and node.name == 'Options':
+            for stmt in node.body:
+                if isinstance(stmt, ast.Assign) and getattr(stmt.targets[0], 'id', None) == 'default_options':
+                    return ast.literal_eval(stmt.value)
+    assert False, 'could not find Options.default_options'
+
+
+class Options(dict):
+    def __init__(self):
+        self.default_options = _default_options()
+        super().__init__(self.default_options)
+
+    def reset(self):
+        self.clear()
+        self.update(self.default_options)
+
+
+_package(addon, path_root)
+for subpackage in ['retopoflow', 'retopoflow/rf', 'retopoflow/rfmesh', 'addon_common', 'addon_common/common', 'config']:
+    _package('%s.%s' % (addon, subpackage.replace('/', '.')), os.path.join(path_root, subpackage))
+
+config_options = types.ModuleType('%s.config.options' % addon)
+config_options.options = Options()
+config_options.retopoflow_version = 'test'
+sys.modules[config_options.__name__] = config_options
+
+
+import pytest
+
+@pytest.fixture
+def options():
+    ''' RetopoFlow options, reset to defaults after test '''
+    yield config_options.options
+    config_options.options.reset()
@@ -0,0 +1,99 @@
+'''
+Copyright (C) 2021 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from types import SimpleNamespace
+
+import bmesh
+
+
+'''
+helpers for building and comparing (stand-in) bmeshes in tests
+'''
+
+
+def grid_bmesh(nx=4, ny=3, size=1.0):
+    ''' returns bmesh of nx by ny quads in the xy plane '''
+    bme = bmesh.new()
+    verts = [
+        [bme.verts.new((i * size, j * size, 0.0)) for i in range(nx + 1)]
+        for j in range(ny + 1)
+    ]
+    for j in range(ny):
+        for i in range(nx):
+            bme.faces.new((verts[j][i], verts[j][i+1], verts[j+1][i+1], verts[j+1][i]))
+    return bme
+
+
+def rounded(co, places=5):
+    return tuple(round(c, places) for c in co)
+
+
+def bmesh_signature(bme):
+    '''
+    returns hashable description of geometry, selection, and flags of bme that does not
+    depend on element order or identity
+    '''
+    def face_key(bmf):
+        co = [rounded(bmv.co) for bmv in bmf.verts]
+        i = co.index(min(co))
+        return tuple(co[i:] + co[:i])
+    verts = sorted((rounded(bmv.co), bmv.select, bmv.hide) for bmv in bme.verts)
+    edges = sorted((tuple(sorted(rounded(bmv.co) for bmv in bme_.verts)), bme_.select, bme_.seam, bme_.smooth) for bme_ in bme.edges)
+    faces = sorted((face_key(bmf), bmf.select, bmf.smooth, bmf.material_index) for bmf in bme.faces)
+    return (verts, edges, faces)
+
+
+def target_for(bme):
+    '''
+    returns RFTarget wrapping bme.  RFTarget.new needs a Blender object, so the attributes
+    that RFMesh.__setup__ / RFTarget.__setup__ set are filled in directly
+    '''
+    from mathutils import Matrix
+    from retopoflow_addon.retopoflow.rfmesh.rfmesh import RFTarget
+    from retopoflow_addon.addon_common.common.maths import XForm, Point
+    rftarget = RFTarget.__new__(RFTarget)
+    rftarget.obj = None
+    rftarget.xform = XForm(Matrix.Identity(4))
+    rftarget.bme = bme
+    rftarget._version = None
+    rftarget._version_selection = None
+    rftarget.arrays = None
+    rftarget.arrays_version = None
+    rftarget.arrays_version_selection = None
+    rftarget._arrays_moved = set()
+    rftarget._arrays_topology = False
+    rftarget.vert_grid = None
+    rftarget._moved_verts = set()
+    rftarget._created = None
+    rftarget._removed = False
+    rftarget._selection_index = None
+    rftarget._wrapper_pool = {}
+    rftarget._journal = None
+    rftarget.selection_center = Point((0, 0, 0))
+    rftarget.prev_state = {}
+    # no mirror modifier
+    rftarget.mirror_mod = SimpleNamespace(x=False, y=False, z=False, symmetry_threshold=0.001)
+    rftarget.editmesh_version = None
+    rftarget.xy_symmetry_accel = rftarget.xz_symmetry_accel = rftarget.yz_symmetry_accel = None
+    rftarget.unit_scaling_factor = 1.0
+    rftarget.dirty()
+    rftarget.rewrap()
+    return rftarget
@@ -0,0 +1,10 @@
+'''
+placeholder for Blender's bgl module.  see tests/conftest.py
+'''
+
+
+def __getattr__(name):
+    if name.startswith('__'): raise AttributeError(name)
+    def unavailable(*args, **kwargs):
+        raise NotImplementedError('bgl.%s is not available outside of Blender' % name)
+    return unavailable
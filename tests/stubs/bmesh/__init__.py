@@ -0,0 +1,11 @@
+'''
+minimal pure Python stand-in for Blender's bmesh module.  see tests/conftest.py
+'''
+
+from . import types
+from . import ops
+from . import utils
+
+
+def new():
+    return types.BMesh()
@@ -0,0 +1,11 @@
+'''
+placeholder for a Blender module: names can be imported, but not used.  see tests/conftest.py
+'''
+
+
+def __getattr__(name):
+    if name.startswith('__'): raise AttributeError(name)
+    def unavailable(*args, **kwargs):
+        raise NotImplementedError('%s.%s is not available outside of Blender' % (__name__, name))
+    unavailable.__name__ = name
+    return unavailable
@@ -0,0 +1,383 @@
+'''
+minimal pure Python stand-in for Blender's bmesh types.  models elements,
+topology, select / hide flags, custom data layers, and conversion to / from a
+(stand-in) bpy Mesh, which is what the RetopoFlow modules under test use.
+see tests/conftest.py
+'''
+
+from mathutils import Vector
+
+
+##########################################################
+# custom data layers
+
+class BMDeformVert(dict):
+    pass
+
+
+class BMLoopUV:
+    def __init__(self):
+        self.uv = Vector((0.0, 0.0))
+        self.pin_uv = False
+        self.select = False
+
+
+layer_defaults = {
+    'float':        lambda: 0.0,
+    'int':          lambda: 0,
+    'string':       lambda: b'',
+    'float_vector': lambda: Vector((0.0, 0.0, 0.0)),
+    'shape':        lambda: Vector((0.0, 0.0, 0.0)),
+    'deform':       BMDeformVert,
+    'crease':       lambda: 0.0,
+    'uv':           BMLoopUV,
+    'color':        lambda: Vector((1.0, 1.0, 1.0, 1.0)),
+}
+
+domain_layer_kinds = {
+    'verts': ('float', 'int', 'string', 'float_vector', 'shape', 'deform'),
+    'edges': ('float', 'int', 'string', 'crease'),
+    'faces': ('float', 'int', 'string'),
+    'loops': ('float', 'int', 'string', 'uv', 'color'),
+}
+
+
+class BMLayerItem:
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+
+
+class BMLayerCollection:
+    def __init__(self, kind):
+        self._kind = kind
+        self._layers = {}
+
+    def new(self, name=None):
+        name = name or self._kind
+        assert name not in self._layers, 'layer %s already exists' % name
+        layer = self._layers[name] = BMLayerItem(self._kind, name)
+        return layer
+
+    def verify(self):
+        return self.active or self.new()
+
+    def get(self, name, default=None): return self._layers.get(name, default)
+    def keys(self): return self._layers.keys()
+    def values(self): return self._layers.values()
+    def items(self): return self._layers.items()
+    def __getitem__(self, name): return self._layers[name]
+    def __iter__(self): return iter(self._layers.values())
+    def __len__(self): return len(self._layers)
+
+    @property
+    def active(self):
+        return next(iter(self._layers.values()), None)
+
+
+class BMLayerAccess:
+    def __init__(self, domain):
+        for kind in domain_layer_kinds[domain]:
+            setattr(self, kind, BMLayerCollection(kind))
+
+
+##########################################################
+# elements
+
+class BMElem:
+    def __init__(self):
+        self.is_valid = True
+        self.index = -1
+        self.hide = False
+        self.tag = False
+        self._select = False
+        self._layer_values = {}
+
+    def __getitem__(self, layer):
+        values = self._layer_values
+        if layer not in values: values[layer] = layer_defaults[layer.kind]()
+        return values[layer]
+
+    def __setitem__(self, layer, value):
+        if layer.kind in ('deform', 'uv'): raise AttributeError('cannot assign %s layer value' % layer.kind)
+        if layer.kind in ('float_vector', 'shape', 'color'): value = Vector(value)
+        self._layer_values[layer] = value
+
+    @property
+    def select(self): return self._select
+
+    def select_set(self, select): self.select = select
+
+
+class BMVert(BMElem):
+    def __init__(self, co):
+        super().__init__()
+        self.co = Vector(co)
+        self.normal = Vector((0.0, 0.0, 1.0))
+        self.link_edges = []
+        self.link_faces = []
+
+    @BMElem.select.setter
+    def select(self, select): self._select = bool(select)
+
+    # like bmesh, assigning any sequence of numbers copies it into the vert's own Vector
+    @property
+    def co(self): return self._co
+    @co.setter
+    def co(self, co): self._co = Vector(co)
+
+    @property
+    def normal(self): return self._normal
+    @normal.setter
+    def normal(self, normal): self._normal = Vector(normal)
+
+    def normal_update(self):
+        n = Vector((0.0, 0.0, 0.0))
+        for bmf in self.link_faces: n = n + bmf.normal
+        if n.length: self.normal = n.normalized()
+
+    @property
+    def link_loops(self):
+        return [loop for bmf in self.link_faces for loop in bmf.loops if loop.vert is self]
+
+
+class BMEdge(BMElem):
+    def __init__(self, verts):
+        super().__init__()
+        self.verts = list(verts)
+        self.link_faces = []
+        self.seam = False
+        self.smooth = True
+
+    @BMElem.select.setter
+    def select(self, select):
+        self._select = bool(select)
+        for bmv in self.verts: bmv._select = bool(select)
+
+    def other_vert(self, bmv):
+        v0, v1 = self.verts
+        return v1 if bmv is v0 else v0 if bmv is v1 else None
+
+
+class BMLoop(BMElem):
+    def __init__(self, vert, edge, face):
+        super().__init__()
+        self.vert, self.edge, self.face = vert, edge, face
+
+
+class BMFace(BMElem):
+    def __init__(self):
+        super().__init__()
+        self.loops = []
+        self.smooth = False
+        self.material_index = 0
+        self.normal = Vector((0.0, 0.0, 1.0))
+
+    @property
+    def verts(self): return [loop.vert for loop in self.loops]
+
+    @property
+    def edges(self): return [loop.edge for loop in self.loops]
+
+    @BMElem.select.setter
+    def select(self, select):
+        self._select = bool(select)
+        for loop in self.loops:
+            loop.edge._select = bool(select)
+            loop.vert._select = bool(select)
+
+    def normal_update(self):
+        co = [bmv.co for bmv in self.verts]
+        if len(co) < 3: return
+        n = Vector((0.0, 0.0, 0.0))
+        for (a, b) in zip(co, co[1:] + co[:1]):
+            n = n + a.cross(b)
+        if n.length: self.normal = n.normalized()
+
+    def normal_flip(self):
+        # keeps first loop; loops keep their vert (and custom data), edges are re-linked
+        loops = [self.loops[0]] + self.loops[:0:-1]
+        edges = [_edge_between(a.vert, b.vert) for (a, b) in zip(loops, loops[1:] + loops[:1])]
+        for (loop, bme) in zip(loops, edges): loop.edge = bme
+        self.loops = loops
+        self.normal = -self.normal
+
+
+def _edge_between(bmv0, bmv1):
+    return next((bme for bme in bmv0.link_edges if bmv1 in bme.verts), None)
+
+
+##########################################################
+# sequences
+
+class BMElemSeq(list):
+    def __init__(self, bm, domain):
+        super().__init__()
+        self.bm = bm
+        self.domain = domain
+        self.layers = BMLayerAccess(domain)
+
+    def index_update(self):
+        for (i, bmelem) in enumerate(self): bmelem.index = i
+
+    def ensure_lookup_table(self):
+        pass
+
+
+class BMVertSeq(BMElemSeq):
+    def new(self, co=(0.0, 0.0, 0.0), example=None):
+        bmv = BMVert(co)
+        self.append(bmv)
+        return bmv
+
+    def remove(self, bmv):
+        for bmf in list(bmv.link_faces): self.bm.faces.remove(bmf)
+        for bme in list(bmv.link_edges): self.bm.edges.remove(bme)
+        list.remove(self, bmv)
+        bmv.is_valid = False
+
+
+class BMEdgeSeq(BMElemSeq):
+    def new(self, verts, example=None):
+        bmv0, bmv1 = verts
+        if bmv0 is bmv1 or _edge_between(bmv0, bmv1): raise ValueError('edges.new(): edge exists')
+        bme = BMEdge(verts)
+        bmv0.link_edges.append(bme)
+        bmv1.link_edges.append(bme)
+        self.append(bme)
+        return bme
+
+    def remove(self, bme):
+        for bmf in list(bme.link_faces): self.bm.faces.remove(bmf)
+        for bmv in bme.verts: bmv.link_edges.remove(bme)
+        list.remove(self, bme)
+        bme.is_valid = False
+
+
+class BMFaceSeq(BMElemSeq):
+    def new(self, verts, example=None):
+        verts = list(verts)
+        if len(verts) < 3 or len(set(verts)) != len(verts): raise ValueError('faces.new(): invalid verts')
+        if any(set(bmf.verts) == set(verts) for bmf in verts[0].link_faces):
+            raise ValueError('faces.new(): face already exists')
+        bmf = BMFace()
+        for (bmv0, bmv1) in zip(verts, verts[1:] + verts[:1]):
+            bme = _edge_between(bmv0, bmv1) or self.bm.edges.new((bmv0, bmv1))
+            bmf.loops.append(BMLoop(bmv0, bme, bmf))
+            bme.link_faces.append(bmf)
+            bmv0.link_faces.append(bmf)
+        bmf.normal_update()
+        self.append(bmf)
+        return bmf
+
+    def remove(self, bmf):
+        for loop in bmf.loops:
+            loop.edge.link_faces.remove(bmf)
+            loop.vert.link_faces.remove(bmf)
+        list.remove(self, bmf)
+        bmf.is_valid = False
+
+
+class BMLoopSeq:
+    def __init__(self, bm):
+        self.layers = BMLayerAccess('loops')
+
+
+##########################################################
+# bmesh
+
+class BMesh:
+    def __init__(self):
+        self.verts = BMVertSeq(self, 'verts')
+        self.edges = BMEdgeSeq(self, 'edges')
+        self.faces = BMFaceSeq(self, 'faces')
+        self.loops = BMLoopSeq(self)
+        self.select_mode = {'VERT'}
+        self.is_valid = True
+
+    def free(self):
+        self.is_valid = False
+
+    def _layer_collections(self):
+        for (domain, seq) in (('verts', self.verts), ('edges', self.edges), ('faces', self.faces), ('loops', self.loops)):
+            for kind in domain_layer_kinds[domain]:
+                yield (domain, kind, getattr(seq.layers, kind))
+
+    def copy(self):
+        ''' copies geometry, flags, and custom data layers '''
+        bm = BMesh()
+        layer_map = {}
+        for (domain, kind, collection) in self._layer_collections():
+            target = getattr(getattr(bm, domain).layers, kind)
+            for (name, layer) in collection.items(): layer_map[layer] = target.new(name)
+        def copy_elem(src, dst):
+            dst._select = src._select
+            dst.hide = src.hide
+            for (layer, value) in src._layer_values.items():
+                if isinstance(value, BMDeformVert): value = BMDeformVert(value)
+                elif isinstance(value, BMLoopUV):
+                    luv = BMLoopUV()
+                    luv.uv, luv.pin_uv, luv.select = Vector(value.uv), value.pin_uv, value.select
+                    value = luv
+                elif isinstance(value, Vector): value = Vector(value)
+                dst._layer_values[layer_map[layer]] = value
+        vmap = {}
+        for bmv in self.verts:
+            nv = vmap[bmv] = bm.verts.new(bmv.co)
+            nv.normal = Vector(bmv.normal)
+            copy_elem(bmv, nv)
+        for bme in self.edges:
+            ne = bm.edges.new([vmap[bmv] for bmv in bme.verts])
+            ne.seam, ne.smooth = bme.seam, bme.smooth
+            copy_elem(bme, ne)
+        for bmf in self.faces:
+            nf = bm.faces.new([vmap[bmv] for bmv in bmf.verts])
+            nf.smooth, nf.material_index, nf.normal = bmf.smooth, bmf.material_index, Vector(bmf.normal)
+            copy_elem(bmf, nf)
+            for (src, dst) in zip(bmf.loops, nf.loops): copy_elem(src, dst)
+        # restore select flags, as copying edges / faces cascaded selection
+        for (src_seq, dst_seq) in ((self.verts, bm.verts), (self.edges, bm.edges), (self.faces, bm.faces)):
+            for (src, dst) in zip(src_seq, dst_seq): dst._select = src._select
+        return bm
+
+    def to_mesh(self, me):
+        ''' writes geometry and flags (not custom data layers) to bpy Mesh '''
+        self.verts.index_update()
+        self.edges.index_update()
+        for coll in (me.vertices, me.edges, me.loops, me.polygons): del coll[:]
+        me.vertices.add(len(self.verts))
+        for (bmv, mv) in zip(self.verts, me.vertices):
+            mv.co, mv.normal, mv.select, mv.hide = list(bmv.co), list(bmv.normal), bmv.select, bmv.hide
+        me.edges.add(len(self.edges))
+        for (bme, me_) in zip(self.edges, me.edges):
+            me_.vertices = [bmv.index for bmv in bme.verts]
+            me_.select, me_.hide, me_.use_seam, me_.use_edge_sharp = bme.select, bme.hide, bme.seam, not bme.smooth
+        me.polygons.add(len(self.faces))
+        for (bmf, mp) in zip(self.faces, me.polygons):
+            mp.loop_start, mp.loop_total = len(me.loops), len(bmf.loops)
+            mp.select, mp.hide, mp.use_smooth, mp.material_index = bmf.select, bmf.hide, bmf.smooth, bmf.material_index
+            me.loops.add(len(bmf.loops))
+            for (loop, ml) in zip(bmf.loops, me.loops[mp.loop_start:]):
+                ml.vertex_index, ml.edge_index = loop.vert.index, loop.edge.index
+
+    def from_mesh(self, me):
+        ''' reads geometry and flags from bpy Mesh '''
+        verts = []
+        for mv in me.vertices:
+            bmv = self.verts.new(mv.co)
+            bmv.normal, bmv.hide = Vector(mv.normal), mv.hide
+            verts.append(bmv)
+        edges = []
+        for me_ in me.edges:
+            bme = self.edges.new([verts[i] for i in me_.vertices])
+            bme.hide, bme.seam, bme.smooth = me_.hide, me_.use_seam, not me_.use_edge_sharp
+            edges.append(bme)
+        faces = []
+        for mp in me.polygons:
+            loops = me.loops[mp.loop_start:mp.loop_start+mp.loop_total]
+            bmf = self.faces.new([verts[ml.vertex_index] for ml in loops])
+            bmf.hide, bmf.smooth, bmf.material_index = mp.hide, mp.use_smooth, mp.material_index
+            faces.append(bmf)
+        # select flags last, as selecting cascades
+        for (seq, melems) in ((verts, me.vertices), (edges, me.edges), (faces, me.polygons)):
+            for (bmelem, melem) in zip(seq, melems): bmelem._select = bool(melem.select)
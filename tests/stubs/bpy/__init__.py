@@ -0,0 +1,60 @@
+'''
+minimal stand-in for Blender's bpy module.  only Mesh datablocks are modeled,
+with the attributes RetopoFlow reads / writes in bulk with foreach_get /
+foreach_set (see rfmesh_snapshot.py).  see tests/conftest.py
+'''
+
+from types import SimpleNamespace
+
+from . import types
+
+
+class MeshCollection(list):
+    def __init__(self, defaults):
+        super().__init__()
+        self._defaults = defaults
+
+    def add(self, count):
+        for _ in range(count):
+            self.append(SimpleNamespace(**{ k: (list(v) if isinstance(v, list) else v) for (k, v) in self._defaults.items() }))
+
+    def foreach_get(self, attr, arr):
+        values = []
+        for item in self:
+            v = getattr(item, attr)
+            if isinstance(v, (list, tuple)): values.extend(v)
+            else: values.append(v)
+        arr[:] = values
+
+    def foreach_set(self, attr, arr):
+        arr = list(arr)
+        if not self: return
+        width = len(arr) // len(self)
+        for (i, item) in enumerate(self):
+            v = getattr(item, attr)
+            if isinstance(v, list): setattr(item, attr, arr[i*width:(i+1)*width])
+            else: setattr(item, attr, type(v)(arr[i]))
+
+
+class Mesh:
+    def __init__(self, name):
+        self.name = name
+        self.vertices = MeshCollection({'co': [0.0, 0.0, 0.0], 'normal': [0.0, 0.0, 1.0], 'select': False, 'hide': False})
+        self.edges    = MeshCollection({'vertices': [0, 0], 'select': False, 'hide': False, 'use_seam': False, 'use_edge_sharp': False})
+        self.loops    = MeshCollection({'vertex_index': 0, 'edge_index': 0})
+        self.polygons = MeshCollection({'loop_start': 0, 'loop_total': 0, 'select': False, 'hide': False, 'use_smooth': False, 'material_index': 0})
+
+
+class Meshes(list):
+    def new(self, name):
+        me = Mesh(name)
+        self.append(me)
+        return me
+
+    def remove(self, me):
+        list.remove(self, me)
+
+
+data = SimpleNamespace(meshes=Meshes(), objects={}, texts={}, filepath='')
+app = SimpleNamespace(version=(2, 93, 0), handlers=SimpleNamespace())
+context = SimpleNamespace()
@@ -0,0 +1,12 @@
+'''
+placeholder for bpy.types: any type can be named (ex: in annotations), but types are empty.
+see tests/conftest.py
+'''
+
+_types = {}
+
+
+def __getattr__(name):
+    if name.startswith('__'): raise AttributeError(name)
+    if name not in _types: _types[name] = type(name, (), {})
+    return _types[name]
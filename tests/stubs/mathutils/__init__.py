@@ -0,0 +1,111 @@
+'''
+minimal stand-in for Blender's mathutils module, enough for the RetopoFlow
+modules under test to import and to do basic vector math.  see tests/conftest.py
+'''
+
+import math
+
+
+class Vector:
+    def __new__(cls, seq=(0.0, 0.0, 0.0), *args, **kwargs):
+        self = object.__new__(cls)
+        object.__setattr__(self, '_v', [float(v) for v in seq])
+        return self
+
+    def __init__(self, *args, **kwargs):
+        # mathutils types are initialized in __new__
+        pass
+
+    def __len__(self): return len(self._v)
+    def __iter__(self): return iter(self._v)
+    def __getitem__(self, i): return self._v[i]
+    def __setitem__(self, i, v): self._v[i] = float(v)
+    def __repr__(self): return 'Vector(%s)' % (tuple(self._v),)
+    def __eq__(self, other):
+        try: return len(self) == len(other) and all(a == b for (a, b) in zip(self, other))
+        except TypeError: return False
+    def __hash__(self): return id(self)
+
+    def _xyz(i):
+        def get(self): return self._v[i]
+        def set(self, v): self._v[i] = float(v)
+        return property(get, set)
+    x, y, z, w = _xyz(0), _xyz(1), _xyz(2), _xyz(3)
+
+    def __add__(self, other): return Vector([a + b for (a, b) in zip(self, other)])
+    def __sub__(self, other): return Vector([a - b for (a, b) in zip(self, other)])
+    def __neg__(self): return Vector([-a for a in self])
+    def __mul__(self, s):
+        if isinstance(s, (int, float)): return Vector([a * s for a in self])
+        return Vector([a * b for (a, b) in zip(self, s)])
+    __rmul__ = __mul__
+    def __truediv__(self, s): return Vector([a / s for a in self])
+    def __matmul__(self, other): return self.dot(other)
+
+    def dot(self, other): return sum(a * b for (a, b) in zip(self, other))
+    def cross(self, other):
+        (ax, ay, az), (bx, by, bz) = self, other
+        return Vector((ay * bz - az * by, az * bx - ax * bz, ax * by - ay * bx))
+
+    @property
+    def length_squared(self): return self.dot(self)
+    @property
+    def length(self): return math.sqrt(self.length_squared)
+
+    def normalize(self):
+        l = self.length
+        if l: self._v = [a / l for a in self._v]
+    def normalized(self):
+        v = Vector(self)
+        v.normalize()
+        return v
+    def copy(self): return type(self)(self)
+    def to_tuple(self, precision=None): return tuple(self._v)
+    def to_3d(self): return Vector((self._v + [0.0, 0.0, 0.0])[:3])
+    def to_4d(self): return Vector((self._v + [0.0, 0.0, 0.0])[:3] + [1.0])
+
+
+class Matrix:
+    def __init__(self, rows=None):
+        if rows is None: rows = [[float(i == j) for j in range(4)] for i in range(4)]
+        self._rows = [Vector(row) for row in rows]
+
+    @staticmethod
+    def Identity(n):
+        return Matrix([[float(i == j) for j in range(n)] for i in range(n)])
+
+    def __len__(self): return len(self._rows)
+    def __iter__(self): return iter(self._rows)
+    def __getitem__(self, i): return self._rows[i]
+
+    def __matmul__(self, other):
+        if isinstance(other, Matrix):
+            cols = list(zip(*other))
+            return Matrix([[sum(a * b for (a, b) in zip(row, col)) for col in cols] for row in self])
+        v = list(other)
+        n = len(self)
+        if len(v) == n - 1:
+            r = [sum(a * b for (a, b) in zip(row, v + [1.0])) for row in self]
+            return Vector([c / r[-1] for c in r[:-1]]) if r[-1] else Vector(r[:-1])
+        return Vector([sum(a * b for (a, b) in zip(row, v)) for row in self])
+
+    def inverted(self):
+        import numpy as np
+        return Matrix(np.linalg.inv(np.array([list(r) for r in self])).tolist())
+
+    def determinant(self):
+        import numpy as np
+        return float(np.linalg.det(np.array([list(r) for r in self])))
+
+    def transposed(self): return Matrix(list(zip(*self)))
+    def to_3x3(self): return Matrix([list(row)[:3] for row in self._rows[:3]])
+    def copy(self): return Matrix(self)
+
+
+class Quaternion:
+    def __init__(self, axis=(1.0, 0.0, 0.0, 0.0), angle=None):
+        self.axis, self.angle = axis, angle
+
+
+class Color(Vector):
+    pass
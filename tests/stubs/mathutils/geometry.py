@@ -0,0 +1,34 @@
+'''
+stand-in for Blender's mathutils.geometry module: only normal() and
+intersect_line_plane() are modeled; other names can be imported, but not used.
+see tests/conftest.py
+'''
+
+from . import Vector
+
+
+def normal(*vectors):
+    ''' normal of polygon (Newell's method) '''
+    if len(vectors) == 1: vectors = vectors[0]
+    vectors = [Vector(v) for v in vectors]
+    n = Vector((0.0, 0.0, 0.0))
+    for (a, b) in zip(vectors, vectors[1:] + vectors[:1]):
+        n += Vector(((a.y - b.y) * (a.z + b.z), (a.z - b.z) * (a.x + b.x), (a.x - b.x) * (a.y + b.y)))
+    return n.normalized()
+
+
+def intersect_line_plane(line_a, line_b, plane_co, plane_no):
+    ''' point where (infinite) line through line_a and line_b crosses plane, or None if parallel '''
+    line_a, line_b, plane_co, plane_no = map(Vector, (line_a, line_b, plane_co, plane_no))
+    d = line_b - line_a
+    den = d.dot(plane_no)
+    if abs(den) < 1e-12: return None
+    return line_a + d * ((plane_co - line_a).dot(plane_no) / den)
+
+
+def __getattr__(name):
+    if name.startswith('__'): raise AttributeError(name)
+    def unavailable(*args, **kwargs):
+        raise NotImplementedError('%s.%s is not available outside of Blender' % (__name__, name))
+    unavailable.__name__ = name
+    return unavailable
@@ -0,0 +1,173 @@
+'''
+Copyright (C) 2021 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import numpy as np
+from mathutils import Vector
+
+from retopoflow_addon.addon_common.common.maths import Point, Normal, Plane
+from retopoflow_addon.retopoflow.rfmesh.rfmesh_arrays import RFMeshArrays, RFMeshProjection, plane_intersection_segments
+from meshes import grid_bmesh, target_for
+
+
+def assert_arrays_match(arrays, rftarget):
+    fresh = RFMeshArrays(rftarget)
+    assert arrays.counts == fresh.counts
+    for attr in ['co', 'normal', 'co_world', 'normal_world', 'edge_verts', 'face_offsets', 'face_verts']:
+        assert np.allclose(getattr(arrays, attr), getattr(fresh, attr)), attr
+
+
+def test_arrays_mirror_bmesh():
+    rftarget = target_for(grid_bmesh(4, 3))
+    bme = rftarget.bme
+    arrays = rftarget.get_arrays()
+    assert arrays.counts == (len(bme.verts), len(bme.edges), len(bme.faces))
+    assert np.allclose(arrays.co, [tuple(bmv.co) for bmv in bme.verts])
+    assert arrays.edge_verts.tolist() == [[bmv.index for bmv in bme_.verts] for bme_ in bme.edges]
+    face_verts = [arrays.face_verts[i0:i1].tolist() for (i0, i1) in zip(arrays.face_offsets[:-1], arrays.face_offsets[1:])]
+    assert face_verts == [[bmv.index for bmv in bmf.verts] for bmf in bme.faces]
+
+
+def test_arrays_follow_edits():
+    ''' moved, created, and removed elements show up in mirror '''
+    rftarget = target_for(grid_bmesh(4, 3))
+    bme = rftarget.bme
+    rftarget.get_arrays()
+
+    rfv = rftarget._wrap_bmvert(bme.verts[7])
+    rfv.co = rfv.co + Vector((0.25, 0.5, -1.0))
+    rftarget.dirty()
+    arrays = rftarget.get_arrays()
+    assert np.allclose(arrays.co_world[7], tuple(rfv.co))
+    assert_arrays_match(arrays, rftarget)
+
+    rfv_new = rftarget.new_vert((9.0, 9.0, 0.0), (0.0, 0.0, 1.0))
+    rftarget.new_face([rfv, rftarget._wrap_bmvert(bme.verts[8]), rfv_new])
+    rftarget.dirty()
+    arrays = rftarget.get_arrays()
+    assert arrays.counts == (21, 33, 13)
+    assert_arrays_match(arrays, rftarget)
+
+    rftarget.delete_verts([rftarget._wrap_bmvert(bme.verts[0])])
+    rftarget.delete_faces([bme.faces[0]], del_empty_edges=True, del_empty_verts=False)
+    rftarget.dirty()
+    arrays = rftarget.get_arrays()
+    assert arrays.counts == (len(bme.verts), len(bme.edges), len(bme.faces))
+    assert_arrays_match(arrays, rftarget)
+
+
+def test_selection_change_refreshes_flags():
+    rftarget = target_for(grid_bmesh(4, 3))
+    arrays = rftarget.get_arrays()
+    assert not rftarget.any_selected()
+    rftarget.select(rftarget._wrap_bmface(rftarget.bme.faces[5]))
+    assert rftarget.get_arrays() is arrays
+    assert arrays.selected_face_indices().tolist() == [5]
+    assert arrays.selected_vert_indices().tolist() == sorted(bmv.index for bmv in rftarget.bme.faces[5].verts)
+    center = np.mean([tuple(bmv.co) for bmv in rftarget.bme.faces[5].verts], axis=0)
+    assert np.allclose(tuple(rftarget.get_selection_center()), center)
+
+
+def test_topology_change_rebuilds():
+    rftarget = target_for(grid_bmesh(4, 3))
+    arrays = rftarget.get_arrays()
+    rftarget.new_vert((9.0, 9.0, 0.0), (0.0, 0.0, 1.0))
+    assert rftarget.get_arrays() is not arrays
+    arrays = rftarget.get_arrays()
+    rftarget.delete_faces([rftarget.bme.faces[0]], del_empty_edges=False, del_empty_verts=False)
+    assert rftarget.get_arrays() is not arrays
+    arrays = rftarget.get_arrays()
+    rftarget.select(rftarget._wrap_bmface(rftarget.bme.faces[0]))
+    rftarget.flip_face_normals()
+    assert rftarget.get_arrays() is not arrays
+
+
+def test_moved_verts_update_in_place():
+    rftarget = target_for(grid_bmesh(4, 3))
+    arrays = rftarget.get_arrays()
+    rfv = rftarget._wrap_bmvert(rftarget.bme.verts[7])
+    rfv.co = rfv.co + Vector((0.25, 0.5, -1.0))
+    rftarget.dirty()
+    assert rftarget.get_arrays() is arrays
+    assert arrays.serial == 1
+    assert arrays.moved_since(0).tolist() == [7]
+    assert_arrays_match(arrays, rftarget)
+
+    rfv.normal = Vector((0.0, 1.0, 0.0))
+    rftarget._wrap_bmvert(rftarget.bme.verts[2]).co = Vector((2.0, 0.0, 3.0))
+    assert rftarget.get_arrays() is arrays
+    assert arrays.moved_since(0).tolist() == [2, 7]
+    assert arrays.moved_since(1).tolist() == [2, 7]
+    assert arrays.moved_since(2).tolist() == []
+    assert_arrays_match(arrays, rftarget)
+
+
+def test_moved_since_forgets_old_updates():
+    rftarget = target_for(grid_bmesh(2, 2))
+    arrays = rftarget.get_arrays()
+    rfv = rftarget._wrap_bmvert(rftarget.bme.verts[0])
+    for _ in range(RFMeshArrays.moved_log_length + 1):
+        rfv.co = rfv.co + Vector((0.1, 0.0, 0.0))
+        rftarget.get_arrays()
+    assert arrays.moved_since(0) is None
+    assert arrays.moved_since(1).tolist() == [0]
+
+
+def test_projection_update_verts():
+    rftarget = target_for(grid_bmesh(3, 3))
+    arrays = rftarget.get_arrays()
+    project = lambda co: (co[:, :2] * 10, co[:, 2], np.ones(len(co), dtype=bool))
+    proj = RFMeshProjection(arrays, 'view', *project(arrays.co_world))
+    rfv = rftarget._wrap_bmvert(rftarget.bme.verts[4])
+    rfv.co = Vector((1.5, 1.25, 0.0))
+    rftarget.get_arrays()
+    assert proj.is_current(arrays, 'view') and proj.serial != arrays.serial
+    indices = arrays.moved_since(proj.serial)
+    proj.update_verts(indices, *project(arrays.co_world[indices]))
+    assert proj.serial == arrays.serial
+    assert proj.Point2D(4) == (15.0, 12.5)
+    assert np.allclose(proj.xy, project(arrays.co_world)[0])
+
+
+def test_plane_intersection_segments_match_triangle_intersection():
+    plane = Plane(Point((0.0, 0.0, 0.0)), Normal((1.0, 0.0, 0.0)))
+    co = np.array([
+        (-1.0, 0.0, 0.0), (1.0, 0.0, 0.0), (1.0, 1.0, 0.0),     # crossing
+        (0.0, 2.0, 0.0), (1.0, 2.0, 0.0), (1.0, 3.0, 0.0),      # one vert on plane, others on same side
+        (0.0, 4.0, 0.0), (-1.0, 5.0, 0.0), (1.0, 5.0, 0.0),     # one vert on plane, others on either side
+        (0.0, 6.0, 0.0), (0.0, 7.0, 0.0), (-1.0, 6.0, 0.0),     # two verts on plane
+        (0.0, 8.0, 0.0), (0.0, 9.0, 1.0), (0.0, 9.0, 0.0),      # in plane (skipped)
+        (2.0, 0.0, 0.0), (3.0, 0.0, 0.0), (2.0, 1.0, 0.0),      # one side
+    ])
+    tris = np.arange(len(co)).reshape((-1, 3))
+    tris = np.concatenate([tris, np.roll(tris, 1, axis=1), np.roll(tris, 2, axis=1)])
+    mx = np.eye(4)
+    mx[:3, 3] = (0.0, 0.0, 5.0)
+
+    segments = plane_intersection_segments(co, tris, np.zeros(3), np.array((1.0, 0.0, 0.0)), mx)
+    # triangles lying in plane split no edge, so they are skipped (as RFMesh.plane_intersection always did)
+    expected = [
+        (tuple(p0), tuple(p1))
+        for tri in tris.tolist()
+        if any(plane.side(Point(co[i])) for i in tri)
+        for (p0, p1) in plane.triangle_intersection([Point(co[i]) for i in tri])
+    ]
+    key = lambda seg: tuple(round(c, 9) for p in seg for c in p)
+    assert sorted(map(key, (segments - (0.0, 0.0, 5.0)).tolist())) == sorted(map(key, expected))
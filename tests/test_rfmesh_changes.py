@@ -0,0 +1,53 @@
+'''
+Copyright (C) 2021 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from mathutils import Vector
+
+from meshes import grid_bmesh, target_for
+
+
+def test_pop_changes():
+    rftarget = target_for(grid_bmesh(3, 3))
+    assert rftarget.pop_changes() is None
+    rftarget.track_changes()
+    assert rftarget.pop_changes() == (set(), set(), set(), False)
+
+    bme = rftarget.bme
+    rfv = rftarget._wrap_bmvert(bme.verts[5])
+    rfv.co = rfv.co + Vector((0.1, 0.0, 0.0))
+    rfv_new = rftarget.new_vert((5.0, 5.0, 0.0), (0.0, 0.0, 1.0))
+    rff = rftarget.new_face([rfv, rftarget._wrap_bmvert(bme.verts[6]), rfv_new])
+    bmvs, bmes, bmfs, removed = rftarget.pop_changes()
+    assert bmvs == {bme.verts[5], rftarget._unwrap(rfv_new)}
+    # edge between verts 5 and 6 already existed
+    assert bmes == { bme_ for bme_ in rftarget._unwrap(rff).edges if rftarget._unwrap(rfv_new) in bme_.verts }
+    assert bmfs == {rftarget._unwrap(rff)}
+    assert not removed
+
+    # created and then removed elements are not reported
+    rfv_new = rftarget.new_vert((6.0, 5.0, 0.0), (0.0, 0.0, 1.0))
+    rftarget.delete_verts([rfv_new])
+    assert rftarget.pop_changes() == (set(), set(), set(), True)
+    assert rftarget.pop_changes() == (set(), set(), set(), False)
+
+    # changes that cannot be tracked stop tracking
+    rftarget._journal_untracked()
+    assert rftarget.pop_changes() is None
@@ -0,0 +1,82 @@
+'''
+Copyright (C) 2021 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from mathutils import Vector
+
+from retopoflow_addon.addon_common.common.maths import Point, Normal, Plane
+from meshes import grid_bmesh, target_for, rounded
+
+
+def crawls(rftarget, bmf_start, plane):
+    ''' returns crawls of both implementations, as (face index, rounded point, face index) '''
+    index = lambda bmf: bmf.index if bmf else None
+    return [
+        [(index(f0), rounded(pt), index(f1)) for (f0, pt, f1) in crawl(bmf_start, plane)]
+        for crawl in (rftarget._crawl_arrays, rftarget._crawl_bmesh)
+    ]
+
+
+def test_crawl_across_edges():
+    # plane x=1.5 crosses the middle of a column of faces, and no verts
+    rftarget = target_for(grid_bmesh(4, 3))
+    bme = rftarget.bme
+    plane = Plane(Point((1.5, 0.0, 0.0)), Normal((1.0, 0.0, 0.0)))
+    crawl_arrays, crawl_bmesh = crawls(rftarget, bme.faces[5], plane)
+    assert crawl_arrays == crawl_bmesh
+    assert crawl_arrays == [
+        (None, (1.5, 0.0, 0.0), 1),
+        (1,    (1.5, 1.0, 0.0), 5),
+        (5,    (1.5, 2.0, 0.0), 9),
+        (9,    (1.5, 3.0, 0.0), None),
+    ]
+
+
+def test_crawl_through_verts_on_plane():
+    # diagonal plane x+y=2 runs exactly through verts (2,0), (1,1), (0,2).  faces that only
+    # touch plane at one vert are dropped, and verts on plane are crossings themselves
+    rftarget = target_for(grid_bmesh(4, 3))
+    bme = rftarget.bme
+    plane = Plane(Point((2.0, 0.0, 0.0)), Normal(Vector((1.0, 1.0, 0.0)).normalized()))
+    crawl_arrays, crawl_bmesh = crawls(rftarget, bme.faces[1], plane)
+    assert crawl_arrays == crawl_bmesh
+    assert crawl_arrays == [
+        (None, (2.0, 0.0, 0.0), 1),
+        (1,    (1.0, 1.0, 0.0), 4),
+        (4,    (0.0, 2.0, 0.0), None),
+    ]
+
+
+def test_crawl_through_verts_and_edges():
+    # plane through verts (2,1) and (1,3) also crosses edges in between
+    rftarget = target_for(grid_bmesh(4, 3))
+    bme = rftarget.bme
+    plane = Plane(Point((2.0, 1.0, 0.0)), Normal(Vector((1.0, 0.5, 0.0)).normalized()))
+    crawl_arrays, crawl_bmesh = crawls(rftarget, bme.faces[2], plane)
+    assert crawl_arrays == crawl_bmesh
+    points = [pt for (_, pt, _) in crawl_arrays]
+    assert len(points) == len(set(points))
+    assert (2.0, 1.0, 0.0) in points and (1.0, 3.0, 0.0) in points
+    assert all(abs((x - 2.0) + 0.5 * (y - 1.0)) < 1e-5 for (x, y, _) in points)
+
+    # vert within zero_threshold of plane counts as on plane in both crawls
+    bme.verts[7].co = Vector((2.0 - 1e-9, 1.0, 0.0))
+    rftarget.dirty()
+    assert crawls(rftarget, bme.faces[2], plane) == [crawl_arrays, crawl_arrays]
@@ -0,0 +1,90 @@
+'''
+Copyright (C) 2021 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import random
+
+from mathutils import Vector
+
+from meshes import grid_bmesh, target_for
+
+
+def brute_force(rftarget, point, dist):
+    return { bmv for bmv in rftarget.bme.verts if (bmv.co - point).length <= dist }
+
+
+def query(grid, point, dist):
+    return { bmv for (bmv, _) in grid.verts_within(point, dist) }
+
+
+def test_verts_within_matches_brute_force():
+    rftarget = target_for(grid_bmesh(8, 8, size=0.25))
+    grid = rftarget.get_vert_grid(0.3)
+    assert len(grid) == len(rftarget.bme.verts)
+    rng = random.Random(0)
+    for _ in range(20):
+        point = Vector((rng.uniform(-0.5, 2.5), rng.uniform(-0.5, 2.5), rng.uniform(-0.2, 0.2)))
+        dist = rng.uniform(0.1, 0.6)
+        assert query(grid, point, dist) == brute_force(rftarget, point, dist)
+
+
+def test_grid_follows_moved_and_removed_verts():
+    rftarget = target_for(grid_bmesh(4, 4))
+    grid = rftarget.get_vert_grid(0.5)
+    bme = rftarget.bme
+
+    rfv = rftarget._wrap_bmvert(bme.verts[12])
+    rfv.co = Vector((10.0, 10.0, 0.0))
+    assert query(grid, Vector((10.0, 10.0, 0.0)), 0.1) == {bme.verts[12]}
+
+    removed = bme.verts[6]
+    rftarget.delete_verts([removed])
+    # removed while still valid, so grid agrees with bmesh without a rebuild
+    assert len(grid) == len(bme.verts)
+    assert rftarget.get_vert_grid(0.5) is grid
+    assert query(grid, Vector((1.0, 1.0, 0.0)), 0.1) == set()
+
+    rftarget.delete_faces([bme.faces[0]])
+    assert len(grid) == len(bme.verts)
+    assert rftarget.get_vert_grid(0.5) is grid
+    for bmv in bme.verts: assert query(grid, bmv.co, 1e-6) == {bmv}
+
+
+def test_grid_rebuilt_after_untracked_change():
+    rftarget = target_for(grid_bmesh(4, 4))
+    grid = rftarget.get_vert_grid(0.5)
+    rftarget._journal_untracked()
+    rftarget.bme.verts.remove(rftarget.bme.verts[0])
+    rebuilt = rftarget.get_vert_grid(0.5)
+    assert rebuilt is not grid
+    assert len(rebuilt) == len(rftarget.bme.verts)
+    # counts disagreeing with bmesh also rebuild
+    rftarget.bme.verts.new((5.0, 5.0, 0.0))
+    assert rftarget.get_vert_grid(0.5) is not rebuilt
+
+
+def test_built_grid_matches_incremental_insert():
+    rftarget = target_for(grid_bmesh(8, 8, size=0.25))
+    grid = rftarget.get_vert_grid(0.3)
+    cells, vert_cell = dict(grid.cells), dict(grid.vert_cell)
+    grid.cells, grid.vert_cell = {}, {}
+    for bmv in rftarget.bme.verts: grid.move(bmv)
+    assert grid.cells == cells
+    assert grid.vert_cell == vert_cell
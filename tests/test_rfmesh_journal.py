@@ -0,0 +1,97 @@
+'''
+Copyright (C) 2021 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from mathutils import Vector
+
+from retopoflow_addon.retopoflow.rfmesh.rfmesh_journal import RFMeshJournal
+from meshes import bmesh_signature, rounded, target_for
+from test_rfmesh_snapshot import layered_bmesh
+
+
+def layer_values(bme):
+    '''
+    values of the layers of layered_bmesh, keyed by element position rather than element
+    order (journal recreates elements at the end of the bmesh)
+    '''
+    uv = bme.loops.layers.uv['UVMap']
+    deform = bme.verts.layers.deform['deform']
+    crease = bme.edges.layers.crease['crease']
+    label = bme.faces.layers.string['label']
+    face_key = lambda bmf: frozenset(rounded(bmv.co) for bmv in bmf.verts)
+    return (
+        { (face_key(bmf), rounded(bml.vert.co)): (rounded(bml[uv].uv), bml[uv].pin_uv) for bmf in bme.faces for bml in bmf.loops },
+        { rounded(bmv.co): dict(bmv[deform]) for bmv in bme.verts },
+        { frozenset(rounded(bmv.co) for bmv in bme_.verts): round(bme_[crease], 5) for bme_ in bme.edges },
+        { face_key(bmf): bmf[label] for bmf in bme.faces },
+    )
+
+
+def state(rftarget):
+    return (bmesh_signature(rftarget.bme), layer_values(rftarget.bme))
+
+
+def edit(rftarget):
+    ''' removes two faces (and a vert), moves a vert, creates a vert and face '''
+    bme = rftarget.bme
+    rftarget.delete_faces([bme.faces[2], bme.faces[4]], del_empty_edges=True, del_empty_verts=True)
+    rfv = rftarget._wrap_bmvert(bme.verts[5])
+    rfv.co = rfv.co + Vector((0.1, 0.2, 0.3))
+    rfv_new = rftarget.new_vert((5.0, 5.0, 0.0), (0.0, 0.0, 1.0))
+    rftarget.new_face([rfv, rftarget._wrap_bmvert(bme.verts[6]), rfv_new])
+
+
+def test_revert_replay_keeps_layers():
+    rftarget = target_for(layered_bmesh())
+    journal = RFMeshJournal(rftarget)
+    before = state(rftarget)
+    entry = journal.open('edit')
+    edit(rftarget)
+    assert journal.is_intact(entry)
+    after = state(rftarget)
+    assert after != before
+
+    journal.revert(entry)
+    assert state(rftarget) == before
+    journal.replay(entry)
+    assert bmesh_signature(rftarget.bme) == after[0]
+    # new face gets default layer values both times, so all values match
+    assert layer_values(rftarget.bme) == after[1]
+    journal.revert(entry)
+    assert state(rftarget) == before
+
+
+def test_is_intact_catches_replaced_vert():
+    rftarget = target_for(layered_bmesh())
+    journal = RFMeshJournal(rftarget)
+    entry = journal.open('edit')
+    bme = rftarget.bme
+    bmv = bme.verts[0]
+    rfv = rftarget._wrap_bmvert(bmv)
+    rfv.co = rfv.co + Vector((0.1, 0.0, 0.0))
+    assert journal.is_intact(entry)
+    # behind journal's back: replace corner vert (and its edges and face) with a new one,
+    # which keeps element counts unchanged
+    bmv1, bmv4 = [bme_.other_vert(bmv) for bme_ in bmv.link_edges]
+    bmv5 = next(v for v in bmv.link_faces[0].verts if v not in (bmv, bmv1, bmv4))
+    bme.verts.remove(bmv)
+    bme.faces.new((bme.verts.new((-0.5, -0.5, 0.0)), bmv1, bmv5, bmv4))
+    assert journal.counts() == entry.counts
+    assert not journal.is_intact(entry)
@@ -0,0 +1,59 @@
+'''
+Copyright (C) 2021 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import numpy as np
+
+from retopoflow_addon.retopoflow.rfmesh.rfmesh_raster import RFMeshFaceBuffer
+from meshes import grid_bmesh, target_for
+
+
+def grid_facebuffer():
+    '''
+    face buffer of 4x3 grid seen from above, orthographic, where each world unit is two
+    pixels: face j*4+i covers pixels x in (2i, 2i+1) and y in (2j, 2j+1)
+    '''
+    arrays = target_for(grid_bmesh(4, 3)).get_arrays()
+    view = np.eye(4)
+    persp = np.array([
+        [0.5, 0.0,     0.0, -1.0],
+        [0.0, 2.0 / 3, 0.0, -1.0],
+        [0.0, 0.0,     0.0,  0.0],
+        [0.0, 0.0,     0.0,  1.0],
+    ])
+    return RFMeshFaceBuffer(arrays, np.arange(arrays.counts[2]), view, persp, False, 8, 6)
+
+
+def test_face_at():
+    facebuffer = grid_facebuffer()
+    assert facebuffer.face_at(3.2, 3.7) == 5
+    assert facebuffer.face_at(7.9, 0.1) == 3
+    assert facebuffer.face_at(8.5, 1.0) == -1
+
+
+def test_faces_within_brush():
+    facebuffer = grid_facebuffer()
+    # radius 0 is pixel under point
+    assert facebuffer.faces_within(3.2, 3.7, 0).tolist() == [5]
+    # pixel centers (3.5, 1.5), (4.5, 1.5), (3.5, 2.5), (4.5, 2.5) are within radius
+    assert facebuffer.faces_within(4.0, 2.0, 1.1).tolist() == [1, 2, 5, 6]
+    # window is clipped to region
+    assert facebuffer.faces_within(0.0, 0.0, 1.0).tolist() == [0]
+    assert facebuffer.faces_within(-5.0, -5.0, 1.0).tolist() == []
@@ -0,0 +1,113 @@
+'''
+Copyright (C) 2021 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import pytest
+from mathutils import Vector
+
+from retopoflow_addon.retopoflow.rfmesh.rfmesh_journal import RFMeshJournal
+from retopoflow_addon.retopoflow.rfmesh.rfmesh_recovery import RFTargetRecovery, replay_recovery, save_target_backup
+from meshes import grid_bmesh, bmesh_signature, target_for
+
+
+def record_steps(rftarget, journal, recovery, steps):
+    ''' runs each step as its own journal entry, recording entries as RetopoFlow_Undo does '''
+    for step in steps:
+        entry = journal.open('step')
+        step(rftarget)
+        recovery.record(journal, entry)
+
+
+def move_vert(rftarget):
+    rfv = rftarget._wrap_bmvert(rftarget.bme.verts[6])
+    rfv.co = rfv.co + Vector((0.25, -0.5, 0.125))
+
+def add_face(rftarget):
+    rfvs = [rftarget._wrap_bmvert(rftarget.bme.verts[i]) for i in (3, 4)]
+    rfv = rftarget.new_vert((6.0, 0.5, 0.0), (0.0, 0.0, 1.0))
+    rftarget.new_face(rfvs + [rfv])
+
+def move_new_vert(rftarget):
+    rfv = rftarget._wrap_bmvert(rftarget.bme.verts[-1])
+    rfv.co = rfv.co + Vector((0.0, 1.0, 0.0))
+
+def delete_new_face(rftarget):
+    rftarget.delete_faces([rftarget.bme.faces[-1]])
+
+def delete_face(rftarget):
+    rftarget.delete_faces([rftarget.bme.faces[1]])
+
+def select_face(rftarget):
+    rftarget.deselect_all()
+    rftarget.select(rftarget._wrap_bmface(rftarget.bme.faces[-1]))
+
+
+@pytest.mark.parametrize('interval', [100, 2])
+def test_record_replay(tmp_path, options, interval):
+    options['recovery checkpoint interval'] = interval
+    rftarget = target_for(grid_bmesh(4, 3))
+    journal = RFMeshJournal(rftarget)
+    filepath = str(tmp_path / 'target.rfj')
+    recovery = RFTargetRecovery(filepath, {'object': 'Target'})
+    recovery.checkpoint(journal)
+    # steps touching elements the file does not know about yet write checkpoints, others deltas
+    steps = [move_vert, add_face, move_vert, move_new_vert, select_face, delete_face, add_face, move_new_vert, delete_new_face, move_vert]
+    deltas = 0
+    for step in steps:
+        before = recovery.deltas
+        record_steps(rftarget, journal, recovery, [step])
+        if recovery.deltas > before: deltas += 1
+    recovery.done()
+    assert deltas >= 4
+
+    info, bme = replay_recovery(filepath)
+    assert info == {'object': 'Target'}
+    assert (len(bme.verts), len(bme.edges), len(bme.faces)) == journal.counts()
+    assert bmesh_signature(bme) == bmesh_signature(rftarget.bme)
+
+
+def test_replay_ignores_truncated_record(tmp_path, options):
+    rftarget = target_for(grid_bmesh(4, 3))
+    journal = RFMeshJournal(rftarget)
+    filepath = str(tmp_path / 'target.rfj')
+    recovery = RFTargetRecovery(filepath, {'object': 'Target'})
+    recovery.checkpoint(journal)
+    record_steps(rftarget, journal, recovery, [move_vert, add_face])
+    expected = bmesh_signature(rftarget.bme)
+    # vert was moved before, so last step is written as a (small) delta
+    record_steps(rftarget, journal, recovery, [move_vert])
+    recovery.done()
+    assert recovery.deltas == 1
+    # crash while writing last delta
+    size = (tmp_path / 'target.rfj').stat().st_size
+    with open(filepath, 'r+b') as f: f.truncate(size - 5)
+
+    _, bme = replay_recovery(filepath)
+    assert bmesh_signature(bme) == expected
+
+
+def test_target_backup(tmp_path):
+    bme = grid_bmesh(3, 3)
+    bme.faces[2].select = True
+    filepath = str(tmp_path / 'target.rfb')
+    save_target_backup(filepath, {'object': 'Target'}, bme).result()
+    info, restored = replay_recovery(filepath)
+    assert info == {'object': 'Target'}
+    assert bmesh_signature(restored) == bmesh_signature(bme)
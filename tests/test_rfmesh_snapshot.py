@@ -0,0 +1,183 @@
+'''
+Copyright (C) 2021 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from types import SimpleNamespace
+
+import pytest
+import numpy as np
+
+from retopoflow_addon.retopoflow.rfmesh import rfmesh_snapshot
+from retopoflow_addon.retopoflow.rfmesh.rfmesh_snapshot import (
+    RFTargetSnapshot,
+    capture_buffers, bmesh_from_buffers, serialize_buffers, deserialize_buffers,
+    capture_layers, restore_layers, serialize_layers, deserialize_layers,
+    capture_arrays_buffers, capture_target_layers,
+)
+from meshes import grid_bmesh, bmesh_signature, target_for
+
+
+def fake_rftarget(bme):
+    # just the attributes RFTargetSnapshot reads
+    return SimpleNamespace(
+        obj=None, unit_scaling_factor=1.0, prev_state={}, bme=bme,
+        xy_symmetry_accel=None, xz_symmetry_accel=None, yz_symmetry_accel=None,
+        get_current_arrays=lambda: None,
+    )
+
+
+def layered_bmesh():
+    ''' grid with uv, vertex group, shape key, crease, and string layers, and some flags set '''
+    bme = grid_bmesh(3, 2)
+    uv = bme.loops.layers.uv.new('UVMap')
+    deform = bme.verts.layers.deform.new('deform')
+    shape = bme.verts.layers.shape.new('Key 1')
+    crease = bme.edges.layers.crease.new('crease')
+    label = bme.faces.layers.string.new('label')
+    for (i, bmf) in enumerate(bme.faces):
+        bmf[label] = b'face %d' % i
+        bmf.material_index = i % 2
+        for (k, bml) in enumerate(bmf.loops):
+            bml[uv].uv = (i + 0.25 * k, 0.5 * k)
+            bml[uv].pin_uv = (k == 0)
+    for (i, bmv) in enumerate(bme.verts):
+        bmv[deform][0] = i / 10
+        if i % 3 == 0: bmv[deform][2] = 1.0
+        bmv[shape] = tuple(bmv.co + type(bmv.co)((0.0, 0.0, i)))
+    for (i, bme_) in enumerate(bme.edges):
+        bme_[crease] = i / 20
+        bme_.seam = (i % 4 == 0)
+    bme.faces[1].select = True
+    bme.verts[0].hide = True
+    return bme
+
+
+def layer_signature(bme):
+    ''' values of all custom data layers of bme, in element order '''
+    return {
+        (domain, kind, name): [rfmesh_snapshot.layer_value_get(kind, bmelem[layer]) for bmelem in rfmesh_snapshot.domain_elems(bme, domain)]
+        for (domain, kind, name, layer) in rfmesh_snapshot.bmesh_layers(bme)
+    }
+
+
+def assert_layers_equal(a, b):
+    la, lb = layer_signature(a), layer_signature(b)
+    assert la.keys() == lb.keys()
+    for key in la:
+        for (va, vb) in zip(la[key], lb[key]):
+            if isinstance(va, tuple) and va and isinstance(va[0], tuple):
+                # uv: ((u, v), pin)
+                assert np.allclose(va[0], vb[0]) and va[1:] == vb[1:], key
+            elif isinstance(va, (tuple, float)):
+                assert np.allclose(va, vb), key
+            else:
+                assert va == vb, key
+
+
+@pytest.mark.parametrize('compress', [True, False])
+def test_buffers_roundtrip(compress):
+    bme = layered_bmesh()
+    buffers = capture_buffers(bme)
+    restored = bmesh_from_buffers(deserialize_buffers(serialize_buffers(buffers, compress=compress), compressed=compress))
+    assert bmesh_signature(restored) == bmesh_signature(bme)
+    # element order is kept
+    assert [tuple(bmv.co) for bmv in restored.verts] == [tuple(bmv.co) for bmv in bme.verts]
+
+
+def test_layers_roundtrip():
+    bme = layered_bmesh()
+    layers = deserialize_layers(serialize_layers(capture_layers(bme)))
+    restored = bmesh_from_buffers(capture_buffers(bme))
+    assert layer_signature(restored) == {}
+    restore_layers(restored, layers)
+    assert_layers_equal(restored, bme)
+
+
+@pytest.mark.parametrize('background', [False, True])
+def test_packed_snapshot_keeps_uvs(background):
+    bme = layered_bmesh()
+    snapshot = RFTargetSnapshot(fake_rftarget(bme), live=False, background=background)
+    assert not snapshot.is_live
+    assert snapshot.nbytes > 0
+    uv = bme.loops.layers.uv['UVMap']
+    # changes after snapshot must not show up in restored bmesh
+    expected = layer_signature(bme)
+    for bmf in bme.faces:
+        for bml in bmf.loops: bml[uv].uv = (0.0, 0.0)
+    restored = snapshot.restore_bmesh()
+    assert bmesh_signature(restored) == bmesh_signature(bme)
+    assert layer_signature(restored).keys() == expected.keys()
+    uvs = [tuple(bml[restored.loops.layers.uv['UVMap']].uv) for bmf in restored.faces for bml in bmf.loops]
+    assert np.allclose(uvs, [uv for (uv, _) in expected[('loops', 'uv', 'UVMap')]])
+
+
+def test_pack_live_snapshot():
+    bme = layered_bmesh()
+    snapshot = RFTargetSnapshot.__new__(RFTargetSnapshot)
+    snapshot.compressed, snapshot.pending, snapshot.data = True, None, None
+    snapshot.rftarget = fake_rftarget(bme.copy())
+    snapshot.pack()
+    assert not snapshot.is_live
+    restored = snapshot.restore_bmesh()
+    assert bmesh_signature(restored) == bmesh_signature(bme)
+    assert_layers_equal(restored, bme)
+
+
+def test_shutdown_waits_for_packing():
+    bme = layered_bmesh()
+    snapshot = RFTargetSnapshot(fake_rftarget(bme), live=False, background=True)
+    future, _ = snapshot.pending
+    rfmesh_snapshot.shutdown_snapshot_executor()
+    assert future.done()
+    assert rfmesh_snapshot.snapshot_executor is None
+    # executor is recreated when needed again (ex: add-on registered again)
+    snapshot = RFTargetSnapshot(fake_rftarget(bme), live=False, background=True)
+    assert bmesh_signature(snapshot.restore_bmesh()) == bmesh_signature(bme)
+
+
+def test_capture_from_arrays_mirror(monkeypatch):
+    bme = layered_bmesh()
+    bme.edges[3].smooth = False
+    bme.faces[2].smooth = True
+    expected = capture_buffers(bme)
+    rftarget = target_for(bme)
+    rftarget.get_arrays()
+    # mirror is in sync, so snapshot does not go through to_mesh, and layers are read once
+    def unexpected(*args): assert False, 'to_mesh capture used'
+    monkeypatch.setattr(rfmesh_snapshot, 'capture_buffers', unexpected)
+    buffers = capture_arrays_buffers(rftarget.get_current_arrays())
+    assert [buf.dtype for buf in buffers] == [buf.dtype for buf in expected]
+    for (buf, exp) in zip(buffers, expected):
+        assert np.array_equal(buf, exp)
+    assert capture_target_layers(rftarget) is capture_target_layers(rftarget)
+
+    snapshot = RFTargetSnapshot(rftarget, live=False, background=True)
+    restored = snapshot.restore_bmesh()
+    assert bmesh_signature(restored) == bmesh_signature(bme)
+    assert_layers_equal(restored, bme)
+
+    # moving a vert keeps mirror in sync (row updated in place)
+    rftarget._wrap_bmvert(bme.verts[4]).co = type(bme.verts[4].co)((5.0, 5.0, 5.0))
+    snapshot = RFTargetSnapshot(rftarget, live=False)
+    assert bmesh_signature(snapshot.restore_bmesh()) == bmesh_signature(bme)
+
+    # untracked change: mirror is not in sync, so capture goes through to_mesh
+    rftarget._journal_untracked()
+    assert rftarget.get_current_arrays() is None
@@ -0,0 +1,53 @@
+'''
+Copyright (C) 2021 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import numpy as np
+
+from retopoflow_addon.retopoflow.rfmesh import rfmesh_sources
+from retopoflow_addon.retopoflow.rfmesh.rfmesh_sources import RFSourcesBVH
+from meshes import grid_bmesh, target_for
+
+
+class FakeBVHTree:
+    ''' records what the merged BVH is built from '''
+    @classmethod
+    def FromPolygons(cls, verts, polys):
+        bvh = cls()
+        bvh.verts, bvh.polys = verts, polys
+        return bvh
+
+
+def test_merged_bvh_maps_triangles_to_source_faces(monkeypatch):
+    monkeypatch.setattr(rfmesh_sources, 'BVHTree', FakeBVHTree)
+    rfsources = [target_for(grid_bmesh(2, 1)), target_for(grid_bmesh(1, 1))]
+    bvh = RFSourcesBVH(rfsources)
+    # quads are fan triangulated: 2 + 1 quads, 2 triangles each
+    assert len(bvh.bvh.polys) == 6
+    assert len(bvh.bvh.verts) == 6 + 4
+    assert bvh.offsets.tolist() == [0, 4, 6]
+    # second source's triangles refer to its verts, after first source's
+    assert min(min(tri) for tri in bvh.bvh.polys[4:]) == 6
+
+    assert bvh._source(3) == (rfsources[0], 1)
+    assert bvh._source(5) == (rfsources[1], 0)
+    s, local = bvh._sources(np.array([0, 3, -1, 4, 5]))
+    assert s.tolist() == [0, 0, -1, 1, 1]
+    assert local.tolist() == [0, 1, -1, 0, 0]